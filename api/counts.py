@@ -0,0 +1,106 @@
+"""
+Counts for filtered build listings that stay cheap however many rows match.
+
+Small results are counted exactly, with a COUNT(*) that stops early. Large results are served from a cache filled by
+a background exact count, or, until that finishes, estimated from the table statistics and the share of matching
+rows among the most recent builds.
+"""
+import hashlib
+import threading
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max
+
+# Results up to this size are always counted exactly
+EXACT_COUNT_LIMIT = 10000
+
+# How long an exact count of a large result is reused for, in seconds
+COUNT_CACHE_TIMEOUT = 600
+
+# Number of most recent rows the selectivity of a filter is sampled on
+ESTIMATE_SAMPLE_SIZE = 20000
+
+COUNTS_IN_PROGRESS = set()
+COUNTS_IN_PROGRESS_LOCK = threading.Lock()
+
+
+def _cache_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    return "build_count:" + hashlib.sha1(f"{sql}{params}".encode()).hexdigest()
+
+
+def _estimated_table_rows(queryset):
+    if connection.vendor == "mysql":
+        with connection.cursor() as cursor:
+            cursor.execute("select table_rows from information_schema.tables where table_schema = database() and "
+                           "table_name = %s", [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0]:
+            return row[0]
+
+    # Auto increment ids on an append only table are a good enough stand-in
+    return queryset.model.objects.aggregate(max_id=Max("pk"))["max_id"] or 0
+
+
+def _estimate(queryset):
+    table_rows = _estimated_table_rows(queryset)
+    if not queryset.query.where:
+        return table_rows
+
+    max_id = queryset.model.objects.aggregate(max_id=Max("pk"))["max_id"] or 0
+    sample_size = min(ESTIMATE_SAMPLE_SIZE, max_id)
+    if not sample_size:
+        return 0
+
+    matching = queryset.filter(pk__gt=max_id - sample_size).count()
+    return int(table_rows * matching / sample_size)
+
+
+def exact_count(queryset):
+    """
+    Counts the rows of a queryset exactly, and caches the count for count_queryset.
+    :param queryset: The filtered queryset to count.
+    :return: The number of rows.
+    """
+    queryset = queryset.order_by()
+    count = queryset.count()
+    cache.set(_cache_key(queryset), count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def _count_in_background(queryset, key):
+    def count():
+        try:
+            exact_count(queryset)
+        finally:
+            with COUNTS_IN_PROGRESS_LOCK:
+                COUNTS_IN_PROGRESS.discard(key)
+            connection.close()
+
+    with COUNTS_IN_PROGRESS_LOCK:
+        if key in COUNTS_IN_PROGRESS:
+            return
+        COUNTS_IN_PROGRESS.add(key)
+
+    threading.Thread(target=count, daemon=True).start()
+
+
+def count_queryset(queryset):
+    """
+    Counts the rows of a queryset, exactly if there are few of them.
+    :param queryset: The filtered queryset to count.
+    :return: Tuple of (count, whether the count is exact).
+    """
+    queryset = queryset.order_by()
+
+    bounded_count = queryset[:EXACT_COUNT_LIMIT + 1].count()
+    if bounded_count <= EXACT_COUNT_LIMIT:
+        return bounded_count, True
+
+    key = _cache_key(queryset)
+    cached_count = cache.get(key)
+    if cached_count is not None:
+        return cached_count, False
+
+    _count_in_background(queryset, key)
+    return max(_estimate(queryset), bounded_count), False
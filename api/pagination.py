@@ -0,0 +1,166 @@
+import base64
+import json
+from collections import OrderedDict
+from django.core.paginator import EmptyPage, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .counts import count_queryset, exact_count
+
+
+class BuildPaginator(Paginator):
+    """
+    Paginator whose count is exact for small results and cached or estimated for large ones.
+    """
+
+    @cached_property
+    def count(self):
+        count, self.count_exact = count_queryset(self.object_list)
+        return count
+
+    def validate_number(self, number):
+        """
+        Estimates may be far too low, so a page past an estimated count is only turned down once the rows have been
+        counted exactly.
+        """
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if getattr(self, "count_exact", True):
+                raise
+
+        self.__dict__["count"] = exact_count(self.object_list)
+        self.__dict__.pop("num_pages", None)
+        self.count_exact = True
+        return super().validate_number(number)
+
+
+class BuildPagination(PageNumberPagination):
+    """
+    Page number pagination for build listings, with opt-in keyset pagination.
+
+    In page number mode "count" may be an estimate for large results, "count_exact" tells whether it is.
+
+    Clients opt in with ?pagination=cursor and then follow the opaque "next" and "previous" links. Pages are read
+    with a seek on (build_time_iso, log_log_build_id) instead of an OFFSET scan and no COUNT(*) is run, so every page
+    costs the same as the first one. Results are always ordered newest first in this mode, ?ordering is ignored.
+    """
+    mode_query_param = "pagination"
+    cursor_query_param = "cursor"
+    cursor_ordering = ("-build_time_iso", "-log_log_build_id")
+    invalid_cursor_message = "Invalid cursor"
+    django_paginator_class = BuildPaginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = request.query_params.get(self.mode_query_param) == "cursor" or \
+            self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        if position is None:
+            self.reverse = False
+            rows = list(queryset.order_by(*self.cursor_ordering)[:self.page_size + 1])
+        else:
+            build_time_iso, build_id, self.reverse = position
+            if self.reverse:
+                queryset = queryset.filter(self.before(build_time_iso, build_id))
+                queryset = queryset.order_by(*[column.lstrip("-") for column in self.cursor_ordering])
+            else:
+                queryset = queryset.filter(self.after(build_time_iso, build_id))
+                queryset = queryset.order_by(*self.cursor_ordering)
+            rows = list(queryset[:self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        return self.page
+
+    @staticmethod
+    def after(build_time_iso, build_id):
+        """
+        Rows following (build_time_iso, build_id) in newest first order. MySQL sorts NULLs last when descending.
+        """
+        if build_time_iso is None:
+            return Q(build_time_iso__isnull=True, log_log_build_id__lt=build_id)
+        return Q(build_time_iso__lt=build_time_iso) | Q(build_time_iso=build_time_iso, log_log_build_id__lt=build_id) | \
+            Q(build_time_iso__isnull=True)
+
+    @staticmethod
+    def before(build_time_iso, build_id):
+        """
+        Rows preceding (build_time_iso, build_id) in newest first order.
+        """
+        if build_time_iso is None:
+            return Q(build_time_iso__isnull=False) | Q(build_time_iso__isnull=True, log_log_build_id__gt=build_id)
+        return Q(build_time_iso__gt=build_time_iso) | Q(build_time_iso=build_time_iso, log_log_build_id__gt=build_id)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            build_time_iso = parse_datetime(position["t"]) if position["t"] is not None else None
+            return build_time_iso, int(position["i"]), bool(position["r"])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, build, reverse):
+        # Pages hold Build objects, or dicts in the columnar layout
+        if isinstance(build, dict):
+            build_time_iso, build_id = build["build_time_iso"], build["log_log_build_id"]
+        else:
+            build_time_iso, build_id = build.build_time_iso, build.log_log_build_id
+
+        position = {
+            "t": build_time_iso.isoformat() if build_time_iso is not None else None,
+            "i": build_id,
+            "r": reverse,
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return Response(OrderedDict([
+                ("count", self.page.paginator.count),
+                ("count_exact", self.page.paginator.count_exact),
+                ("next", self.get_next_link()),
+                ("previous", self.get_previous_link()),
+                ("results", data),
+            ]))
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
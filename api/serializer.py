@@ -1,8 +1,26 @@
 from build.models import Build
 from rest_framework import serializers
 
+# Named sets of fields clients can ask for with ?fields=<preset>
+BUILD_FIELD_PRESETS = {
+    "summary": ["url", "build_0_id", "build_0_nvr", "dg_name", "group", "label_name", "brew_task_state",
+                "brew_faultCode", "build_time_iso", "time_iso"],
+    "triage": ["url", "build_0_id", "build_0_nvr", "dg_name", "group", "label_name", "brew_task_id",
+               "brew_task_state", "brew_faultCode", "build_time_iso", "time_iso", "dg_commit",
+               "label_io_openshift_build_commit_url", "jenkins_build_url", "jenkins_job_name", "jenkins_build_number"],
+}
+
 
 class BuildSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Build
         fields = '__all__'  # to get all columns from the table
+
+    def __init__(self, *args, **kwargs):
+        # Only serialize the given fields, all of them if None
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
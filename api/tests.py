@@ -1,3 +1,234 @@
-from django.test import TestCase
+import gzip
+import json
+from unittest import mock
+from rest_framework.test import APIClient
+from build import export
+from build.tests import LogBuildTestCase, make_build, decode_columns
+from api import counts
+from api.pagination import BuildPagination
+from api.serializer import BUILD_FIELD_PRESETS
 
-# Create your tests here.
+
+class BuildCursorPaginationTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        for build_id in range(1, 9):
+            make_build(build_id)
+        # Builds without a time and builds sharing one are ordered by id
+        make_build(9, build_time_iso=None)
+        make_build(10, build_time_iso=None)
+        make_build(11, build_time_iso=make_build(12).build_time_iso)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url).json()
+            pages.append([build["build_0_id"] for build in response["results"]])
+            url = response[link]
+        return pages
+
+    @mock.patch.object(BuildPagination, "page_size", 3)
+    def test_next_and_previous_round_trip(self):
+        newest_first = [12, 11, 8, 7, 6, 5, 4, 3, 2, 1, 10, 9]
+
+        pages = self.walk("/api/v1/builds/?pagination=cursor", "next")
+        self.assertEqual(pages, [newest_first[index:index + 3] for index in range(0, len(newest_first), 3)])
+
+        last_page = self.client.get("/api/v1/builds/?pagination=cursor").json()
+        for _ in range(len(pages) - 1):
+            last_page = self.client.get(last_page["next"]).json()
+        self.assertIsNone(last_page["next"])
+        self.assertEqual(self.walk(last_page["previous"], "previous"), pages[-2::-1])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/v1/builds/?cursor=bm90IGpzb24").status_code, 404)
+
+
+@mock.patch.object(BuildPagination, "page_size", 3)
+@mock.patch.object(counts, "EXACT_COUNT_LIMIT", 5)
+@mock.patch.object(counts, "ESTIMATE_SAMPLE_SIZE", 4)
+@mock.patch.object(counts, "_count_in_background")
+class BuildCountEstimateTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        # Only old builds match, the newest builds the estimate samples don't
+        for build_id in range(1, 21):
+            make_build(build_id, group="openshift-4.1" if build_id <= 15 else "openshift-4.16")
+
+    def test_large_count_is_estimated(self, count_in_background):
+        response = self.client.get("/api/v1/builds/?group=openshift-4.1").json()
+        self.assertEqual((response["count"], response["count_exact"]), (6, False))
+        count_in_background.assert_called_once()
+
+    def test_page_past_estimate_is_served(self, count_in_background):
+        response = self.client.get("/api/v1/builds/?group=openshift-4.1&page=4")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["count"], response.json()["count_exact"]), (15, True))
+        self.assertEqual([build["build_0_id"] for build in response.json()["results"]], [6, 5, 4])
+
+        # The exact count is cached for the next requests
+        response = self.client.get("/api/v1/builds/?group=openshift-4.1").json()
+        self.assertEqual((response["count"], response["count_exact"]), (15, False))
+
+    def test_page_past_exact_count_is_not_found(self, count_in_background):
+        self.assertEqual(self.client.get("/api/v1/builds/?group=openshift-4.1&page=6").status_code, 404)
+
+
+class BuildExportTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        make_build(1)
+        make_build(2)
+
+    def test_gzip_is_negotiated(self):
+        for accept_encoding, gzipped in (("gzip, deflate", True), ("deflate, gzip;q=0", False), ("*", True),
+                                         ("*;q=0.5, gzip;q=0", False), ("identity", False)):
+            response = self.client.get("/api/v1/builds/export/", HTTP_ACCEPT_ENCODING=accept_encoding)
+            content = b"".join(response.streaming_content)
+            self.assertEqual(response.get("Content-Encoding") == "gzip", gzipped, accept_encoding)
+            lines = (gzip.decompress(content) if gzipped else content).decode().splitlines()
+            self.assertEqual([json.loads(line)["log_log_build_id"] for line in lines], [1, 2])
+
+    @mock.patch.object(export, "pyarrow", None)
+    def test_parquet_without_pyarrow(self):
+        response = self.client.get("/api/v1/builds/export/?export_format=parquet")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], "Parquet export requires pyarrow to be installed.")
+
+
+class BuildConditionalTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        for build_id in range(1, 5):
+            make_build(build_id)
+
+    def assert_not_modified_until_new_build(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+        # A new build changes the ETag, even one made before the newest build
+        make_build(5, minutes=-60)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_builds(self):
+        self.assert_not_modified_until_new_build("/api/v1/builds/?group=openshift-4.15")
+
+    def test_build_records(self):
+        self.assert_not_modified_until_new_build("/build/build_records/?type=all&date=2024-05-20")
+
+    def test_query_params_are_part_of_etag(self):
+        etag = self.client.get("/api/v1/builds/?group=openshift-4.15")["ETag"]
+        response = self.client.get("/api/v1/builds/?group=openshift-4.15&ordering=build_0_id", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class BuildFieldsTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        make_build(1, jenkins_build_url="https://jenkins/job/1")
+        make_build(2, jenkins_build_url="https://jenkins/job/2")
+
+    def get_fields(self, query):
+        response = self.client.get(f"/api/v1/builds/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return [set(build) for build in response.json()["results"]]
+
+    def test_fields(self):
+        self.assertEqual(self.get_fields("fields=build_0_id,dg_name"), [{"build_0_id", "dg_name"}] * 2)
+        self.assertEqual(self.get_fields("fields= build_0_id , dg_name")[0], {"build_0_id", "dg_name"})
+
+        results = self.client.get("/api/v1/builds/?fields=build_0_id,jenkins_build_url").json()["results"]
+        self.assertEqual(results, [{"build_0_id": 2, "jenkins_build_url": "https://jenkins/job/2"},
+                                   {"build_0_id": 1, "jenkins_build_url": "https://jenkins/job/1"}])
+
+    def test_presets(self):
+        for preset in ("summary", "triage"):
+            self.assertEqual(self.get_fields(f"fields={preset}")[0], set(BUILD_FIELD_PRESETS[preset]))
+            self.assertEqual(self.get_fields(f"preset={preset}")[0], set(BUILD_FIELD_PRESETS[preset]))
+
+        self.assertEqual(self.get_fields("fields=summary,jenkins_build_url")[0],
+                         set(BUILD_FIELD_PRESETS["summary"]) | {"jenkins_build_url"})
+        self.assertEqual(self.get_fields("preset=summary&fields=jenkins_build_url")[0],
+                         set(BUILD_FIELD_PRESETS["summary"]) | {"jenkins_build_url"})
+
+    def test_all_fields_without_selection(self):
+        self.assertIn("jenkins_build_url", self.get_fields("")[0])
+        self.assertIn("build_0_package_id", self.get_fields("")[0])
+
+    def test_unknown_field(self):
+        response = self.client.get("/api/v1/builds/?fields=build_0_id,no_such_field,summary,other")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"fields": "Unknown fields: no_such_field, other."})
+
+    def test_unknown_preset(self):
+        response = self.client.get("/api/v1/builds/?fields=everything")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"fields": "Unknown fields: everything."})
+
+        response = self.client.get("/api/v1/builds/?preset=everything")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"preset": "Unknown preset: everything. Presets: summary, triage."})
+
+
+@mock.patch.object(BuildPagination, "page_size", 3)
+class BuildColumnarTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        for build_id in range(1, 8):
+            make_build(build_id, group="openshift-4.15" if build_id % 2 else "openshift-4.16")
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url).json()
+            pages.append(response["results"])
+            url = response["next"]
+        return pages
+
+    def test_columnar_matches_rows(self):
+        rows = self.client.get("/api/v1/builds/").json()["results"]
+        columnar = self.client.get("/api/v1/builds/?layout=columnar").json()["results"]
+
+        self.assertEqual((columnar["layout"], columnar["rows"]), ("columnar", 3))
+        self.assertEqual(columnar["dictionaries"]["group"], ["openshift-4.15", "openshift-4.16"])
+        self.assertEqual(columnar["dictionaries"]["dg_name"], ["ose-component-1", "ose-component-0",
+                                                               "ose-component-2"])
+        # The rows layout links every build by url instead of its log_log_build_id column
+        decoded = decode_columns(columnar)
+        self.assertEqual([row.pop("log_log_build_id") for row in decoded], [7, 6, 5])
+        self.assertEqual(decoded, [{name: row[name] for name in decoded[0]} for row in rows])
+        self.assertEqual(set(rows[0]) - set(decoded[0]), {"url"})
+
+    def test_fields(self):
+        columnar = self.client.get("/api/v1/builds/?layout=columnar&fields=group,build_0_id").json()["results"]
+        self.assertEqual(list(columnar["columns"]), ["log_log_build_id", "build_time_iso", "group", "build_0_id"])
+        self.assertEqual([(row["build_0_id"], row["group"]) for row in decode_columns(columnar)],
+                         [(7, "openshift-4.15"), (6, "openshift-4.16"), (5, "openshift-4.15")])
+
+    def test_pagination(self):
+        for pagination in ("", "&pagination=cursor"):
+            pages = self.walk(f"/api/v1/builds/?layout=columnar&fields=build_0_id{pagination}")
+            self.assertEqual([[row["build_0_id"] for row in decode_columns(page)] for page in pages],
+                             [[7, 6, 5], [4, 3, 2], [1]], pagination)
+            self.assertEqual([page["layout"] for page in pages], ["columnar"] * 3)
@@ -1,15 +1,22 @@
 from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, viewsets, status
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action, api_view, permission_classes, authentication_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from api.fetchers import rpms_images_fetcher
 from api.image_pipeline import pipeline_image_names
 from api.util import get_ga_version
-from build.models import Build
+from build.columnar import encode_columns
+from build.export import export_builds, accepts_gzip, ExportError, EXPORT_CONTENT_TYPES
+from build.models import Build, BuildTrigram
+from build.report_cache import conditional_builds_response
 from . import request_dispatcher
-from .serializer import BuildSerializer
+from .pagination import BuildPagination
+from .serializer import BuildSerializer, BUILD_FIELD_PRESETS
 import django_filters
 import json
 import re
@@ -22,9 +29,24 @@ from build_interface.settings import SECRET_KEY, SESSION_COOKIE_DOMAIN, JWTAuthe
 class BuildDataFilter(django_filters.FilterSet):
     stream_only = django_filters.BooleanFilter(method='filter_stream_only')
 
+    # Substring filters go through the trigram index instead of scanning every row
+    build_0_id__icontains = django_filters.CharFilter(field_name='build_0_id', method='filter_icontains')
+    build_0_nvr__icontains = django_filters.CharFilter(field_name='build_0_nvr', method='filter_icontains')
+    dg_name__icontains = django_filters.CharFilter(field_name='dg_name', method='filter_icontains')
+    brew_task_id__icontains = django_filters.CharFilter(field_name='brew_task_id', method='filter_icontains')
+    group__icontains = django_filters.CharFilter(field_name='group', method='filter_icontains')
+    dg_commit__icontains = django_filters.CharFilter(field_name='dg_commit', method='filter_icontains')
+    label_io_openshift_build_commit_id__icontains = django_filters.CharFilter(
+        field_name='label_io_openshift_build_commit_id', method='filter_icontains')
+    jenkins_build_url__icontains = django_filters.CharFilter(field_name='jenkins_build_url',
+                                                             method='filter_icontains')
+
+    def filter_icontains(self, queryset, name, value):
+        return BuildTrigram.objects.narrow_icontains(queryset, name, value)
+
     def filter_stream_only(self, queryset, name, value):
         if value:
-            return queryset.filter(build_0_nvr__endswith='.assembly.stream')
+            return queryset.filter(build_0_assembly='stream')
         return queryset
 
     class Meta:
@@ -32,6 +54,7 @@ class BuildDataFilter(django_filters.FilterSet):
         fields = {
             "build_0_id": ["icontains", "exact"],
             "build_0_nvr": ["icontains", "exact"],
+            "build_0_assembly": ["exact", "in"],
             "dg_name": ["icontains", "exact"],
             "brew_task_state": ["exact"],
             "brew_task_id": ["icontains", "exact"],
@@ -51,6 +74,7 @@ class BuildViewSet(viewsets.ReadOnlyModelViewSet):
     """
     queryset = Build.objects.all()
     serializer_class = BuildSerializer
+    pagination_class = BuildPagination
     filter_backends = [DjangoFilterBackend,
                        filters.OrderingFilter]  # add feature to filter by URL request eg: /v1/builds/?page=2
     # Explicitly specify which fields the API may be ordered against
@@ -60,6 +84,89 @@ class BuildViewSet(viewsets.ReadOnlyModelViewSet):
     # This will be used as the default ordering
     ordering = ("-build_time_iso")
 
+    # Always loaded, pagination reads them from every row
+    required_model_fields = ("log_log_build_id", "build_time_iso")
+
+    def get_requested_fields(self):
+        """
+        The fields asked for with ?fields=, a comma separated list of field names and BUILD_FIELD_PRESETS, and with
+        ?preset=, the name of a BUILD_FIELD_PRESETS entry.
+        :return: List of serializer field names, None for all of them.
+        """
+        if not self.request:
+            return None
+        requested = self.request.query_params.get("fields")
+        preset = self.request.query_params.get("preset")
+        if not requested and not preset:
+            return None
+
+        field_names = []
+        if preset:
+            if preset not in BUILD_FIELD_PRESETS:
+                raise ValidationError({"preset": f"Unknown preset: {preset}. "
+                                                 f"Presets: {', '.join(BUILD_FIELD_PRESETS)}."})
+            field_names.extend(BUILD_FIELD_PRESETS[preset])
+        for name in (requested or "").split(","):
+            if name.strip():
+                field_names.extend(BUILD_FIELD_PRESETS.get(name.strip(), [name.strip()]))
+
+        unknown = set(field_names) - set(BuildSerializer().fields)
+        if unknown:
+            raise ValidationError({"fields": f"Unknown fields: {', '.join(sorted(unknown))}."})
+        return field_names
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        field_names = self.get_requested_fields()
+        if field_names is None:
+            return queryset
+
+        model_fields = {field.name for field in Build._meta.concrete_fields}
+        return queryset.only(*self.required_model_fields, *(name for name in field_names if name in model_fields))
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        # Pollers get a 304 from a max() over the filtered builds, before the page is queried and serialized
+        builds = self.filter_queryset(self.get_queryset())
+        return conditional_builds_response("builds", request, builds, lambda: self.list_builds(builds))
+
+    def list_builds(self, builds):
+        if self.request.query_params.get("layout") != "columnar":
+            page = self.paginate_queryset(builds)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        # Columnar layout: rows are read as tuples and transposed, without Build objects or the serializer
+        model_fields = [field.name for field in Build._meta.concrete_fields]
+        field_names = self.get_requested_fields() or model_fields
+        columns = list(self.required_model_fields) + [
+            name for name in field_names if name in model_fields and name not in self.required_model_fields]
+
+        page = self.paginate_queryset(builds.values(*columns))
+        return self.get_paginated_response(encode_columns(columns, [tuple(row.values()) for row in page]))
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Streams every build matching the filters as NDJSON, CSV or Parquet, gzipped if the client accepts it.
+        """
+        export_format = request.query_params.get("export_format", "ndjson")
+        compress = accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+
+        try:
+            chunks = export_builds(self.filter_queryset(self.get_queryset()), export_format, compress)
+        except ExportError as e:
+            return Response({"status": "error", "message": str(e), "data": []}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(chunks, content_type=EXPORT_CONTENT_TYPES[export_format])
+        response["Content-Disposition"] = f'attachment; filename="builds.{export_format}"'
+        if compress:
+            response["Content-Encoding"] = "gzip"
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
 
 @api_view(["GET"])
 def pipeline_from_github_api_endpoint(request):
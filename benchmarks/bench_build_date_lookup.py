@@ -0,0 +1,131 @@
+"""
+Benchmark for the "builds on day X" lookups.
+
+Compares the old predicate, date(build_time_iso) = %s, which has to evaluate the function on every row, with the
+half open build_time_iso range BuildManager.get_all_for_a_date uses now, which seeks the (build_time_iso,
+log_log_build_id) index. The old predicate is also timed with the index in place, to show the index alone doesn't help.
+
+Runs against a synthetic log_build table in an in-memory SQLite database, no MySQL needed:
+
+    python benchmarks/bench_build_date_lookup.py --rows 5000000
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(
+    INSTALLED_APPS=["build"],
+    DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}},
+    USE_TZ=True,
+)
+django.setup()
+
+from django.db import connection  # noqa: E402
+from build.managers import DAILY_BUILD_COLUMNS  # noqa: E402
+from build.models import Build  # noqa: E402
+
+# One build a minute on average, as a busy build log
+BUILDS_PER_DAY = 1440
+
+
+def create_table(rows):
+    with connection.schema_editor() as schema_editor:
+        schema_editor.create_model(Build)
+
+    rnd = random.Random(0)
+    start = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+    columns = DAILY_BUILD_COLUMNS + ["log_log_build_id", "dg_name", "build_0_nvr"]
+    insert = "insert into log_build ({}) values ({})".format(
+        ", ".join(connection.ops.quote_name(column) for column in columns), ", ".join(["%s"] * len(columns)))
+
+    with connection.cursor() as cursor:
+        batch = []
+        for index in range(1, rows + 1):
+            build_time = start + datetime.timedelta(seconds=index * 86400 // BUILDS_PER_DAY)
+            component = f"ose-component-{rnd.randint(1, 500)}"
+            batch.append([index, rnd.choice([0, 0, 0, 1013]), 50000000 + index,
+                          connection.ops.adapt_datetimefield_value(build_time), f"openshift-4.{rnd.randint(1, 16)}",
+                          f"openshift/{component}", f"https://jenkins/job/{index}",
+                          index, component, f"{component}-container-v4.15.0-{index}.p0.assembly.stream"])
+            if len(batch) == 50000:
+                cursor.executemany(insert, batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert, batch)
+
+
+def create_index():
+    with connection.cursor() as cursor:
+        cursor.execute("create index log_build_time_idx on log_build (build_time_iso, log_log_build_id)")
+        cursor.execute("analyze")
+
+
+def function_lookup(date):
+    quote = connection.ops.quote_name
+    return Build.objects.fetch_ui_rows(
+        "select {} from log_build where date(build_time_iso) = %s".format(
+            ", ".join(quote(column) for column in DAILY_BUILD_COLUMNS)),
+        [date])
+
+
+def range_lookup(date):
+    return Build.objects.get_all_for_a_date(date)
+
+
+def query_plan(lookup_sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute("explain query plan " + lookup_sql, params)
+        return "; ".join(row[-1] for row in cursor.fetchall())
+
+
+def measure(lookup, dates, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = sum(len(lookup(date)) for date in dates)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return rows, best / len(dates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000000, help="rows in the synthetic log_build table")
+    parser.add_argument("--lookups", type=int, default=10, help="dates looked up per run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per lookup, the best one is reported")
+    args = parser.parse_args()
+
+    print(f"Creating {args.rows} synthetic builds...")
+    create_table(args.rows)
+
+    days = max(args.rows // BUILDS_PER_DAY, 1)
+    rnd = random.Random(1)
+    dates = [str(datetime.date(2018, 1, 1) + datetime.timedelta(days=rnd.randrange(days))) for _ in range(args.lookups)]
+
+    scan_rows, scan_time = measure(function_lookup, dates, args.repeat)
+    create_index()
+    indexed_scan_rows, indexed_scan_time = measure(function_lookup, dates, args.repeat)
+    seek_rows, seek_time = measure(range_lookup, dates, args.repeat)
+    assert scan_rows == indexed_scan_rows == seek_rows
+
+    print(f"date() = %s, no index   : {scan_time * 1000:.1f} ms per day")
+    print(f"date() = %s, with index : {indexed_scan_time * 1000:.1f} ms per day")
+    print(f"half open range         : {seek_time * 1000:.1f} ms per day, {seek_rows // len(dates)} rows per day")
+    print(f"speedup                 : {scan_time / seek_time:.0f}x")
+    print("date() plan             : " + query_plan(
+        "select * from log_build where date(build_time_iso) = %s", [dates[0]]))
+    print("range plan              : " + query_plan(
+        "select * from log_build where build_time_iso >= %s and build_time_iso < %s",
+        Build.objects.day_range_params(dates[0])))
+
+
+if __name__ == "__main__":
+    main()
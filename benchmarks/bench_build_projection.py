@@ -0,0 +1,119 @@
+"""
+Benchmark for the build search result builders.
+
+Compares the old way of building the UI rows, "select *" through raw() into Build objects and copying their
+attributes, with BuildManager.generate_build_data_for_ui, which fetches only the needed columns as tuples.
+
+Runs against a synthetic log_build table in an in-memory SQLite database, no MySQL needed:
+
+    python benchmarks/bench_build_projection.py --rows 200000
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(
+    INSTALLED_APPS=["build"],
+    DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}},
+    USE_TZ=True,
+)
+django.setup()
+
+from django.db import connection  # noqa: E402
+from build.models import Build  # noqa: E402
+from build.query_compiler import UI_COLUMNS  # noqa: E402
+
+STRING_COLUMNS = [field.column for field in Build._meta.concrete_fields if field.get_internal_type() == "CharField"]
+
+
+def create_table(rows):
+    with connection.schema_editor() as schema_editor:
+        schema_editor.create_model(Build)
+
+    rnd = random.Random(0)
+    start = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+    batch = []
+    for index in range(1, rows + 1):
+        # Every string column gets a realistic amount of data, as in the real table
+        build = Build(**{column: f"{column}-{rnd.getrandbits(64):x}" for column in STRING_COLUMNS})
+        build.log_log_build_id = index
+        build.build_time_iso = build.time_iso = start + datetime.timedelta(minutes=index)
+        build.brew_faultCode = rnd.choice([0, 0, 0, 1013])
+        build.brew_task_id = build.build_0_id = index
+        batch.append(build)
+        if len(batch) == 5000:
+            Build.objects.bulk_create(batch)
+            batch = []
+    Build.objects.bulk_create(batch)
+
+
+def legacy_builder(limit):
+    results = []
+    for raw_result in Build.objects.raw(f"select * from log_build order by time_iso desc limit {limit}"):
+        result = dict()
+        result["build_id"] = raw_result.build_0_id
+        result["fault_code"] = raw_result.brew_faultCode
+        result["task_id"] = raw_result.brew_task_id
+        result["iso_time"] = raw_result.build_time_iso
+        result["group"] = raw_result.group
+        result["label_name"] = raw_result.label_name
+        result["jenkins_build_url"] = raw_result.jenkins_build_url
+        result["nvr"] = raw_result.build_0_nvr
+        result["build_source"] = raw_result.build_0_source
+        result["dg_name"] = raw_result.dg_name
+        result["build_commit_url_github"] = raw_result.label_io_openshift_build_commit_url
+        result["jenkins_build_number"] = raw_result.jenkins_build_number
+        result["jenkins_job_name"] = raw_result.jenkins_job_name
+        result["build_name"] = raw_result.build_0_name
+        result["build_version"] = raw_result.build_0_version
+        result["dg_qualified_name"] = raw_result.dg_qualified_name
+        result["label_version"] = raw_result.label_version
+        result["dg_namespace"] = raw_result.dg_namespace
+        result["dg_commit"] = raw_result.dg_commit
+        results.append(result)
+    return results
+
+
+def projected_builder(limit):
+    query_string = "select {} from log_build order by time_iso desc limit {}".format(
+        ", ".join(connection.ops.quote_name(column) for column in UI_COLUMNS), limit)
+    return Build.objects.generate_build_data_for_ui(query_string)
+
+
+def measure(builder, limit, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = builder(limit)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(rows), best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="rows in the synthetic log_build table")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per builder, the best one is reported")
+    args = parser.parse_args()
+
+    print(f"Creating {args.rows} synthetic builds...")
+    create_table(args.rows)
+
+    legacy_rows, legacy_time = measure(legacy_builder, args.rows, args.repeat)
+    projected_rows, projected_time = measure(projected_builder, args.rows, args.repeat)
+
+    print(f"raw() + select *      : {legacy_rows} rows in {legacy_time:.3f}s, {legacy_rows / legacy_time:,.0f} rows/s")
+    print(f"projected cursor rows : {projected_rows} rows in {projected_time:.3f}s, {projected_rows / projected_time:,.0f} rows/s")
+    print(f"speedup               : {legacy_time / projected_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Columnar layout for large build results: one list per column instead of one dict per row, so keys aren't repeated
+on every row. Columns with few distinct values are dictionary encoded, their list holds indexes into a list of the
+distinct values.
+
+{
+    "layout": "columnar",
+    "rows": 2,
+    "columns": {"build_id": [1, 2], "group": [0, 0]},
+    "dictionaries": {"group": ["openshift-4.15"]}
+}
+"""
+
+# Columns whose values repeat a lot across builds
+DICTIONARY_COLUMNS = {"group", "dg_name", "label_name"}
+
+
+def encode_columns(names, rows, dictionary_names=DICTIONARY_COLUMNS):
+    """
+    Transposes rows into the columnar layout.
+    :param names: Column names, in the order of the values of every row.
+    :param rows: List of row tuples.
+    :param dictionary_names: Columns to dictionary encode.
+    :return: Dict in the columnar layout.
+    """
+    columns = dict(zip(names, (list(values) for values in zip(*rows)))) if rows else {name: [] for name in names}
+
+    dictionaries = {}
+    for name in names:
+        if name in dictionary_names:
+            codes = {}
+            columns[name] = [codes.setdefault(value, len(codes)) for value in columns[name]]
+            dictionaries[name] = list(codes)
+
+    return {"layout": "columnar", "rows": len(rows), "columns": columns, "dictionaries": dictionaries}
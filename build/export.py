@@ -0,0 +1,199 @@
+"""
+Streams filtered log_build rows out as NDJSON, CSV or Parquet.
+
+Rows are read in fixed size batches, each a seek on the primary key past the last row of the previous batch, so memory
+stays constant however many rows are exported and no batch costs more than the first one. mysqlclient buffers whole
+result sets client side, which is why batches are separate queries rather than one long running cursor.
+"""
+import csv
+import datetime
+import io
+import json
+import zlib
+from django.db import models
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class ExportError(Exception):
+    """Exception raised when builds cannot be exported in the requested format"""
+    pass
+
+
+EXPORT_BATCH_SIZE = 2000
+
+EXPORT_CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def iter_build_batches(queryset, columns, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Reads the rows of a queryset in primary key order, one batch at a time.
+    :param queryset: Filtered queryset of builds. Its ordering is ignored.
+    :param columns: Columns to read, log_log_build_id must be the first one.
+    :param batch_size: Number of rows per batch.
+    :return: Generator of lists of row tuples.
+    """
+    last_id = None
+    queryset = queryset.order_by("log_log_build_id")
+
+    while True:
+        batch_queryset = queryset if last_id is None else queryset.filter(log_log_build_id__gt=last_id)
+        batch = list(batch_queryset.values_list(*columns)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        last_id = batch[-1][0]
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson_chunks(batches, fields):
+    columns = [field.column for field in fields]
+    for batch in batches:
+        yield "".join(json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in batch).encode()
+
+
+def csv_chunks(batches, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([field.column for field in fields])
+
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write only file collecting what the Parquet writer has written since the last drain.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_type(field):
+    if isinstance(field, models.DateTimeField):
+        return pyarrow.timestamp("us", tz="UTC")
+    if isinstance(field, (models.AutoField, models.IntegerField)):
+        return pyarrow.int64()
+    if isinstance(field, models.FloatField):
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def parquet_chunks(batches, fields):
+    """
+    Writes one Parquet row group per batch, with column types taken from the model fields.
+    """
+    if pyarrow is None:
+        raise ExportError("Parquet export requires pyarrow to be installed.")
+
+    schema = pyarrow.schema([(field.column, _parquet_type(field)) for field in fields])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+
+    for batch in batches:
+        writer.write_table(pyarrow.Table.from_pylist([dict(zip(schema.names, row)) for row in batch], schema=schema))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+EXPORT_WRITERS = {
+    "ndjson": ndjson_chunks,
+    "csv": csv_chunks,
+    "parquet": parquet_chunks,
+}
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Whether an Accept-Encoding header lets the response be gzipped. A q-value of 0 refuses an encoding, and gzip
+    falls back to the "*" entry when it isn't listed.
+    :param accept_encoding: Value of the Accept-Encoding header, "" if there is none.
+    :return: Bool.
+    """
+    qualities = {}
+    for entry in accept_encoding.split(","):
+        coding, _, params = entry.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    if "gzip" in qualities:
+        return qualities["gzip"] > 0
+    return qualities.get("*", 0.0) > 0
+
+
+def export_builds(queryset, export_format, compress=False, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Exports the builds of a queryset.
+    :param queryset: Filtered queryset of builds.
+    :param export_format: One of EXPORT_WRITERS.
+    :param compress: Gzip the output.
+    :param batch_size: Number of rows read per query.
+    :return: Generator of byte chunks.
+    """
+    if export_format not in EXPORT_WRITERS:
+        raise ExportError(f"Invalid export format \"{export_format}\".")
+    if export_format == "parquet" and pyarrow is None:
+        raise ExportError("Parquet export requires pyarrow to be installed.")
+
+    fields = queryset.model._meta.concrete_fields
+    batches = iter_build_batches(queryset, [field.column for field in fields], batch_size)
+    chunks = EXPORT_WRITERS[export_format](batches, fields)
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,427 @@
+"""
+In-process extracts of log_build, kept in compact arrays and refreshed incrementally.
+
+An extract remembers the highest log_log_build_id it has read and only reads the builds imported since on every
+refresh, so keeping it current costs one small query a minute. Extracts live in the memory of each server process and
+answer their queries without touching the database.
+"""
+import abc
+import datetime
+import threading
+import time
+import numpy as np
+from django.db.models import Min
+from .models import Build
+
+
+class ExtractQueryError(Exception):
+    """Exception raised when an extract can't answer a query"""
+    pass
+
+
+class CodeTable:
+    """
+    Integer codes for the distinct values of a column. Every distinct value is stored once.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        return self.codes.get(value)
+
+
+def _timestamp(value):
+    return value.timestamp() if value is not None else float("nan")
+
+
+def _object_array(values):
+    # np.array would turn a list of strings into a fixed width string array
+    objects = np.empty(len(values), dtype=object)
+    objects[:] = values
+    return objects
+
+
+def _datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc) if timestamp == timestamp else None
+
+
+class IncrementalExtract(abc.ABC):
+    """
+    Base class of the extracts. Subclasses name the log_build columns they read and store the rows they get.
+    """
+    # log_build columns read, after log_log_build_id
+    columns = ()
+
+    # Builds read per query
+    batch_size = 5000
+
+    # Seconds a refresh is good for, queries refresh an older extract first
+    refresh_interval = 60
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.high_water = 0
+        self.refreshed_at = None
+
+    def since(self):
+        """
+        The earliest build_time_iso kept in the extract, None to keep everything.
+        """
+        return None
+
+    @abc.abstractmethod
+    def append(self, rows):
+        """
+        Stores builds read by a refresh.
+        :param rows: Tuples of log_log_build_id and the columns, ordered by log_log_build_id.
+        """
+
+    def trim(self, since):
+        """
+        Drops the builds older than since.
+        """
+        pass
+
+    def reset(self):
+        self.high_water = 0
+        self.refreshed_at = None
+
+    def refresh(self):
+        """
+        Reads the builds imported since the last refresh.
+        :return: Number of builds read.
+        """
+        with self.lock:
+            since = self.since()
+            builds = Build.objects.all()
+            if since is not None:
+                builds = builds.filter(build_time_iso__gte=since)
+                if not self.high_water:
+                    # Start from the first build of the window instead of scanning the whole table for it
+                    first_id = builds.aggregate(first_id=Min("log_log_build_id"))["first_id"]
+                    self.high_water = first_id - 1 if first_id else 0
+
+            read = 0
+            while True:
+                rows = list(builds.filter(log_log_build_id__gt=self.high_water).order_by("log_log_build_id")
+                            .values_list("log_log_build_id", *self.columns)[:self.batch_size])
+                if not rows:
+                    break
+                self.append(rows)
+                self.high_water = rows[-1][0]
+                read += len(rows)
+
+            if since is not None:
+                self.trim(since)
+            self.refreshed_at = time.monotonic()
+            return read
+
+    def ensure_fresh(self):
+        with self.lock:
+            if self.refreshed_at is None or time.monotonic() - self.refreshed_at > self.refresh_interval:
+                self.refresh()
+
+
+# Days of builds kept in RECENT_BUILDS
+RECENT_WINDOW_DAYS = 7
+
+
+class RecentBuildWindow(IncrementalExtract):
+    """
+    The builds of the last RECENT_WINDOW_DAYS days. Numbers and times are kept in numpy arrays, group, state,
+    fault code, component and label as integer codes into a CodeTable, so a build takes a few dozen bytes plus its
+    NVR and Jenkins URL. Queries filter, sort and count with vectorized passes over the arrays.
+    """
+    columns = ("build_time_iso", "build_0_id", "brew_task_id", "brew_task_state", "brew_faultCode", "group",
+               "dg_name", "label_name", "build_0_nvr", "jenkins_build_url")
+
+    # Columns that can be filtered on with an exact value, and counted
+    coded_columns = ("brew_task_state", "brew_faultCode", "group", "dg_name", "label_name")
+
+    orderings = ("build_time_iso", "-build_time_iso", "log_log_build_id", "-log_log_build_id")
+
+    def __init__(self, days=RECENT_WINDOW_DAYS):
+        self.days = days
+        super().__init__()
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.ids = np.empty(0, dtype=np.int64)
+        self.times = np.empty(0)
+        self.build_ids = np.empty(0, dtype=np.int64)
+        self.task_ids = np.empty(0, dtype=np.int64)
+        self.tables = {column: CodeTable() for column in self.coded_columns}
+        self.codes = {column: np.empty(0, dtype=np.int64) for column in self.coded_columns}
+        self.nvrs = np.empty(0, dtype=object)
+        self.jenkins_build_urls = np.empty(0, dtype=object)
+
+    def since(self):
+        return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=self.days)
+
+    def append(self, rows):
+        ids, times, build_ids, task_ids, nvrs, jenkins_build_urls = [], [], [], [], [], []
+        codes = {column: [] for column in self.coded_columns}
+        coded = [(self.tables[column], codes[column], self.columns.index(column) + 1) for column in self.coded_columns]
+        for row in rows:
+            ids.append(row[0])
+            times.append(_timestamp(row[1]))
+            build_ids.append(row[2] if row[2] is not None else -1)
+            task_ids.append(row[3] if row[3] is not None else -1)
+            for table, column_codes, index in coded:
+                column_codes.append(table.encode(row[index]))
+            nvrs.append(row[9])
+            jenkins_build_urls.append(row[10])
+
+        self.ids = np.concatenate((self.ids, np.array(ids, dtype=np.int64)))
+        self.times = np.concatenate((self.times, np.array(times, dtype=np.float64)))
+        self.build_ids = np.concatenate((self.build_ids, np.array(build_ids, dtype=np.int64)))
+        self.task_ids = np.concatenate((self.task_ids, np.array(task_ids, dtype=np.int64)))
+        for column in self.coded_columns:
+            self.codes[column] = np.concatenate((self.codes[column], np.array(codes[column], dtype=np.int64)))
+        self.nvrs = np.concatenate((self.nvrs, _object_array(nvrs)))
+        self.jenkins_build_urls = np.concatenate((self.jenkins_build_urls, _object_array(jenkins_build_urls)))
+
+    def trim(self, since):
+        keep = self.times >= since.timestamp()
+        if keep.all():
+            return
+
+        self.ids = self.ids[keep]
+        self.times = self.times[keep]
+        self.build_ids = self.build_ids[keep]
+        self.task_ids = self.task_ids[keep]
+        for column in self.coded_columns:
+            self.codes[column] = self.codes[column][keep]
+        self.nvrs = self.nvrs[keep]
+        self.jenkins_build_urls = self.jenkins_build_urls[keep]
+
+    def _build(self, index):
+        build_id, task_id = self.build_ids[index].item(), self.task_ids[index].item()
+        return {
+            "log_log_build_id": self.ids[index].item(),
+            "build_time_iso": _datetime(self.times[index].item()),
+            "build_0_id": build_id if build_id >= 0 else None,
+            "brew_task_id": task_id if task_id >= 0 else None,
+            **{column: self.tables[column].values[self.codes[column][index]] for column in self.coded_columns},
+            "build_0_nvr": self.nvrs[index],
+            "jenkins_build_url": self.jenkins_build_urls[index],
+        }
+
+    def _matching(self, filters, since):
+        """
+        Boolean mask of the builds matching the filters.
+        """
+        matching = np.ones(len(self.ids), dtype=bool)
+        for column, value in filters.items():
+            if column not in self.coded_columns:
+                raise ExtractQueryError(f"Can't filter on \"{column}\".")
+            code = self.tables[column].lookup(value)
+            matching &= self.codes[column] == code if code is not None else False
+
+        if since is not None:
+            matching &= self.times >= since.timestamp()
+        return matching
+
+    def query(self, filters=None, since=None, ordering="-build_time_iso", offset=0, limit=100, count_by=None):
+        """
+        Filters, sorts and counts the builds of the window.
+        :param filters: Dict of coded column to the value it must have.
+        :param since: Only builds from this aware datetime on.
+        :param ordering: One of orderings.
+        :param offset: Number of matching builds skipped.
+        :param limit: Maximum number of builds returned.
+        :param count_by: Coded column to count the matching builds by, or None.
+        :return: Dict with the total "count", the "results" page and the "counts" per value of count_by.
+        """
+        if ordering not in self.orderings:
+            raise ExtractQueryError(f"Invalid ordering \"{ordering}\".")
+        if count_by is not None and count_by not in self.coded_columns:
+            raise ExtractQueryError(f"Can't count by \"{count_by}\".")
+
+        self.ensure_fresh()
+        with self.lock:
+            matching = np.flatnonzero(self._matching(filters or {}, since))
+
+            # Stable sorts, builds with the same key stay in the order they were read in either direction
+            keys = (self.times if ordering.lstrip("-") == "build_time_iso" else self.ids)[matching]
+            order = np.argsort(-keys if ordering.startswith("-") else keys, kind="stable")
+            page = matching[order[offset:offset + limit]]
+
+            data = {
+                "window_start": self.since(),
+                "high_water": self.high_water,
+                "count": len(matching),
+                "results": [self._build(index) for index in page],
+            }
+            if count_by is not None:
+                values = self.tables[count_by].values
+                counts = np.bincount(self.codes[count_by][matching], minlength=len(values))
+                codes = np.flatnonzero(counts)
+                codes = codes[np.argsort(-counts[codes], kind="stable")]
+                data["counts"] = [{"value": values[code], "count": counts[code].item()} for code in codes]
+            return data
+
+
+RECENT_BUILDS = RecentBuildWindow()
+
+
+# Days of builds kept in BUILD_DURATIONS
+DURATION_WINDOW_DAYS = 90
+
+# Unix times above this are in milliseconds, in seconds that would be year 5138
+MILLISECOND_TIMESTAMPS_FROM = 10 ** 11
+
+
+class BuildDurationExtract(IncrementalExtract):
+    """
+    How long the builds of the last DURATION_WINDOW_DAYS days took, from build_time_unix to time_unix. Unix times
+    are accepted in seconds or milliseconds. Durations, times and codes are kept in numpy arrays and the statistics
+    are computed over them in vectorized passes, all groups at once.
+    """
+    columns = ("build_time_iso", "build_time_unix", "time_unix", "group", "dg_name")
+
+    group_columns = ("group", "dg_name")
+
+    statistics = ("count", "mean", "p50", "p90", "p95", "max", "trend_per_day")
+
+    def __init__(self, days=DURATION_WINDOW_DAYS):
+        self.days = days
+        super().__init__()
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.times = np.empty(0)
+        self.durations = np.empty(0)
+        self.tables = {column: CodeTable() for column in self.group_columns}
+        self.codes = {column: np.empty(0, dtype=np.int64) for column in self.group_columns}
+        self.results = {}
+
+    def since(self):
+        return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=self.days)
+
+    def append(self, rows):
+        times, durations, codes = [], [], {column: [] for column in self.group_columns}
+        for _, build_time_iso, build_time_unix, time_unix, group, dg_name in rows:
+            if build_time_unix is None or time_unix is None:
+                continue
+            if build_time_unix > MILLISECOND_TIMESTAMPS_FROM:
+                build_time_unix /= 1000
+            if time_unix > MILLISECOND_TIMESTAMPS_FROM:
+                time_unix /= 1000
+            if time_unix < build_time_unix:
+                continue
+
+            times.append(_timestamp(build_time_iso))
+            durations.append(time_unix - build_time_unix)
+            codes["group"].append(self.tables["group"].encode(group))
+            codes["dg_name"].append(self.tables["dg_name"].encode(dg_name))
+
+        self.times = np.concatenate((self.times, np.array(times, dtype=np.float64)))
+        self.durations = np.concatenate((self.durations, np.array(durations, dtype=np.float64)))
+        for column in self.group_columns:
+            self.codes[column] = np.concatenate((self.codes[column], np.array(codes[column], dtype=np.int64)))
+        self.results = {}
+
+    def trim(self, since):
+        keep = self.times >= since.timestamp()
+        if keep.all():
+            return
+
+        self.times = self.times[keep]
+        self.durations = self.durations[keep]
+        for column in self.group_columns:
+            self.codes[column] = self.codes[column][keep]
+        self.results = {}
+
+    @staticmethod
+    def _statistics(durations, days, starts, counts):
+        """
+        The statistics of consecutive groups of builds, each an array with one value per group.
+        :param durations: Durations, sorted within every group.
+        :param days: Build times in days, in the order of durations.
+        :param starts: Index of the first build of every group.
+        :param counts: Number of builds in every group.
+        """
+        mean = np.add.reduceat(durations, starts) / counts
+
+        # Least squares slope of the duration over the build time
+        day_offsets = days - np.repeat(np.add.reduceat(days, starts) / counts, counts)
+        spread = np.add.reduceat(day_offsets ** 2, starts)
+        covariance = np.add.reduceat(day_offsets * (durations - np.repeat(mean, counts)), starts)
+        trend = np.divide(covariance, spread, out=np.zeros_like(spread), where=spread != 0)
+
+        def percentile(percent):
+            # Nearest rank
+            return durations[starts + np.maximum(np.ceil(percent / 100 * counts).astype(np.int64) - 1, 0)]
+
+        return {"count": counts, "mean": mean, "p50": percentile(50), "p90": percentile(90), "p95": percentile(95),
+                "max": durations[starts + counts - 1], "trend_per_day": trend}
+
+    def query(self, group_by="dg_name", filters=None, since=None, order_by="p90", limit=50):
+        """
+        Duration statistics in seconds, per component or group: count, mean, percentiles and trend, the average
+        change of the duration per day over the window, by least squares.
+        :param group_by: One of group_columns, or None for the statistics of all the matching builds.
+        :param filters: Dict of group_columns to the value they must have.
+        :param since: Only builds from this aware datetime on.
+        :param order_by: One of statistics, the results are sorted on it, largest first.
+        :param limit: Maximum number of results.
+        :return: Dict with the window start and the "results".
+        """
+        filters = filters or {}
+        if group_by is not None and group_by not in self.group_columns:
+            raise ExtractQueryError(f"Can't group by \"{group_by}\".")
+        if order_by not in self.statistics:
+            raise ExtractQueryError(f"Invalid order \"{order_by}\".")
+        if set(filters) - set(self.group_columns):
+            raise ExtractQueryError("Can only filter on " + ", ".join(self.group_columns) + ".")
+
+        self.ensure_fresh()
+        with self.lock:
+            key = (group_by, tuple(sorted(filters.items())), since, order_by, limit)
+            if key not in self.results:
+                if len(self.results) >= 256:
+                    self.results = {}
+                self.results[key] = self._query(group_by, filters, since, order_by, limit)
+            return self.results[key]
+
+    def _query(self, group_by, filters, since, order_by, limit):
+        matching = np.ones(len(self.durations), dtype=bool)
+        for column, value in filters.items():
+            code = self.tables[column].lookup(value)
+            matching &= self.codes[column] == code if code is not None else False
+        if since is not None:
+            matching &= self.times >= since.timestamp()
+
+        results = []
+        durations = self.durations[matching]
+        if len(durations):
+            groups = self.codes[group_by][matching] if group_by is not None else np.zeros(len(durations), np.int64)
+
+            # Sorted by group, then duration, so every group is a run of sorted durations
+            order = np.lexsort((durations, groups))
+            durations, days, groups = durations[order], self.times[matching][order] / 86400, groups[order]
+            starts = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+            counts = np.diff(np.append(starts, len(durations)))
+            statistics = self._statistics(durations, days, starts, counts)
+
+            for group in np.argsort(-statistics[order_by], kind="stable")[:limit]:
+                result = {group_by: self.tables[group_by].values[groups[starts[group]]]} if group_by is not None else {}
+                result.update({name: values[group].item() for name, values in statistics.items()})
+                results.append(result)
+
+        return {"window_start": self.since(), "high_water": self.high_water, "results": results}
+
+
+BUILD_DURATIONS = BuildDurationExtract()
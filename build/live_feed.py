@@ -0,0 +1,241 @@
+"""
+Live feed of newly imported builds, as server-sent events.
+
+The feed is a plain ASGI app mounted in front of Django, see live_feed_app, since an event stream outlives the
+request/response cycle of a Django view. Every server process runs a single BuildTail that polls log_build for the
+builds imported since it last looked and fans them out to the queues of all the open streams, so the query load
+doesn't grow with the number of open dashboards. Each stream only gets the builds matching its own filter.
+
+Every event carries the log_log_build_id of its build as its id. Clients that reconnect with a Last-Event-ID header,
+as EventSource does, first get the matching builds they missed, up to MAX_QUEUED_BUILDS ids back. Clients further
+behind get a reset event first, telling them to reload what they show.
+"""
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import Max
+from .models import Build
+
+logger = logging.getLogger(__name__)
+
+LIVE_FEED_PATH = "/build/live/"
+
+# Columns sent for every build
+LIVE_FEED_COLUMNS = ("log_log_build_id", "group", "dg_name", "build_time_iso", "build_0_id", "build_0_nvr",
+                     "brew_task_id", "brew_task_state", "brew_faultCode", "label_name", "jenkins_build_url",
+                     "build_0_assembly")
+
+# Query params a stream may be filtered on. A param given several times matches any of its values.
+LIVE_FEED_FILTERS = ("group", "dg_name", "label_name", "brew_task_state", "brew_faultCode", "build_0_assembly")
+
+# Seconds between two looks at log_build
+POLL_INTERVAL = 5
+
+# Seconds without builds after which a comment is sent, to keep proxies from closing idle streams
+HEARTBEAT_INTERVAL = 15
+
+# Builds read per query
+BATCH_SIZE = 1000
+
+# Builds waiting for a slow client before its stream is closed. It picks up where it was when it reconnects, if it
+# isn't more than this many log_log_build_ids behind.
+MAX_QUEUED_BUILDS = 1000
+
+
+class Subscriber:
+    """
+    An open stream: its filter and the queue of the matching builds it hasn't sent yet.
+    """
+
+    def __init__(self, filters):
+        self.filters = filters
+        # Highest log_log_build_id when subscribed, later builds come through the queue
+        self.since = None
+        self.queue = asyncio.Queue(MAX_QUEUED_BUILDS)
+        self.overflowed = False
+
+    def matches(self, build):
+        return all(build[column] in values for column, values in self.filters.items())
+
+
+def _read_high_water():
+    close_old_connections()
+    return Build.objects.aggregate(max_id=Max("log_log_build_id"))["max_id"] or 0
+
+
+def _read_builds(after, up_to=None, filters=None):
+    close_old_connections()
+    builds = Build.objects.filter(log_log_build_id__gt=after)
+    if up_to is not None:
+        builds = builds.filter(log_log_build_id__lte=up_to)
+    for column, values in (filters or {}).items():
+        builds = builds.filter(**{f"{column}__in": values})
+    return list(builds.order_by("log_log_build_id").values(*LIVE_FEED_COLUMNS)[:BATCH_SIZE])
+
+
+class BuildTail:
+    """
+    Polls log_build for new builds while anyone is subscribed, and hands every build to the matching subscribers.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.high_water = 0
+        self.task = None
+        self.lock = asyncio.Lock()
+
+    async def subscribe(self, filters):
+        """
+        :return: Subscriber getting the builds imported after its "since".
+        """
+        subscriber = Subscriber(filters)
+        async with self.lock:
+            if self.task is None or self.task.done():
+                self.high_water = await sync_to_async(_read_high_water)()
+                self.task = asyncio.ensure_future(self.run())
+            subscriber.since = self.high_water
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, builds):
+        for subscriber in list(self.subscribers):
+            for build in builds:
+                if not subscriber.matches(build):
+                    continue
+                try:
+                    subscriber.queue.put_nowait(build)
+                except asyncio.QueueFull:
+                    subscriber.overflowed = True
+                    self.unsubscribe(subscriber)
+                    break
+
+    async def run(self):
+        while self.subscribers:
+            try:
+                builds = await sync_to_async(_read_builds)(self.high_water)
+            except Exception:
+                logger.exception("Reading new builds for the live feed failed")
+                builds = []
+
+            if builds:
+                self.high_water = builds[-1]["log_log_build_id"]
+                self.publish(builds)
+            if len(builds) < BATCH_SIZE:
+                await asyncio.sleep(POLL_INTERVAL)
+
+
+BUILD_TAIL = BuildTail()
+
+
+def _event(build):
+    return f"id: {build['log_log_build_id']}\nevent: build\ndata: {json.dumps(build, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def _send_text(send, text):
+    await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+
+
+def _reset_event(after):
+    # Without an id, so the id of the last build the client got stays its Last-Event-ID
+    return f"event: reset\ndata: {json.dumps({'log_log_build_id': after})}\n\n"
+
+
+async def _stream(send, subscriber, last_event_id):
+    # Builds a reconnecting client missed, up to the ones the queue gets
+    after = last_event_id
+    if after and after < subscriber.since - MAX_QUEUED_BUILDS:
+        # Too far behind to catch up build by build, the client starts over from the builds after the one in the event
+        after = subscriber.since - MAX_QUEUED_BUILDS
+        await _send_text(send, _reset_event(after))
+    while after and after < subscriber.since:
+        missed = await sync_to_async(_read_builds)(after, subscriber.since, subscriber.filters)
+        if not missed:
+            break
+        for build in missed:
+            await _send_text(send, _event(build))
+        after = missed[-1]["log_log_build_id"]
+
+    while not (subscriber.overflowed and subscriber.queue.empty()):
+        try:
+            build = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_INTERVAL)
+        except asyncio.TimeoutError:
+            await _send_text(send, ": keepalive\n\n")
+            continue
+        await _send_text(send, _event(build))
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_error(send, message):
+    await send({"type": "http.response.start", "status": 400,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body",
+                "body": json.dumps({"status": "error", "message": message, "data": []}).encode()})
+
+
+async def live_feed(scope, receive, send):
+    """
+    Streams the builds imported from now on that match the filter in the query params, see LIVE_FEED_FILTERS.
+    """
+    query_params = parse_qs(scope["query_string"].decode("latin-1"))
+    unknown = set(query_params) - set(LIVE_FEED_FILTERS)
+    if unknown:
+        await _send_error(send, f"Unknown filters: {', '.join(sorted(unknown))}.")
+        return
+    try:
+        # Values are converted to the types of their columns, so a bad one is refused before the stream starts
+        filters = {column: {Build._meta.get_field(column).to_python(value) for value in values}
+                   for column, values in query_params.items()}
+    except ValidationError:
+        await _send_error(send, "Invalid filter value.")
+        return
+
+    headers = dict(scope["headers"])
+    try:
+        last_event_id = int(headers.get(b"last-event-id", b"0").decode("latin-1") or 0)
+    except ValueError:
+        await _send_error(send, "Invalid Last-Event-ID.")
+        return
+
+    subscriber = await BUILD_TAIL.subscribe(filters)
+    stream = disconnect = None
+    try:
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                                (b"x-accel-buffering", b"no")]})
+        stream = asyncio.ensure_future(_stream(send, subscriber, last_event_id))
+        disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+        await asyncio.wait({stream, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if stream.done():
+            stream.result()
+            await send({"type": "http.response.body", "body": b""})
+    finally:
+        BUILD_TAIL.unsubscribe(subscriber)
+        for task in (stream, disconnect):
+            if task is not None:
+                task.cancel()
+
+
+def live_feed_app(application):
+    """
+    Wraps an ASGI application, serving the live feed at LIVE_FEED_PATH and handing everything else to it.
+    """
+
+    async def app(scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == LIVE_FEED_PATH and scope["method"] == "GET":
+            await live_feed(scope, receive, send)
+        else:
+            await application(scope, receive, send)
+
+    return app
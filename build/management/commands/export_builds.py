@@ -0,0 +1,43 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from api.views import BuildDataFilter
+from build.export import export_builds, ExportError, EXPORT_BATCH_SIZE, EXPORT_WRITERS
+from build.models import Build
+
+
+class Command(BaseCommand):
+    help = "Exports the build records matching the given filters as NDJSON, CSV or Parquet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", dest="export_format", choices=list(EXPORT_WRITERS), default="ndjson")
+        parser.add_argument("--output", help="File to write to, standard output if omitted.")
+        parser.add_argument("--filter", action="append", default=[], metavar="NAME=VALUE",
+                            help="A filter of /api/v1/builds, eg: group=openshift-4.15. May be repeated.")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output.")
+        parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        filters = QueryDict(mutable=True)
+        for build_filter in options["filter"]:
+            name, separator, value = build_filter.partition("=")
+            if not separator:
+                raise CommandError(f"Invalid filter \"{build_filter}\", expected NAME=VALUE.")
+            filters.appendlist(name, value)
+
+        filterset = BuildDataFilter(data=filters, queryset=Build.objects.all())
+        if not filterset.is_valid():
+            raise CommandError(f"Invalid filters: {filterset.errors.as_json()}")
+
+        try:
+            chunks = export_builds(filterset.qs, options["export_format"], options["gzip"], options["batch_size"])
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options["output"]:
+                output.close()
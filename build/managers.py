@@ -1,9 +1,20 @@
-from django.db import models
+import datetime
+from django.db import models, connection, transaction
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Sum
+from django.db.models.functions import Greatest, Least
+from django.db.models.functions import TruncDate
+from django.utils.dateparse import parse_date
+from .columnar import encode_columns
 
 
 class DailyBuildReportManager(models.Manager):
 
     def handle_request_for_daily_report_view_get(self, request_type, date=None):
+        from .models import DailyBuildRollup
+
+        # Read the precomputed rollups once they have been built, the live summary view until then
+        if request_type in ("overview", "fordate", "datewise_fault_code_stats") and DailyBuildRollup.objects.is_built():
+            return DailyBuildRollup.objects.handle_request_for_daily_report_view_get(request_type, date)
 
         if request_type == "overview":
             daily_stats = self.raw("select 1 as log_build_daily_summary_id, date,sum( if(fault_code = 0, count,0)) as success, sum( if(fault_code != 0 OR fault_code is NULL, count, 0)) as failure, sum(count) as total, (sum( if(fault_code = 0, count,0))/sum(count))*100 as success_rate  from log_build_daily_summary group by 2 order by 2 desc")
@@ -73,68 +84,611 @@ class DailyBuildReportManager(models.Manager):
             return {"message": "Invalid request type."}
 
 
-class BuildManager(models.Manager):
-
-    def generate_build_data_for_ui(self, query_string):
-        raw_results = self.raw(query_string)
-
-        results = []
-
-        for raw_result in raw_results:
-            result = dict()
-            result["build_id"] = raw_result.build_0_id
-            result["fault_code"] = raw_result.brew_faultCode
-            result["task_id"] = raw_result.brew_task_id
-            result["iso_time"] = raw_result.build_time_iso
-            result["group"] = raw_result.group
-            result["label_name"] = raw_result.label_name
-            result["jenkins_build_url"] = raw_result.jenkins_build_url
-            result["nvr"] = raw_result.build_0_nvr
-            result["build_source"] = raw_result.build_0_source
-            result["dg_name"] = raw_result.dg_name
-            result["build_commit_url_github"] = raw_result.label_io_openshift_build_commit_url
-            result["jenkins_build_url"] = raw_result.jenkins_build_url
-            result["jenkins_build_number"] = raw_result.jenkins_build_number
-            result["jenkins_job_name"] = raw_result.jenkins_job_name
-            result["build_name"] = raw_result.build_0_name
-            result["build_version"] = raw_result.build_0_version
-            result["dg_qualified_name"] = raw_result.dg_qualified_name
-            result["label_version"] = raw_result.label_version
-            result["dg_namespace"] = raw_result.dg_namespace
-            result["dg_commit"] = raw_result.dg_commit
-            results.append(result)
-
-        return results
+# log_build column -> key in the rows returned to the UI, in the order the keys appear in each row
+BUILD_UI_COLUMNS = {
+    "build_0_id": "build_id",
+    "brew_faultCode": "fault_code",
+    "brew_task_id": "task_id",
+    "build_time_iso": "iso_time",
+    "group": "group",
+    "label_name": "label_name",
+    "jenkins_build_url": "jenkins_build_url",
+    "build_0_nvr": "nvr",
+    "build_0_source": "build_source",
+    "dg_name": "dg_name",
+    "label_io_openshift_build_commit_url": "build_commit_url_github",
+    "jenkins_build_number": "jenkins_build_number",
+    "jenkins_job_name": "jenkins_job_name",
+    "build_0_name": "build_name",
+    "build_0_version": "build_version",
+    "dg_qualified_name": "dg_qualified_name",
+    "label_version": "label_version",
+    "dg_namespace": "dg_namespace",
+    "dg_commit": "dg_commit",
+}
+
+# The subset of BUILD_UI_COLUMNS shown in the daily build records
+DAILY_BUILD_COLUMNS = ["build_0_id", "brew_faultCode", "brew_task_id", "build_time_iso", "group", "label_name",
+                       "jenkins_build_url"]
+
+
+class BuildQuerySet(models.QuerySet):
+    """
+    Leaves the columns the database generates out of every insert and update, MySQL refuses values for them.
+    """
+
+    def _insert(self, objs, fields, *args, **kwargs):
+        fields = [field for field in fields if not getattr(field, "generated", False)]
+        return super()._insert(objs, fields, *args, **kwargs)
+
+    def _update(self, values):
+        return super()._update([value for value in values if not getattr(value[0], "generated", False)])
+
+
+class BuildManager(models.Manager.from_queryset(BuildQuerySet)):
+
+    def fetch_ui_rows(self, query_string, params=None):
+        """
+        Runs a query over log_build and returns its rows keyed the way the UI expects, straight from the cursor
+        without instantiating Build objects. Every selected column must be one of BUILD_UI_COLUMNS.
+        :param query_string: SQL with %s placeholders.
+        :param params: Values for the placeholders.
+        :return: List of dicts.
+        """
+        keys, rows = self._fetch_ui_tuples(query_string, params)
+        return [dict(zip(keys, row)) for row in rows]
+
+    def fetch_ui_columns(self, query_string, params=None):
+        """
+        Same as fetch_ui_rows, in the columnar layout of build.columnar.
+        :return: Dict with one list per UI key.
+        """
+        keys, rows = self._fetch_ui_tuples(query_string, params)
+        return encode_columns(keys, rows)
+
+    def _fetch_ui_tuples(self, query_string, params):
+        with connection.cursor() as cursor:
+            cursor.execute(query_string, params)
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+
+        keys = [BUILD_UI_COLUMNS[column] for column in columns]
+        datetime_indexes = [index for index, column in enumerate(columns)
+                            if isinstance(self.model._meta.get_field(column), models.DateTimeField)]
+
+        if datetime_indexes:
+            converted = []
+            for row in rows:
+                row = list(row)
+                for index in datetime_indexes:
+                    row[index] = connection.ops.convert_datetimefield_value(row[index], None, connection)
+                converted.append(row)
+            rows = converted
+        return keys, rows
+
+    def generate_build_data_for_ui(self, query_string, params=None):
+        return self.fetch_ui_rows(query_string, params)
+
+    @staticmethod
+    def day_range_params(date):
+        """
+        The half open [start, end) range of build_time_iso values on a date, as query params. A range, unlike
+        date(build_time_iso), can seek the build_time_iso index.
+        :param date: YYYY-MM-DD string.
+        :return: List of the two bounds, None if date isn't a valid date.
+        """
+        day = parse_report_date(date)
+        if day is None:
+            return None
+        start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+        return [connection.ops.adapt_datetimefield_value(start),
+                connection.ops.adapt_datetimefield_value(start + datetime.timedelta(days=1))]
+
+    def on_date(self, day):
+        """
+        The builds of a date, filtered on a half open build_time_iso range.
+        :param day: datetime.date.
+        :return: Queryset.
+        """
+        start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+        return self.filter(build_time_iso__gte=start, build_time_iso__lt=start + datetime.timedelta(days=1))
 
     def get_all_for_a_date_for_a_column(self, column_name, column_value, date):
-        raw_results = self.raw(
-            "select log_log_build_id, build_0_id, brew_faultCode, brew_task_id, build_time_iso, `group`, label_name, jenkins_build_url from log_build where date(build_time_iso) = \"{}\" and {}=\"{}\"".format(
-                date, column_name, column_value))
-        results = []
-        for raw_result in raw_results:
-            result = dict()
-            result["build_id"] = raw_result.build_0_id
-            result["fault_code"] = raw_result.brew_faultCode
-            result["task_id"] = raw_result.brew_task_id
-            result["iso_time"] = raw_result.build_time_iso
-            result["group"] = raw_result.group
-            result["label_name"] = raw_result.label_name
-            result["jenkins_build_url"] = raw_result.jenkins_build_url
-            results.append(result)
-        return results
-
-    def get_all_for_a_date(self,date):
-
-        raw_results = self.raw("select log_log_build_id, build_0_id, brew_faultCode, brew_task_id, build_time_iso, `group`, label_name jenkins_build_url from log_build where date(build_time_iso) = \"{}\"".format(date))
-        results = []
-        for raw_result in raw_results:
-            result = dict()
-            result["build_id"] = raw_result.build_0_id
-            result["fault_code"] = raw_result.brew_faultCode
-            result["task_id"] = raw_result.brew_task_id
-            result["iso_time"] = raw_result.build_time_iso
-            result["group"] = raw_result.group
-            result["label_name"] = raw_result.label_name
-            result["jenkins_build_url"] = raw_result.jenkins_build_url
-            results.append(result)
-        return results
+        """
+        The caller is responsible for column_name being a log_build column, it can't be bound as a parameter.
+        """
+        day_range = self.day_range_params(date)
+        if day_range is None:
+            return []
+
+        quote = connection.ops.quote_name
+        return self.fetch_ui_rows(
+            "select {} from log_build where build_time_iso >= %s and build_time_iso < %s and {} = %s".format(
+                ", ".join(quote(column) for column in DAILY_BUILD_COLUMNS), quote(column_name)),
+            day_range + [column_value])
+
+    def get_all_for_a_date(self, date):
+        day_range = self.day_range_params(date)
+        if day_range is None:
+            return []
+
+        quote = connection.ops.quote_name
+        return self.fetch_ui_rows(
+            "select {} from log_build where build_time_iso >= %s and build_time_iso < %s".format(
+                ", ".join(quote(column) for column in DAILY_BUILD_COLUMNS)),
+            day_range)
+
+
+class BuildWatermarkManager(models.Manager):
+
+    def get_high_water(self, name):
+        watermark = self.filter(name=name).first()
+        return watermark.log_log_build_id if watermark else 0
+
+    def set_high_water(self, name, build_id):
+        self.update_or_create(name=name, defaults={"log_log_build_id": build_id})
+
+    def lock_high_water(self, name):
+        """
+        This method locks a watermark until the end of the current transaction, so refreshes that overlap, eg: a
+        slow import cron run and the next one, don't add the same builds twice.
+        :param name: Name of the watermark.
+        :return: The high water mark, as committed by the refreshes before.
+        """
+        watermark, _ = self.select_for_update().get_or_create(name=name)
+        return watermark.log_log_build_id
+
+
+class BuildDateVersionManager(models.Manager):
+
+    def get_version(self, date):
+        date_version = self.filter(date=date).first()
+        return date_version.version if date_version else 0
+
+    def bump(self, dates):
+        """
+        This method marks the builds of the given dates as changed, invalidating what was cached for them.
+        :param dates: Dates whose builds were imported or re-imported.
+        """
+        for date in dates:
+            if date is not None and not self.filter(date=date).update(version=F("version") + 1):
+                self.create(date=date, version=1)
+
+
+# Columns covered by the trigram index, with the code stored for them. Codes must never be reused.
+SEARCH_INDEX_COLUMNS = {
+    "build_0_id": 1,
+    "build_0_nvr": 2,
+    "dg_name": 3,
+    "brew_task_id": 4,
+    "group": 5,
+    "dg_commit": 6,
+    "label_io_openshift_build_commit_id": 7,
+    "jenkins_build_url": 8,
+}
+SEARCH_INDEX_WATERMARK = "search_index"
+
+# Above this many builds with the rarest trigram of a value the index doesn't narrow the search enough to be worth it
+SEARCH_INDEX_MAX_CANDIDATES = 5000
+
+
+def trigrams(value):
+    value = str(value).lower()
+    return {value[index:index + 3] for index in range(len(value) - 2)}
+
+
+class BuildTrigramManager(models.Manager):
+
+    def index_new_builds(self, batch_size=2000):
+        """
+        This method adds the builds imported since the last run to the trigram index. Called by the import cron
+        through POST /build/refresh/, see cron_jobs/data_import.yml.
+        :param batch_size: Number of builds read and indexed per transaction.
+        :return: Number of builds indexed.
+        """
+        from .models import Build, BuildWatermark
+
+        high_water = BuildWatermark.objects.get_high_water(SEARCH_INDEX_WATERMARK)
+        indexed = 0
+
+        while True:
+            builds = list(Build.objects.filter(log_log_build_id__gt=high_water).order_by("log_log_build_id")
+                          .values_list("log_log_build_id", *SEARCH_INDEX_COLUMNS)[:batch_size])
+            if not builds:
+                return indexed
+
+            entries = []
+            for build in builds:
+                for column_code, value in zip(SEARCH_INDEX_COLUMNS.values(), build[1:]):
+                    if value is not None:
+                        entries.extend(self.model(column=column_code, trigram=trigram, log_log_build_id=build[0])
+                                       for trigram in trigrams(value))
+
+            with transaction.atomic():
+                current = BuildWatermark.objects.lock_high_water(SEARCH_INDEX_WATERMARK)
+                if current == high_water:
+                    self.bulk_create(entries, batch_size=5000)
+                    BuildWatermark.objects.set_high_water(SEARCH_INDEX_WATERMARK, builds[-1][0])
+                    indexed += len(builds)
+                    current = builds[-1][0]
+            # Another refresh may have indexed the batch first, carry on from where it stopped
+            high_water = current
+
+    def narrow_icontains(self, queryset, column, value):
+        """
+        This method applies a case insensitive substring filter, narrowed down with the trigram index first.
+        The candidates are the builds with the rarest trigram of the value, checked for the others with index
+        lookups, all in the same query. Builds imported after the index was last refreshed are still matched,
+        through the plain filter.
+        :param queryset: The queryset to filter.
+        :param column: A column of SEARCH_INDEX_COLUMNS.
+        :param value: The substring to look for.
+        :return: The filtered queryset.
+        """
+        from .models import BuildWatermark
+
+        queryset = queryset.filter(**{f"{column}__icontains": value})
+
+        value_trigrams = trigrams(value)
+        high_water = BuildWatermark.objects.get_high_water(SEARCH_INDEX_WATERMARK)
+        if not value_trigrams or not high_water:
+            return queryset
+
+        # Counted up to the limit, so a common trigram costs a bounded index range
+        entries = self.filter(column=SEARCH_INDEX_COLUMNS[column])
+        counts = {trigram: entries.filter(trigram=trigram)[:SEARCH_INDEX_MAX_CANDIDATES + 1].count()
+                  for trigram in value_trigrams}
+        rarest = min(counts, key=counts.get)
+        if counts[rarest] > SEARCH_INDEX_MAX_CANDIDATES:
+            return queryset
+
+        candidates = entries.filter(trigram=rarest)
+        for trigram in value_trigrams - {rarest}:
+            candidates = candidates.filter(
+                Exists(entries.filter(trigram=trigram, log_log_build_id=OuterRef("log_log_build_id"))))
+        return queryset.filter(Q(log_log_build_id__in=candidates.values("log_log_build_id")) |
+                               Q(log_log_build_id__gt=high_water))
+
+
+def parse_report_date(value):
+    """
+    Parses a YYYY-MM-DD date query param, None if it isn't a valid date.
+    """
+    try:
+        return parse_date(value or "")
+    except ValueError:
+        return None
+
+
+DAILY_ROLLUP_WATERMARK = "daily_rollup"
+DAILY_ROLLUP_BATCH_SIZE = 20000
+
+
+def _reimported_dates(builds, high_water, counted, countable=lambda builds: builds):
+    """
+    The dates of a batch of new builds whose earlier builds no longer match what was counted for them: they were
+    deleted and imported again, with new ids.
+    :param builds: The batch, builds above high_water.
+    :param high_water: The highest build id counted so far.
+    :param counted: Function returning the number of builds counted for a date.
+    :param countable: Function narrowing the builds of a date down to the ones counted.
+    :return: Set of dates.
+    """
+    from .models import Build
+
+    dates = builds.order_by().annotate(day=TruncDate("build_time_iso")).values_list("day", flat=True).distinct()
+    return {date for date in dates if date is not None and counted(date) != countable(
+        Build.objects.on_date(date).filter(log_log_build_id__lte=high_water)).count()}
+
+
+def _add_counts(model, keys, counts):
+    if not model.objects.filter(**keys).update(**{name: F(name) + value for name, value in counts.items()}):
+        model.objects.create(**keys, **counts)
+
+
+class DailyBuildRollupManager(models.Manager):
+
+    def is_built(self):
+        from .models import BuildWatermark
+        return BuildWatermark.objects.get_high_water(DAILY_ROLLUP_WATERMARK) > 0
+
+    def closed_before(self):
+        """
+        The first date the rollups may still be missing builds of: the date of the last build they have counted.
+        :return: Date, None until the rollups are built.
+        """
+        from .models import Build, BuildWatermark
+
+        high_water = BuildWatermark.objects.get_high_water(DAILY_ROLLUP_WATERMARK)
+        build_time = Build.objects.filter(log_log_build_id__lte=high_water, build_time_iso__isnull=False) \
+            .order_by("-log_log_build_id").values_list("build_time_iso", flat=True).first()
+        return build_time.date() if build_time else None
+
+    def refresh(self, batch_size=DAILY_ROLLUP_BATCH_SIZE):
+        """
+        This method adds the builds imported since the last refresh to the daily rollups, one range of log_build
+        ids at a time. Called by the import cron through POST /build/refresh/, see cron_jobs/data_import.yml.
+        Dates whose builds were deleted and imported again are recounted from scratch, see _reimported_dates.
+        :param batch_size: Width of the log_build id range aggregated per transaction.
+        :return: List of the dates whose counts changed.
+        """
+        from .models import Build, BuildWatermark, BuildDateVersion
+
+        high_water = BuildWatermark.objects.get_high_water(DAILY_ROLLUP_WATERMARK)
+        max_id = Build.objects.aggregate(max_id=Max("log_log_build_id"))["max_id"] or 0
+        dates = set()
+
+        while high_water < max_id:
+            upper = min(high_water + batch_size, max_id)
+            builds = Build.objects.filter(log_log_build_id__gt=high_water, log_log_build_id__lte=upper)
+            with transaction.atomic():
+                current = BuildWatermark.objects.lock_high_water(DAILY_ROLLUP_WATERMARK)
+                if current == high_water:
+                    reimported = _reimported_dates(builds, high_water, self._counted)
+                    batch_dates = self._add_builds(builds)
+                    for date in reimported:
+                        self._rebuild_date(date, upper)
+                    BuildDateVersion.objects.bump(batch_dates)
+                    BuildWatermark.objects.set_high_water(DAILY_ROLLUP_WATERMARK, upper)
+                    dates.update(batch_dates)
+                    current = upper
+            # Another refresh may have counted the range first, carry on from where it stopped
+            high_water = current
+
+        return sorted(dates, key=str)
+
+    def rebuild_date(self, date):
+        """
+        This method recomputes the rollups of a date from scratch, for dates whose builds were deleted and imported
+        again. Refreshes detect such dates on their own, this is for dates re-imported without new builds. Builds
+        above the rollup watermark are left to the next refresh.
+        :param date: The re-imported date.
+        """
+        from .models import BuildWatermark, BuildDateVersion
+
+        with transaction.atomic():
+            self._rebuild_date(date, BuildWatermark.objects.lock_high_water(DAILY_ROLLUP_WATERMARK))
+            BuildDateVersion.objects.bump([date])
+
+    def _rebuild_date(self, date, up_to):
+        from .models import Build, DailyBuildLabelRollup, DailyBuildFaultCodeRollup
+
+        for model in (self.model, DailyBuildLabelRollup, DailyBuildFaultCodeRollup):
+            model.objects.filter(date=date).delete()
+        self._add_builds(Build.objects.on_date(date).filter(log_log_build_id__lte=up_to))
+
+    def _counted(self, date):
+        return self.filter(date=date).aggregate(total=Sum("total"))["total"] or 0
+
+    def _add_builds(self, builds):
+        from .models import DailyBuildLabelRollup, DailyBuildFaultCodeRollup
+
+        builds = builds.order_by().annotate(day=TruncDate("build_time_iso"))
+        label_counts = builds.values("day", "label_name").annotate(
+            success=Count("log_log_build_id", filter=Q(brew_faultCode=0)), total=Count("log_log_build_id"))
+        fault_code_counts = builds.values("day", "brew_faultCode").annotate(count=Count("log_log_build_id"))
+
+        day_counts = {}
+        for row in label_counts:
+            counts = {"success": row["success"], "failure": row["total"] - row["success"], "total": row["total"]}
+            _add_counts(DailyBuildLabelRollup, {"date": row["day"], "label_name": row["label_name"]}, counts)
+            day_total = day_counts.setdefault(row["day"], {"success": 0, "failure": 0, "total": 0})
+            for name, value in counts.items():
+                day_total[name] += value
+
+        for day, counts in day_counts.items():
+            _add_counts(self.model, {"date": day}, counts)
+
+        for row in fault_code_counts:
+            _add_counts(DailyBuildFaultCodeRollup, {"date": row["day"], "fault_code": row["brew_faultCode"]},
+                        {"count": row["count"]})
+
+        return list(day_counts)
+
+    def handle_request_for_daily_report_view_get(self, request_type, date=None):
+        """
+        Same responses as DailyBuildReportManager.handle_request_for_daily_report_view_get, read from the rollups.
+        """
+        from .models import DailyBuildLabelRollup, DailyBuildFaultCodeRollup
+
+        if request_type == "overview":
+            return [{"date": daily_stat.date,
+                     "success": daily_stat.success,
+                     "failure": daily_stat.failure,
+                     "total": daily_stat.total,
+                     "success_rate": daily_stat.success / daily_stat.total * 100}
+                    for daily_stat in self.filter(total__gt=0).order_by("-date")]
+
+        if date is None:
+            return []
+        date = parse_report_date(date)
+
+        if request_type == "fordate":
+            date_wise_stats = DailyBuildLabelRollup.objects.filter(date=date, total__gt=0) if date else []
+            date_wise_stats_filtered = sorted(
+                ({"date": date_wise_stat.date,
+                  "success": date_wise_stat.success,
+                  "failure": date_wise_stat.failure,
+                  "total": date_wise_stat.total,
+                  "success_rate": date_wise_stat.success / date_wise_stat.total * 100,
+                  "label_name": date_wise_stat.label_name} for date_wise_stat in date_wise_stats),
+                key=lambda d_stat: (d_stat["success_rate"], -d_stat["total"]))
+
+            total = sum(d_stat["total"] for d_stat in date_wise_stats_filtered)
+            success = sum(d_stat["success"] for d_stat in date_wise_stats_filtered)
+            return {
+                "total": total,
+                "success": success,
+                "failure": total - success,
+                "success_rate": (success / total) * 100 if total else 100,
+                "table_data": date_wise_stats_filtered
+            }
+
+        # The summary view query compared fault codes to "", which a fault code of 0 equals in MySQL, so it has always
+        # been reported as "unknown" and the others as strings
+        fault_code_wise_stats = DailyBuildFaultCodeRollup.objects.filter(date=date, count__gt=0) if date else []
+        fault_code_wise_stats_filtered = []
+        for fault_code_wise_stat in fault_code_wise_stats:
+            fault_code = fault_code_wise_stat.fault_code
+            d_stat = {"fault_code": "unknown" if fault_code == 0 else None if fault_code is None else str(fault_code),
+                      "count": fault_code_wise_stat.count}
+            fault_code_wise_stats_filtered.append(d_stat)
+
+        return fault_code_wise_stats_filtered
+
+
+FAILURE_STAT_WATERMARK = "failure_stat"
+
+
+class BuildFailureStatManager(models.Manager):
+
+    def refresh(self, batch_size=DAILY_ROLLUP_BATCH_SIZE):
+        """
+        This method adds the failed builds imported since the last refresh to the failure stats, one range of
+        log_build ids at a time. Called by the import cron through POST /build/refresh/, see
+        cron_jobs/data_import.yml. Cached failure reports are keyed by the watermark, a refresh invalidates them.
+        Dates whose builds were deleted and imported again are recounted from scratch, see _reimported_dates.
+        :param batch_size: Width of the log_build id range aggregated per transaction.
+        :return: Number of failure stat rows added to.
+        """
+        from .models import Build, BuildWatermark
+
+        high_water = BuildWatermark.objects.get_high_water(FAILURE_STAT_WATERMARK)
+        max_id = Build.objects.aggregate(max_id=Max("log_log_build_id"))["max_id"] or 0
+        updated = 0
+
+        while high_water < max_id:
+            upper = min(high_water + batch_size, max_id)
+            builds = Build.objects.filter(log_log_build_id__gt=high_water, log_log_build_id__lte=upper)
+            with transaction.atomic():
+                current = BuildWatermark.objects.lock_high_water(FAILURE_STAT_WATERMARK)
+                if current == high_water:
+                    reimported = _reimported_dates(builds, high_water, self._counted,
+                                                   lambda builds: builds.exclude(brew_faultCode=0))
+                    updated += self._add_builds(builds)
+                    for date in reimported:
+                        self._rebuild_date(date, upper)
+                    BuildWatermark.objects.set_high_water(FAILURE_STAT_WATERMARK, upper)
+                    current = upper
+            # Another refresh may have counted the range first, carry on from where it stopped
+            high_water = current
+
+        return updated
+
+    def rebuild_date(self, date):
+        """
+        This method recomputes the failure stats of a date from scratch, for dates whose builds were deleted and
+        imported again. Refreshes detect such dates on their own, this is for dates re-imported without new builds.
+        :param date: The re-imported date.
+        """
+        from .models import BuildWatermark
+
+        with transaction.atomic():
+            self._rebuild_date(date, BuildWatermark.objects.lock_high_water(FAILURE_STAT_WATERMARK))
+
+    def _rebuild_date(self, date, up_to):
+        from .models import Build
+
+        self.filter(date=date).delete()
+        self._add_builds(Build.objects.on_date(date).filter(log_log_build_id__lte=up_to))
+
+    def _counted(self, date):
+        return self.filter(date=date).aggregate(count=Sum("count"))["count"] or 0
+
+    def _add_builds(self, builds):
+        failures = builds.order_by().exclude(brew_faultCode=0) \
+            .annotate(day=TruncDate("build_time_iso")) \
+            .values("day", "dg_name", "brew_faultCode") \
+            .annotate(count=Count("log_log_build_id"), first_seen=Min("build_time_iso"),
+                      last_seen=Max("build_time_iso"))
+
+        updated = 0
+        for failure in failures:
+            keys = {"date": failure["day"], "dg_name": failure["dg_name"], "fault_code": failure["brew_faultCode"]}
+            if not self.filter(**keys).update(count=F("count") + failure["count"],
+                                              first_seen=Least("first_seen", failure["first_seen"]),
+                                              last_seen=Greatest("last_seen", failure["last_seen"])):
+                self.create(**keys, count=failure["count"], first_seen=failure["first_seen"],
+                            last_seen=failure["last_seen"])
+            updated += 1
+        return updated
+
+    def top_failures(self, start, end, limit=10):
+        """
+        The most frequent failures between two dates.
+        :param start: First date of the window.
+        :param end: Last date of the window, included.
+        :param limit: Number of results per list.
+        :return: Dict of the top components, fault codes and (component, fault code) pairs, with their count and the
+        first and last time they were seen.
+        """
+        stats = self.filter(date__gte=start, date__lte=end).order_by()
+
+        def top(*columns):
+            return list(stats.values(*columns)
+                        .annotate(failures=Sum("count"), first_seen=Min("first_seen"), last_seen=Max("last_seen"))
+                        .order_by("-failures", *columns)[:limit])
+
+        return {"start": start, "end": end, "components": top("dg_name"), "fault_codes": top("fault_code"),
+                "pairs": top("dg_name", "fault_code")}
+
+
+LATEST_BUILD_WATERMARK = "latest_build"
+
+# log_build columns copied into log_build_latest
+LATEST_BUILD_COLUMNS = ("log_log_build_id", "group", "dg_name", "build_time_iso", "build_0_id", "build_0_nvr",
+                        "brew_task_id", "brew_task_state", "brew_faultCode", "label_name", "jenkins_build_url")
+
+
+def _is_later(build, latest):
+    """
+    Whether build is later than latest, by build_time_iso then log_log_build_id. Builds without a time come first.
+    """
+    def position(row):
+        return row["build_time_iso"] is not None, row["build_time_iso"] or datetime.datetime.min, \
+            row["log_log_build_id"]
+
+    return position(build) > position(latest)
+
+
+class LatestBuildManager(models.Manager):
+
+    def refresh(self, batch_size=5000):
+        """
+        This method updates the latest build of every component with the builds imported since the last refresh.
+        Called by the import cron through POST /build/refresh/, see cron_jobs/data_import.yml.
+        :param batch_size: Number of builds read per transaction.
+        :return: Number of components whose latest build changed.
+        """
+        from .models import Build, BuildWatermark
+
+        changed = 0
+
+        while True:
+            with transaction.atomic():
+                # Refreshes that overlap take turns per batch, each one starting from where the other stopped
+                high_water = BuildWatermark.objects.lock_high_water(LATEST_BUILD_WATERMARK)
+                builds = list(Build.objects.filter(log_log_build_id__gt=high_water, group__isnull=False,
+                                                   dg_name__isnull=False)
+                              .order_by("log_log_build_id").values(*LATEST_BUILD_COLUMNS)[:batch_size])
+                if not builds:
+                    return changed
+
+                latest = {}
+                for build in builds:
+                    key = (build["group"], build["dg_name"])
+                    if key not in latest or _is_later(build, latest[key]):
+                        latest[key] = build
+
+                current = {(row.group, row.dg_name): row
+                           for row in self.select_for_update().filter(group__in={key[0] for key in latest})}
+                for key, build in latest.items():
+                    row = current.get(key)
+                    if row is None:
+                        self.create(**build)
+                    elif _is_later(build, vars(row)):
+                        self.filter(pk=row.pk).update(**build)
+                    else:
+                        continue
+                    changed += 1
+                BuildWatermark.objects.set_high_water(LATEST_BUILD_WATERMARK, builds[-1]["log_log_build_id"])
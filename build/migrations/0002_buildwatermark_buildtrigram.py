@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('build', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildWatermark',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('log_log_build_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'log_build_watermark',
+            },
+        ),
+        migrations.CreateModel(
+            name='BuildTrigram',
+            fields=[
+                ('log_build_trigram_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('column', models.PositiveSmallIntegerField()),
+                ('trigram', models.CharField(max_length=3)),
+                ('log_log_build_id', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'log_build_trigram',
+                'indexes': [models.Index(fields=['column', 'trigram', 'log_log_build_id'],
+                                         name='log_build_trigram_lookup_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+# log_build is not managed by Django, the column is added to existing MySQL tables only. Fresh tables get it from
+# build/db/tables/log_build.table.
+ADD_ASSEMBLY_COLUMN = [
+    "alter table log_build add column build_0_assembly varchar(255) generated always as "
+    "(if(locate('.assembly.', build_0_nvr) > 0, substring_index(build_0_nvr, '.assembly.', -1), NULL)) stored",
+    "create index log_build_assembly_idx on log_build (build_0_assembly)",
+]
+
+DROP_ASSEMBLY_COLUMN = [
+    "drop index log_build_assembly_idx on log_build",
+    "alter table log_build drop column build_0_assembly",
+]
+
+
+def _log_build_columns(schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if "log_build" not in connection.introspection.table_names(cursor):
+            return None
+        return [column.name for column in connection.introspection.get_table_description(cursor, "log_build")]
+
+
+def add_assembly_column(apps, schema_editor):
+    columns = _log_build_columns(schema_editor)
+    if schema_editor.connection.vendor == "mysql" and columns is not None and "build_0_assembly" not in columns:
+        for statement in ADD_ASSEMBLY_COLUMN:
+            schema_editor.execute(statement)
+
+
+def drop_assembly_column(apps, schema_editor):
+    columns = _log_build_columns(schema_editor)
+    if schema_editor.connection.vendor == "mysql" and columns is not None and "build_0_assembly" in columns:
+        for statement in DROP_ASSEMBLY_COLUMN:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('build', '0002_buildwatermark_buildtrigram'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_assembly_column, drop_assembly_column),
+    ]
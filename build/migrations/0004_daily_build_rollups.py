@@ -0,0 +1,52 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('build', '0003_log_build_assembly'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBuildRollup',
+            fields=[
+                ('log_build_daily_rollup_id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField(null=True, unique=True)),
+                ('success', models.BigIntegerField(default=0)),
+                ('failure', models.BigIntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'log_build_daily_rollup',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyBuildLabelRollup',
+            fields=[
+                ('log_build_daily_label_rollup_id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField(null=True)),
+                ('label_name', models.CharField(blank=True, max_length=300, null=True)),
+                ('success', models.BigIntegerField(default=0)),
+                ('failure', models.BigIntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'log_build_daily_label_rollup',
+                'unique_together': {('date', 'label_name')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyBuildFaultCodeRollup',
+            fields=[
+                ('log_build_daily_fault_code_rollup_id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField(null=True)),
+                ('fault_code', models.BigIntegerField(null=True)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'log_build_daily_fault_code_rollup',
+                'unique_together': {('date', 'fault_code')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('build', '0004_daily_build_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildDateVersion',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'log_build_date_version',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# log_build is not managed by Django, the index is added to existing MySQL tables only. Fresh tables get it from
+# build/db/tables/log_build.table.
+TIME_INDEX = "log_build_time_idx"
+
+
+def _log_build_indexes(schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if "log_build" not in connection.introspection.table_names(cursor):
+            return None
+        return connection.introspection.get_constraints(cursor, "log_build")
+
+
+def add_time_index(apps, schema_editor):
+    indexes = _log_build_indexes(schema_editor)
+    if schema_editor.connection.vendor == "mysql" and indexes is not None and TIME_INDEX not in indexes:
+        schema_editor.execute(f"create index {TIME_INDEX} on log_build (build_time_iso, log_log_build_id)")
+
+
+def drop_time_index(apps, schema_editor):
+    indexes = _log_build_indexes(schema_editor)
+    if schema_editor.connection.vendor == "mysql" and indexes is not None and TIME_INDEX in indexes:
+        schema_editor.execute(f"drop index {TIME_INDEX} on log_build")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('build', '0005_builddateversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_time_index, drop_time_index),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('build', '0006_log_build_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildFailureStat',
+            fields=[
+                ('log_build_failure_stat_id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField(null=True)),
+                ('dg_name', models.CharField(blank=True, max_length=300, null=True)),
+                ('fault_code', models.BigIntegerField(null=True)),
+                ('count', models.BigIntegerField(default=0)),
+                ('first_seen', models.DateTimeField(null=True)),
+                ('last_seen', models.DateTimeField(null=True)),
+            ],
+            options={
+                'db_table': 'log_build_failure_stat',
+                'unique_together': {('date', 'dg_name', 'fault_code')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('build', '0007_buildfailurestat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestBuild',
+            fields=[
+                ('log_build_latest_id', models.AutoField(primary_key=True, serialize=False)),
+                ('group', models.CharField(max_length=191)),
+                ('dg_name', models.CharField(max_length=191)),
+                ('log_log_build_id', models.BigIntegerField()),
+                ('build_time_iso', models.DateTimeField(null=True)),
+                ('build_0_id', models.BigIntegerField(null=True)),
+                ('build_0_nvr', models.CharField(blank=True, max_length=1000, null=True)),
+                ('brew_task_id', models.BigIntegerField(null=True)),
+                ('brew_task_state', models.CharField(blank=True, max_length=1000, null=True)),
+                ('brew_faultCode', models.BigIntegerField(null=True)),
+                ('label_name', models.CharField(blank=True, max_length=1000, null=True)),
+                ('jenkins_build_url', models.CharField(blank=True, max_length=1000, null=True)),
+            ],
+            options={
+                'db_table': 'log_build_latest',
+                'unique_together': {('group', 'dg_name')},
+            },
+        ),
+    ]
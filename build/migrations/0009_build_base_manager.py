@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('build', '0008_latestbuild'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='build',
+            options={'base_manager_name': 'objects', 'managed': False},
+        ),
+    ]
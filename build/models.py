@@ -1,7 +1,8 @@
 from django.db import models, connection
 from datetime import datetime
 from time import strftime
-from .managers import BuildManager, DailyBuildReportManager
+from .managers import BuildManager, DailyBuildReportManager, BuildWatermarkManager, BuildTrigramManager, \
+    DailyBuildRollupManager, BuildDateVersionManager, BuildFailureStatManager, LatestBuildManager
 
 
 # Create your models here.
@@ -59,6 +60,18 @@ class DailyBuildReport(models.Model):
     objects = DailyBuildReportManager()
 
 
+class GeneratedCharField(models.CharField):
+    """GeneratedCharField: a CharField the database computes, such as a
+    GENERATED ALWAYS column. It is read and filtered on like any field, but
+    the managers of its model leave it out of inserts and updates.
+    """
+    generated = True
+
+    def __init__(self, *args, **kwargs):
+        kwargs["editable"] = False
+        super().__init__(*args, **kwargs)
+
+
 class Build(models.Model):
     """
     This class represents the build record table which holds all the
@@ -68,6 +81,8 @@ class Build(models.Model):
     class Meta:
         db_table = "log_build"
         managed = False
+        # Saves go through BuildManager too, which leaves build_0_assembly out
+        base_manager_name = "objects"
 
     log_log_build_id = models.AutoField(primary_key=True)
     env_OS_GIT_MAJOR = models.BigIntegerField(blank=True, null=True)
@@ -115,6 +130,8 @@ class Build(models.Model):
     brew_faultCode = models.BigIntegerField(blank=True, null=True)
     jenkins_build_number = models.BigIntegerField(blank=True, null=True)
     build_0_nvr = models.CharField(max_length=1000, blank=True, null=True)
+    # Generated by the database from build_0_nvr: the assembly after its last ".assembly.", indexed
+    build_0_assembly = GeneratedCharField(max_length=255, blank=True, null=True)
     brew_build_ids = models.BigIntegerField(blank=True, null=True)
     label_io_openshift_tags = models.CharField(max_length=1000, blank=True, null=True)
     env_KUBE_GIT_TREE_STATE = models.CharField(max_length=1000, blank=True, null=True)
@@ -127,3 +144,143 @@ class Build(models.Model):
     label_io_openshift_s2i_scripts_url = models.CharField(max_length=1000, blank=True, null=True)
     label_io_openshift_build_versions = models.CharField(max_length=1000, blank=True, null=True)
     objects = BuildManager()
+
+
+class BuildWatermark(models.Model):
+    """
+    The highest log_build id each table derived from log_build has caught up with.
+    """
+
+    class Meta:
+        db_table = "log_build_watermark"
+
+    name = models.CharField(max_length=100, primary_key=True)
+    log_log_build_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = BuildWatermarkManager()
+
+
+class BuildDateVersion(models.Model):
+    """
+    Version of the builds of a date, bumped whenever builds of that date are imported, to invalidate cached reports.
+    """
+
+    class Meta:
+        db_table = "log_build_date_version"
+
+    date = models.DateField(primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = BuildDateVersionManager()
+
+
+class BuildTrigram(models.Model):
+    """
+    Trigram index over the log_build columns searched by substring, one row per distinct lower cased trigram of
+    each column value of each build.
+    """
+
+    class Meta:
+        db_table = "log_build_trigram"
+        indexes = [
+            models.Index(fields=["column", "trigram", "log_log_build_id"], name="log_build_trigram_lookup_idx"),
+        ]
+
+    log_build_trigram_id = models.BigAutoField(primary_key=True)
+    column = models.PositiveSmallIntegerField()
+    trigram = models.CharField(max_length=3)
+    log_log_build_id = models.BigIntegerField()
+    objects = BuildTrigramManager()
+
+
+class DailyBuildRollup(models.Model):
+    """
+    Build counts per day, maintained from log_build as builds are imported. Success means a fault code of 0.
+    """
+
+    class Meta:
+        db_table = "log_build_daily_rollup"
+
+    log_build_daily_rollup_id = models.AutoField(primary_key=True)
+    date = models.DateField(null=True, unique=True)
+    success = models.BigIntegerField(default=0)
+    failure = models.BigIntegerField(default=0)
+    total = models.BigIntegerField(default=0)
+    objects = DailyBuildRollupManager()
+
+
+class DailyBuildLabelRollup(models.Model):
+    """
+    Build counts per day and label, maintained along with DailyBuildRollup.
+    """
+
+    class Meta:
+        db_table = "log_build_daily_label_rollup"
+        unique_together = ("date", "label_name")
+
+    log_build_daily_label_rollup_id = models.AutoField(primary_key=True)
+    date = models.DateField(null=True)
+    label_name = models.CharField(max_length=300, null=True, blank=True)
+    success = models.BigIntegerField(default=0)
+    failure = models.BigIntegerField(default=0)
+    total = models.BigIntegerField(default=0)
+
+
+class DailyBuildFaultCodeRollup(models.Model):
+    """
+    Build counts per day and fault code, maintained along with DailyBuildRollup.
+    """
+
+    class Meta:
+        db_table = "log_build_daily_fault_code_rollup"
+        unique_together = ("date", "fault_code")
+
+    log_build_daily_fault_code_rollup_id = models.AutoField(primary_key=True)
+    date = models.DateField(null=True)
+    fault_code = models.BigIntegerField(null=True)
+    count = models.BigIntegerField(default=0)
+
+
+class BuildFailureStat(models.Model):
+    """
+    Failed builds per day, component and fault code, with the first and last time the failure was seen that day.
+    Maintained from log_build as builds are imported. Failed means a fault code other than 0, or none.
+    """
+
+    class Meta:
+        db_table = "log_build_failure_stat"
+        unique_together = ("date", "dg_name", "fault_code")
+
+    log_build_failure_stat_id = models.AutoField(primary_key=True)
+    date = models.DateField(null=True)
+    dg_name = models.CharField(max_length=300, null=True, blank=True)
+    fault_code = models.BigIntegerField(null=True)
+    count = models.BigIntegerField(default=0)
+    first_seen = models.DateTimeField(null=True)
+    last_seen = models.DateTimeField(null=True)
+    objects = BuildFailureStatManager()
+
+
+class LatestBuild(models.Model):
+    """
+    The latest build of every component of every group, by build_time_iso. Maintained from log_build as builds are
+    imported.
+    """
+
+    class Meta:
+        db_table = "log_build_latest"
+        unique_together = ("group", "dg_name")
+
+    log_build_latest_id = models.AutoField(primary_key=True)
+    group = models.CharField(max_length=191)
+    dg_name = models.CharField(max_length=191)
+    log_log_build_id = models.BigIntegerField()
+    build_time_iso = models.DateTimeField(null=True)
+    build_0_id = models.BigIntegerField(null=True)
+    build_0_nvr = models.CharField(max_length=1000, null=True, blank=True)
+    brew_task_id = models.BigIntegerField(null=True)
+    brew_task_state = models.CharField(max_length=1000, null=True, blank=True)
+    brew_faultCode = models.BigIntegerField(null=True)
+    label_name = models.CharField(max_length=1000, null=True, blank=True)
+    jenkins_build_url = models.CharField(max_length=1000, null=True, blank=True)
+    objects = LatestBuildManager()
@@ -0,0 +1,168 @@
+"""
+Compiles the filter documents posted to the build search endpoint into parameterized SQL over log_build.
+
+A filter document maps column names to a list of conditions, with an optional sort order:
+{
+    "dg_name": [{"like_or_where": "like", "value": "ose-"}],
+    "brew_faultCode": [{"like_or_where": "where", "cond": "!=", "value": 0}],
+    "time_iso": [{"like_or_where": "where", "value": "2023-05-22"}],
+    "order": {"sort_filter_column": "time_iso", "sort_filter_order": "desc"}
+}
+
+"like" conditions match substrings unless "match" asks for a "prefix" or "exact" match, which can use an index.
+Conditions on datetime columns whose value is a date or a month are turned into a half open range.
+"""
+import datetime
+import functools
+import re
+from django.db import connection, models
+from .managers import BUILD_UI_COLUMNS
+from .models import Build
+
+
+class QueryCompileError(Exception):
+    """Exception raised when a filter document cannot be compiled into a query"""
+    pass
+
+
+BUILD_SEARCH_LIMIT = 200
+
+# Only real log_build columns may be filtered or sorted on
+FILTERABLE_COLUMNS = {field.column: field for field in Build._meta.concrete_fields}
+
+# Only the columns returned to the UI are fetched
+UI_COLUMNS = list(BUILD_UI_COLUMNS)
+
+COMPARISON_OPERATORS = {"=", "!=", "<>", "<", "<=", ">", ">="}
+
+DEFAULT_ORDER = ("time_iso", "desc")
+
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}$")
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _period_for(value):
+    """
+    Returns the half open [start, end) range covered by a date or month string, None for anything else.
+    """
+    try:
+        if DATE_PATTERN.match(value):
+            start = datetime.date.fromisoformat(value)
+            return start, start + datetime.timedelta(days=1)
+        if MONTH_PATTERN.match(value):
+            start = datetime.date.fromisoformat(value + "-01")
+            return start, (start + datetime.timedelta(days=32)).replace(day=1)
+    except ValueError:
+        pass
+    return None
+
+
+def _classify(column, condition):
+    """
+    Picks the predicate kind for a single condition.
+    :return: Tuple of (kind, operator), both part of the plan shape.
+    """
+    if not isinstance(condition, dict) or "like_or_where" not in condition or "value" not in condition:
+        raise QueryCompileError("Missing value \"like_or_where\" in query string.")
+
+    value = str(condition["value"])
+    is_datetime = isinstance(FILTERABLE_COLUMNS[column], models.DateTimeField)
+
+    if condition["like_or_where"] == "where":
+        operator = condition.get("cond", "=")
+        if operator not in COMPARISON_OPERATORS:
+            raise QueryCompileError(f"Invalid condition \"{operator}\" for column \"{column}\".")
+        if operator == "=" and is_datetime and _period_for(value):
+            return "period", None
+        return "compare", "!=" if operator == "<>" else operator
+
+    if condition["like_or_where"] == "like":
+        match = condition.get("match", "contains")
+        if match not in ("contains", "prefix", "exact"):
+            raise QueryCompileError(f"Invalid match \"{match}\" for column \"{column}\".")
+        if is_datetime and _period_for(value):
+            return "period", None
+        return match, None
+
+    raise QueryCompileError(f"Invalid value \"{condition['like_or_where']}\" for \"like_or_where\".")
+
+
+def _bind(kind, value):
+    value = str(value)
+    if kind == "period":
+        return list(_period_for(value))
+    if kind == "contains":
+        return [f"%{_escape_like(value)}%"]
+    if kind == "prefix":
+        return [f"{_escape_like(value)}%"]
+    return [value]
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_plan(shape, order, limit):
+    """
+    Builds the SQL for a filter shape, independent of the values bound to it. Cached per shape.
+    :param shape: Tuple of (column, kind, operator) for every condition.
+    :param order: Tuple of (column, direction).
+    :param limit: Maximum number of rows.
+    :return: SQL string with %s placeholders.
+    """
+    quote = connection.ops.quote_name
+    predicates = []
+
+    for column, kind, operator in shape:
+        if kind == "period":
+            predicates.append(f"{quote(column)} >= %s and {quote(column)} < %s")
+        elif kind in ("contains", "prefix"):
+            predicates.append(f"{quote(column)} like %s")
+        elif kind == "exact":
+            predicates.append(f"{quote(column)} = %s")
+        else:
+            predicates.append(f"{quote(column)} {operator} %s")
+
+    sql = "select {} from log_build".format(", ".join(quote(column) for column in UI_COLUMNS))
+    if predicates:
+        sql += " where " + " and ".join(predicates)
+    sql += f" order by {quote(order[0])} {order[1]} limit {int(limit)}"
+    return sql
+
+
+def _order_for(order):
+    if not isinstance(order, dict) or "sort_filter_column" not in order or "sort_filter_order" not in order:
+        return DEFAULT_ORDER
+
+    column = order["sort_filter_column"]
+    direction = str(order["sort_filter_order"]).lower()
+    if column not in FILTERABLE_COLUMNS or direction not in ("asc", "desc"):
+        raise QueryCompileError("Invalid sort order.")
+    return column, direction
+
+
+def compile_build_query(filter_document, limit=BUILD_SEARCH_LIMIT):
+    """
+    Compiles a build search filter document into a parameterized query.
+    :param filter_document: Dict of column name to list of conditions, plus an optional "order".
+    :param limit: Maximum number of rows to return.
+    :return: Tuple of (sql, params).
+    """
+    filter_document = dict(filter_document)
+    order = _order_for(filter_document.pop("order", None))
+
+    shape = []
+    params = []
+    for column, conditions in filter_document.items():
+        if column not in FILTERABLE_COLUMNS:
+            raise QueryCompileError(f"Unknown column \"{column}\".")
+        if not isinstance(conditions, list):
+            raise QueryCompileError(f"Conditions for column \"{column}\" must be a list.")
+
+        for condition in conditions:
+            kind, operator = _classify(column, condition)
+            shape.append((column, kind, operator))
+            params.extend(_bind(kind, condition["value"]))
+
+    return _compile_plan(tuple(shape), order, limit), params
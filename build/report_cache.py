@@ -0,0 +1,104 @@
+"""
+Response cache for the daily build reports of past dates.
+
+Builds of a date that has ended don't change unless the date is re-imported, so its reports are cached for good and
+served with an ETag and long-lived cache headers. Every cache key includes the version of the date, which is bumped
+when the rollups count builds of that date, so once the rollups have moved past a date a re-import is the only thing
+that invalidates its reports. Dates the rollups haven't moved past yet, eg: when an import lags past midnight, are
+not cached.
+
+Responses listing builds that may still change are served with an ETag made of the highest build id they cover
+instead, which a single aggregate gives, so clients polling for new builds get a 304 without the full query.
+"""
+import datetime
+import hashlib
+import json
+from django.core.cache import cache
+from django.db.models import Max
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from .managers import parse_report_date, DAILY_ROLLUP_WATERMARK
+from .models import Build, BuildDateVersion, BuildWatermark, DailyBuildRollup
+
+# How long a cached report is kept, in seconds. Reports are only dropped early by a re-import of their date.
+REPORT_CACHE_TIMEOUT = 30 * 24 * 60 * 60
+
+# How long clients may use a report before checking its ETag again, in seconds
+REPORT_MAX_AGE = 24 * 60 * 60
+
+
+def _report_tag(view_name, query_params, version):
+    params = sorted((name, values) for name, values in query_params.lists())
+    return hashlib.sha1(json.dumps([view_name, params, version]).encode()).hexdigest()
+
+
+def conditional_builds_response(view_name, request, builds, get_response, version=None):
+    """
+    Serves a response made of a set of builds with an ETag and a Last-Modified header. Builds are only ever appended,
+    so the highest build id of the set tells whether the response changed.
+    :param view_name: Name of the view the response belongs to, part of the ETag.
+    :param request: The GET request, its query params are part of the ETag.
+    :param builds: Build queryset the response is made of.
+    :param get_response: Function returning the Response, only called when the client doesn't hold it already.
+    :param version: Anything else the response depends on, part of the ETag.
+    :return: Response, 304 if the If-None-Match header of the request matches.
+    """
+    latest = builds.order_by().aggregate(max_id=Max("log_log_build_id"), last_modified=Max("build_time_iso"))
+    etag = quote_etag(_report_tag(view_name, request.query_params, [latest["max_id"], version]))
+
+    # Last-Modified is informational only: a late import can add builds older than it
+    if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = get_response()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+
+    response["ETag"] = etag
+    if latest["last_modified"]:
+        response["Last-Modified"] = http_date(latest["last_modified"].timestamp())
+    return response
+
+
+def cached_report_response(view_name, request, get_report, builds=None):
+    """
+    Serves a daily report from the cache when its date is over and the rollups have counted all of its builds.
+    Only then do the date versions, which key the cache, move with every change to the builds of the date. Reports
+    of later dates are served with conditional_builds_response.
+    :param view_name: Name of the view the report belongs to, part of the cache key.
+    :param request: The GET request, its query params are part of the cache key.
+    :param get_report: Function returning the response data for the request.
+    :param builds: Build queryset the report is made of, all the builds of the date if None.
+    :return: Response, 304 if the client already holds the current report.
+    """
+    date = parse_report_date(request.query_params.get("date"))
+    if date is None:
+        return Response(data=get_report())
+
+    closed_before = DailyBuildRollup.objects.closed_before()
+    if closed_before is None or date >= min(closed_before, datetime.datetime.now(datetime.timezone.utc).date()):
+        # The rollups may be behind, the reports read from them change with their watermark
+        builds = Build.objects.on_date(date) if builds is None else builds
+        return conditional_builds_response(view_name, request, builds, lambda: Response(data=get_report()),
+                                           version=BuildWatermark.objects.get_high_water(DAILY_ROLLUP_WATERMARK))
+
+    tag = _report_tag(view_name, request.query_params, BuildDateVersion.objects.get_version(date))
+    etag = quote_etag(tag)
+
+    if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        key = "daily_report:" + tag
+        data = cache.get(key)
+        if data is None:
+            data = get_report()
+            if data.get("status") != "success":
+                return Response(data=data)
+            cache.set(key, data, REPORT_CACHE_TIMEOUT)
+        response = Response(data=data)
+
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=REPORT_MAX_AGE)
+    return response
@@ -1,57 +1,58 @@
-from .models import Build, DailyBuildReport
+import datetime
+import hashlib
+import json
+from django.core.cache import cache
+from django.db.models import Max, Sum
+from .managers import parse_report_date, FAILURE_STAT_WATERMARK, LATEST_BUILD_COLUMNS
+from .models import Build, DailyBuildReport, BuildTrigram, DailyBuildRollup, BuildFailureStat, BuildWatermark, \
+    BuildDateVersion, LatestBuild
+from .extracts import RECENT_BUILDS, BUILD_DURATIONS, ExtractQueryError
+from .query_compiler import compile_build_query, QueryCompileError, FILTERABLE_COLUMNS
+from .timeseries import get_success_rate_series, parse_moment, TimeSeriesError, SERIES_FILTERS
 
 
-def handle_build_post_request(request_params):
-    request_params = dict(request_params)
+# How long a build search result is kept, in seconds. Results are superseded as soon as new builds are imported.
+BUILD_SEARCH_CACHE_TIMEOUT = 60 * 60
 
-    order_by = None
-    order_by_string = ""
-    where = None
-    where_string = ""
-    query_string = ""
 
-    if "order" in request_params:
-        order_by = request_params["order"]
-        del request_params["order"]
+def normalize_build_search(request_params):
+    """
+    Orders the columns of a build search filter document, and the conditions of every column, so that documents
+    asking for the same builds compare equal. Malformed documents are returned as they are, for the compiler to
+    reject.
+    """
+    normalized = {}
+    for column, conditions in sorted(request_params.items()):
+        if isinstance(conditions, list):
+            conditions = sorted(conditions, key=lambda condition: json.dumps(condition, sort_keys=True, default=str))
+        normalized[column] = conditions
+    return normalized
 
-        if len(order_by) != 0 and len(order_by) == 2:
-            if "sort_filter_column" in order_by and "sort_filter_order" in order_by:
-                order_by_string += " order by {} {}".format(order_by["sort_filter_column"],
-                                                            order_by["sort_filter_order"])
-        else:
-            order_by_string += " order by time_iso desc"
 
-    else:
-        order_by_string += " order by time_iso desc"
-
-    for column in request_params:
-        for column_condition in request_params[column]:
-            print(column_condition)
-            if "like_or_where" not in column_condition or \
-                    "value" not in column_condition:
-                return {"status": "error", "message": "Missing value \"like_or_where\" in query string.", "data": []}
-
-            if column_condition["like_or_where"] == "where":
-                value = str(column_condition["value"])
-                value = value.replace("%", "%%")
-                if "cond" in column_condition:
-                    where_string += "{} {} \"{}\" and ".format(column, column_condition["cond"], value)
-                else:
-                    where_string += "{} = \"{}\" and ".format(column, value)
-            elif column_condition["like_or_where"] == "like":
-                value = str(column_condition["value"])
-                value = value.replace("%", "\\%%")
-                where_string += "{} like \"%%{}%%\" and ".format(column, value)
-
-    if where_string == "":
-        query_string = "select * from log_build " + order_by_string + " limit 200"
-    else:
-        where_string = "where " + where_string[:-4]
-        query_string = "select * from log_build " + where_string + order_by_string + " limit 200"
+def handle_build_post_request(request_params):
+    request_params = dict(request_params)
+    layout = request_params.pop("layout", "rows")
+    if layout not in ("rows", "columnar"):
+        return {"status": "error", "message": "Invalid value for \"layout\".", "data": []}
+
+    request_params = normalize_build_search(request_params)
+    try:
+        query_string, params = compile_build_query(request_params)
+    except QueryCompileError as e:
+        return {"status": "error", "message": str(e), "data": []}
 
-    print(query_string)
+    # Builds are only ever appended, a result stays valid until the highest build id moves
+    high_water = Build.objects.aggregate(max_id=Max("log_log_build_id"))["max_id"]
+    search = json.dumps([layout, request_params], sort_keys=True, default=str)
+    key = f"build_search:{high_water}:{hashlib.sha1(search.encode()).hexdigest()}"
 
-    result = Build.objects.generate_build_data_for_ui(query_string)
+    result = cache.get(key)
+    if result is None:
+        if layout == "columnar":
+            result = Build.objects.fetch_ui_columns(query_string, params)
+        else:
+            result = Build.objects.generate_build_data_for_ui(query_string, params)
+        cache.set(key, result, BUILD_SEARCH_CACHE_TIMEOUT)
     return {"status": "success", "message": "Data is ready.", "data": result}
 
 
@@ -64,7 +65,190 @@ def daily_build_filter_view_get(request):
     elif request_type == "column_search":
         column_name = request.query_params.get("name", None)
         column_value = request.query_params.get("value", None)
-        if column_name:
+        if column_name in FILTERABLE_COLUMNS:
             return Build.objects.get_all_for_a_date_for_a_column(column_name, column_value, date)
     else:
         return {"error": "Invalid request."}
+
+
+def daily_build_filter_builds(request):
+    """
+    The builds a build_records request lists, for its conditional response.
+    :return: Build queryset, None if the request doesn't list builds.
+    """
+    date = parse_report_date(request.query_params.get("date"))
+    if date is None:
+        return None
+    builds = Build.objects.on_date(date)
+
+    request_type = request.query_params.get("type", None)
+    if request_type == "all":
+        return builds
+    column_name = request.query_params.get("name", None)
+    if request_type == "column_search" and column_name in FILTERABLE_COLUMNS:
+        return builds.filter(**{FILTERABLE_COLUMNS[column_name].name: request.query_params.get("value", None)})
+    return None
+
+
+def build_timeseries_view_get(request):
+    """
+    Builds the success rate series of a GET request with "start", optional "end" and "bucket" and SERIES_FILTERS
+    query params.
+    :return: Dict, final response to the view.
+    """
+    start = parse_moment(request.query_params.get("start"))
+    end = parse_moment(request.query_params.get("end")) if request.query_params.get("end") else \
+        datetime.datetime.now(datetime.timezone.utc)
+    if start is None or end is None:
+        return {"status": "error", "message": "Missing or invalid \"start\" or \"end\".", "data": []}
+
+    filters = {name: request.query_params[name] for name in SERIES_FILTERS if request.query_params.get(name)}
+    try:
+        data = get_success_rate_series(start, end, request.query_params.get("bucket", "day"), filters)
+    except TimeSeriesError as e:
+        return {"status": "error", "message": str(e), "data": []}
+    return {"status": "success", "message": "Data is ready.", "data": data}
+
+
+def recent_builds_view_get(request):
+    """
+    Answers a GET request for the builds of the last few days from the in-memory window, see RecentBuildWindow.
+    :return: Dict, final response to the view.
+    """
+    query_params = request.query_params
+    filters = {column: query_params[column] for column in RECENT_BUILDS.coded_columns if column in query_params}
+
+    try:
+        if "brew_faultCode" in filters:
+            filters["brew_faultCode"] = int(filters["brew_faultCode"]) if filters["brew_faultCode"] else None
+        offset = int(query_params.get("offset", 0))
+        limit = min(int(query_params.get("limit", 100)), 1000)
+    except ValueError:
+        return {"status": "error", "message": "Invalid numeric query param.", "data": []}
+
+    since = None
+    if query_params.get("since"):
+        since = parse_moment(query_params["since"])
+        if since is None:
+            return {"status": "error", "message": "Invalid value for parameter \"since\".", "data": []}
+
+    try:
+        data = RECENT_BUILDS.query(filters, since, query_params.get("ordering", "-build_time_iso"), offset, limit,
+                                   query_params.get("count_by"))
+    except ExtractQueryError as e:
+        return {"status": "error", "message": str(e), "data": []}
+    return {"status": "success", "message": "Data is ready.", "data": data}
+
+
+def build_durations_view_get(request):
+    """
+    Answers a GET request for build duration statistics from the in-memory extract, see BuildDurationExtract.
+    :return: Dict, final response to the view.
+    """
+    query_params = request.query_params
+    filters = {column: query_params[column] for column in BUILD_DURATIONS.group_columns if column in query_params}
+    group_by = query_params.get("group_by", "dg_name")
+
+    try:
+        limit = min(int(query_params.get("limit", 50)), 1000)
+    except ValueError:
+        return {"status": "error", "message": "Invalid value for parameter \"limit\".", "data": []}
+
+    since = None
+    if query_params.get("since"):
+        since = parse_moment(query_params["since"])
+        if since is None:
+            return {"status": "error", "message": "Invalid value for parameter \"since\".", "data": []}
+
+    try:
+        data = BUILD_DURATIONS.query(group_by if group_by != "none" else None, filters, since,
+                                     query_params.get("order_by", "p90"), limit)
+    except ExtractQueryError as e:
+        return {"status": "error", "message": str(e), "data": []}
+    return {"status": "success", "message": "Data is ready.", "data": data}
+
+
+# How long a top failures response is reused for, in seconds. Refreshes of the failure stats invalidate it earlier.
+FAILURES_CACHE_TIMEOUT = 600
+
+
+def build_failures_view_get(request):
+    """
+    Answers a GET request for the most frequent failures of the last "days" days up to "end", from the failure stats.
+    :return: Dict, final response to the view.
+    """
+    try:
+        days = int(request.query_params.get("days", 7))
+        limit = min(int(request.query_params.get("limit", 10)), 100)
+    except ValueError:
+        return {"status": "error", "message": "Invalid numeric query param.", "data": []}
+    if days < 1:
+        return {"status": "error", "message": "Invalid value for parameter \"days\".", "data": []}
+
+    end = datetime.datetime.now(datetime.timezone.utc).date()
+    if request.query_params.get("end"):
+        end = parse_report_date(request.query_params["end"])
+        if end is None:
+            return {"status": "error", "message": "Invalid value for parameter \"end\".", "data": []}
+    start = end - datetime.timedelta(days=days - 1)
+
+    # Refreshes move the watermark, re-imports bump the versions of their dates
+    versions = BuildDateVersion.objects.filter(date__gte=start, date__lte=end).aggregate(total=Sum("version"))
+    key = f"build_failures:{start}:{end}:{limit}:{BuildWatermark.objects.get_high_water(FAILURE_STAT_WATERMARK)}:" \
+          f"{versions['total'] or 0}"
+
+    data = cache.get(key)
+    if data is None:
+        data = BuildFailureStat.objects.top_failures(start, end, limit)
+        cache.set(key, data, FAILURES_CACHE_TIMEOUT)
+    return {"status": "success", "message": "Data is ready.", "data": data}
+
+
+def status_board_view_get(request):
+    """
+    Answers a GET request for the latest build of every component, optionally of one "group" or "brew_task_state".
+    :return: Dict, final response to the view.
+    """
+    board = LatestBuild.objects.order_by("group", "dg_name")
+    for column in ("group", "brew_task_state"):
+        if request.query_params.get(column):
+            board = board.filter(**{column: request.query_params[column]})
+    return {"status": "success", "message": "Data is ready.", "data": list(board.values(*LATEST_BUILD_COLUMNS))}
+
+
+# Tables derived from log_build, refreshed with the builds imported since their last refresh
+BUILD_REFRESH_HANDLERS = {
+    "search_index": lambda: BuildTrigram.objects.index_new_builds(),
+    "daily_rollup": lambda: DailyBuildRollup.objects.refresh(),
+    "failure_stat": lambda: BuildFailureStat.objects.refresh(),
+    "latest_build": lambda: LatestBuild.objects.refresh(),
+}
+
+
+def handle_build_refresh_post_request(request):
+    """
+    Refreshes the tables derived from log_build. Called by the import cron after every import into log_build, see
+    cron_jobs/data_import.yml.
+    :param request: POST request with a "type" query param, one of BUILD_REFRESH_HANDLERS or "all", or
+    "reimported_date" with a "date" whose builds were deleted and imported again.
+    :return: Dict, final response to the view.
+    """
+    request_type = request.query_params.get("type", None)
+
+    if request_type == "reimported_date":
+        date = parse_report_date(request.query_params.get("date"))
+        if date is None:
+            return {"status": "error", "message": "Invalid value for parameter \"date\".", "data": []}
+        DailyBuildRollup.objects.rebuild_date(date)
+        BuildFailureStat.objects.rebuild_date(date)
+        return {"status": "success", "message": "Build data refreshed.", "data": {"reimported_date": date}}
+
+    if request_type == "all":
+        refresh_types = list(BUILD_REFRESH_HANDLERS)
+    elif request_type in BUILD_REFRESH_HANDLERS:
+        refresh_types = [request_type]
+    else:
+        return {"status": "error", "message": "Invalid value for parameter \"type\".", "data": []}
+
+    data = {refresh_type: BUILD_REFRESH_HANDLERS[refresh_type]() for refresh_type in refresh_types}
+    return {"status": "success", "message": "Build data refreshed.", "data": data}
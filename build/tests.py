@@ -1,3 +1,763 @@
-from django.test import TestCase
+import datetime
+import math
+from collections import Counter
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from . import live_feed, managers, timeseries
+from .columnar import encode_columns
+from .extracts import BuildDurationExtract, RecentBuildWindow, ExtractQueryError
+from .managers import SEARCH_INDEX_WATERMARK, LATEST_BUILD_WATERMARK
+from .models import Build, BuildTrigram, BuildWatermark, BuildDateVersion, BuildFailureStat, DailyBuildReport, \
+    DailyBuildRollup, DailyBuildLabelRollup, DailyBuildFaultCodeRollup, LatestBuild
+from .query_compiler import compile_build_query, QueryCompileError
+from .request_dispatcher import handle_build_post_request, normalize_build_search
 
-# Create your tests here.
+BASE_TIME = datetime.datetime(2024, 5, 20, tzinfo=datetime.timezone.utc)
+
+
+def make_build(build_id, minutes=0, **fields):
+    """
+    A build made build_id * 17 + minutes minutes after BASE_TIME.
+    """
+    build_time = BASE_TIME + datetime.timedelta(minutes=build_id * 17 + minutes)
+    defaults = {"build_0_id": build_id, "group": "openshift-4.15", "dg_name": f"ose-component-{build_id % 3}",
+                "brew_faultCode": 0, "label_name": f"openshift/ose-component-{build_id % 3}",
+                "build_time_iso": build_time,
+                "time_iso": build_time + datetime.timedelta(minutes=30), "brew_task_state": "CLOSED"}
+    defaults.update(fields)
+    return Build.objects.create(log_log_build_id=build_id, **defaults)
+
+
+def decode_columns(result):
+    """
+    Turns a result in the columnar layout back into one dict per row.
+    """
+    columns = {name: [result["dictionaries"][name][code] for code in values] if name in result["dictionaries"]
+               else values for name, values in result["columns"].items()}
+    return [dict(zip(columns, values)) for values in zip(*columns.values())] if result["rows"] else []
+
+
+class LogBuildTestCase(TestCase):
+    """
+    log_build isn't managed by Django, so the test database doesn't have it. It is created for the test case and
+    dropped after, outside of the transaction TestCase wraps the tests in.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as schema_editor:
+            schema_editor.create_model(Build)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as schema_editor:
+            schema_editor.delete_model(Build)
+
+    def setUp(self):
+        # Cached responses are keyed by the highest build id, which every test starts over with
+        cache.clear()
+
+
+class QueryCompilerTestCase(SimpleTestCase):
+
+    def test_values_are_bound_as_params(self):
+        sql, params = compile_build_query({
+            "dg_name": [{"like_or_where": "like", "value": "ose-'; drop table log_build; --"}],
+            "brew_faultCode": [{"like_or_where": "where", "cond": "!=", "value": 0}],
+        })
+        self.assertNotIn("drop table", sql)
+        self.assertEqual(params, ["%ose-'; drop table log\\_build; --%", "0"])
+
+    def test_unknown_column_is_rejected(self):
+        with self.assertRaisesMessage(QueryCompileError, "Unknown column"):
+            compile_build_query({"dg_name = 1 or 1": [{"like_or_where": "where", "value": 1}]})
+
+    def test_unknown_operator_is_rejected(self):
+        with self.assertRaisesMessage(QueryCompileError, "Invalid condition"):
+            compile_build_query({"brew_faultCode": [{"like_or_where": "where", "cond": "= 0 or 1 =", "value": 1}]})
+
+    def test_unknown_sort_order_is_rejected(self):
+        with self.assertRaises(QueryCompileError):
+            compile_build_query({"order": {"sort_filter_column": "time_iso", "sort_filter_order": "desc; --"}})
+        with self.assertRaises(QueryCompileError):
+            compile_build_query({"order": {"sort_filter_column": "1; --", "sort_filter_order": "desc"}})
+
+    def test_dates_become_ranges(self):
+        sql, params = compile_build_query({"time_iso": [{"like_or_where": "where", "value": "2024-05"}]})
+        self.assertIn(">= %s and", sql)
+        self.assertEqual(params, [datetime.date(2024, 5, 1), datetime.date(2024, 6, 1)])
+
+
+class BuildSearchTestCase(LogBuildTestCase):
+
+    def test_search(self):
+        for build_id in range(1, 10):
+            make_build(build_id, brew_faultCode=0 if build_id % 4 else 1013)
+
+        response = handle_build_post_request({
+            "dg_name": [{"like_or_where": "like", "value": "component-1"}],
+            "brew_faultCode": [{"like_or_where": "where", "cond": "=", "value": 0}],
+            "order": {"sort_filter_column": "build_time_iso", "sort_filter_order": "asc"},
+        })
+        self.assertEqual(response["status"], "success")
+        self.assertEqual([row["build_id"] for row in response["data"]], [1, 7])
+
+    def test_invalid_document(self):
+        response = handle_build_post_request({"bogus": [{"like_or_where": "where", "value": 1}]})
+        self.assertEqual(response["status"], "error")
+
+
+class BuildSearchCacheTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.client = APIClient()
+        for build_id in range(1, 10):
+            make_build(build_id, brew_faultCode=0 if build_id % 4 else 1013)
+
+    def search(self, body):
+        """
+        Posts a raw JSON search, returns its builds and the number of queries it ran.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/build/", body, content_type="application/json").json()
+        self.assertEqual(response["status"], "success")
+        rows = decode_columns(response["data"]) if isinstance(response["data"], dict) else response["data"]
+        return [row["build_id"] for row in rows], len(queries)
+
+    def test_equivalent_search_hits_cache(self):
+        builds, queries = self.search('{"dg_name": [{"like_or_where": "like", "value": "component-1"}], '
+                                      '"brew_faultCode": [{"like_or_where": "where", "cond": "=", "value": 0}, '
+                                      '{"like_or_where": "where", "cond": "!=", "value": 1}]}')
+        self.assertEqual((builds, queries), ([7, 1], 2))
+
+        # Other column and condition order, other spacing: only the high water query runs
+        builds, queries = self.search('{ "brew_faultCode":[ {"value":1, "cond":"!=", "like_or_where":"where"},\n'
+                                      '  {"cond":"=", "like_or_where":"where", "value":0} ],\n'
+                                      '  "dg_name":[{"value":"component-1","like_or_where":"like"}] }')
+        self.assertEqual((builds, queries), ([7, 1], 1))
+
+        # Another search and another layout don't
+        self.assertEqual(self.search('{"dg_name": [{"like_or_where": "like", "value": "component-2"}]}'),
+                         ([8, 5, 2], 2))
+        self.assertEqual(self.search('{"brew_faultCode": [{"like_or_where": "where", "cond": "=", "value": 0}, '
+                                     '{"like_or_where": "where", "cond": "!=", "value": 1}], '
+                                     '"dg_name": [{"like_or_where": "like", "value": "component-1"}], '
+                                     '"layout": "columnar"}'), ([7, 1], 2))
+
+    def test_new_build_misses_cache(self):
+        body = '{"dg_name": [{"like_or_where": "where", "value": "ose-component-1"}]}'
+        self.assertEqual(self.search(body), ([7, 4, 1], 2))
+        self.assertEqual(self.search(body), ([7, 4, 1], 1))
+
+        make_build(10)
+        self.assertEqual(self.search(body), ([10, 7, 4, 1], 2))
+        self.assertEqual(self.search(body), ([10, 7, 4, 1], 1))
+
+    def test_normalize(self):
+        search = {"order": {"sort_filter_column": "time_iso", "sort_filter_order": "desc"},
+                  "dg_name": [{"like_or_where": "like", "value": "b"}, {"value": "a", "like_or_where": "like"}]}
+        normalized = normalize_build_search(search)
+        self.assertEqual(list(normalized), ["dg_name", "order"])
+        self.assertEqual([condition["value"] for condition in normalized["dg_name"]], ["a", "b"])
+        self.assertEqual(normalize_build_search(dict(reversed(search.items()))), normalized)
+        # Malformed documents are left for the compiler to reject
+        self.assertEqual(normalize_build_search({"dg_name": "a"}), {"dg_name": "a"})
+
+
+class ColumnarTestCase(SimpleTestCase):
+
+    def test_round_trip(self):
+        names = ["build_id", "group", "dg_name", "label_name", "fault_code"]
+        rows = [(1, "openshift-4.15", "ose-cli", "openshift/ose-cli", 0),
+                (2, "openshift-4.15", "ose-etcd", None, 1013),
+                (3, "openshift-4.16", "ose-cli", "openshift/ose-cli", 0)]
+
+        result = encode_columns(names, rows)
+        self.assertEqual(result["rows"], 3)
+        self.assertEqual(result["columns"]["build_id"], [1, 2, 3])
+        self.assertEqual(result["columns"]["fault_code"], [0, 1013, 0])
+        self.assertEqual((result["columns"]["group"], result["dictionaries"]["group"]),
+                         ([0, 0, 1], ["openshift-4.15", "openshift-4.16"]))
+        self.assertEqual((result["columns"]["dg_name"], result["dictionaries"]["dg_name"]),
+                         ([0, 1, 0], ["ose-cli", "ose-etcd"]))
+        self.assertEqual((result["columns"]["label_name"], result["dictionaries"]["label_name"]),
+                         ([0, 1, 0], ["openshift/ose-cli", None]))
+        self.assertEqual(set(result["dictionaries"]), {"group", "dg_name", "label_name"})
+        self.assertEqual(decode_columns(result), [dict(zip(names, row)) for row in rows])
+
+    def test_no_rows(self):
+        self.assertEqual(encode_columns(["build_id", "group"], []), {
+            "layout": "columnar", "rows": 0, "columns": {"build_id": [], "group": []}, "dictionaries": {"group": []}})
+
+
+class BuildSearchColumnarTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for build_id in range(1, 8):
+            make_build(build_id, group="openshift-4.15" if build_id % 2 else "openshift-4.16")
+
+    def test_columnar_matches_rows(self):
+        search = {
+            "brew_faultCode": [{"like_or_where": "where", "cond": "=", "value": 0}],
+            "order": {"sort_filter_column": "build_time_iso", "sort_filter_order": "desc"},
+        }
+        rows = handle_build_post_request(search)["data"]
+        columnar = handle_build_post_request({**search, "layout": "columnar"})["data"]
+
+        self.assertEqual(columnar["layout"], "columnar")
+        self.assertEqual(columnar["rows"], 7)
+        self.assertEqual(columnar["dictionaries"]["group"], ["openshift-4.15", "openshift-4.16"])
+        self.assertEqual(columnar["dictionaries"]["dg_name"], ["ose-component-1", "ose-component-0",
+                                                               "ose-component-2"])
+        self.assertEqual(decode_columns(columnar), rows)
+
+    def test_post(self):
+        search = {"group": [{"like_or_where": "where", "value": "openshift-4.16"}]}
+        client = APIClient()
+        rows = client.post("/build/", search, format="json").json()["data"]
+        columnar = client.post("/build/", {**search, "layout": "columnar"}, format="json").json()["data"]
+
+        self.assertEqual([row["build_id"] for row in rows], [6, 4, 2])
+        self.assertEqual(columnar["dictionaries"]["group"], ["openshift-4.16"])
+        self.assertEqual(decode_columns(columnar), rows)
+
+    def test_invalid_layout(self):
+        response = handle_build_post_request({"layout": "wide"})
+        self.assertEqual((response["status"], response["message"]), ("error", "Invalid value for \"layout\"."))
+
+
+class BuildTrigramTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        make_build(1, dg_name="ose-etcd")
+        make_build(2, dg_name="ose-installer")
+        make_build(3, dg_name="ose-installer-artifacts")
+
+    def search(self, value):
+        builds = BuildTrigram.objects.narrow_icontains(Build.objects.all(), "dg_name", value)
+        return sorted(builds.values_list("log_log_build_id", flat=True))
+
+    def test_index_new_builds(self):
+        self.assertEqual(BuildTrigram.objects.index_new_builds(batch_size=2), 3)
+        self.assertEqual(BuildWatermark.objects.get_high_water(SEARCH_INDEX_WATERMARK), 3)
+        entries = BuildTrigram.objects.count()
+
+        # Nothing new: a second refresh, eg: an overlapping cron run, adds nothing
+        self.assertEqual(BuildTrigram.objects.index_new_builds(), 0)
+        self.assertEqual(BuildTrigram.objects.count(), entries)
+
+    def test_refresh_skips_batches_indexed_by_another_refresh(self):
+        with mock.patch.object(BuildWatermark.objects, "lock_high_water", side_effect=[3, 3]):
+            self.assertEqual(BuildTrigram.objects.index_new_builds(), 0)
+        self.assertEqual(BuildTrigram.objects.count(), 0)
+
+    def test_narrow_icontains(self):
+        BuildTrigram.objects.index_new_builds()
+        self.assertEqual(self.search("INSTALLER"), [2, 3])
+        self.assertEqual(self.search("etc"), [1])
+        self.assertEqual(self.search("nothing"), [])
+
+        # Builds imported since the last refresh aren't in the index yet, they are still found
+        make_build(4, dg_name="ose-installer-next")
+        self.assertEqual(self.search("installer"), [2, 3, 4])
+
+    def test_candidates_start_from_rarest_trigram(self):
+        BuildTrigram.objects.index_new_builds()
+        # "ose" is in every build, "etc" in one: the rarest trigram is under the limit, the search is narrowed
+        with mock.patch.object(managers, "SEARCH_INDEX_MAX_CANDIDATES", 1):
+            builds = BuildTrigram.objects.narrow_icontains(Build.objects.all(), "dg_name", "se-etc")
+            self.assertIn("log_build_trigram", str(builds.query))
+            self.assertEqual(list(builds.values_list("log_log_build_id", flat=True)), [1])
+
+            # Every trigram of "ose-" is in more builds than the limit, it is a plain scan
+            builds = BuildTrigram.objects.narrow_icontains(Build.objects.all(), "dg_name", "ose-")
+            self.assertNotIn("log_build_trigram", str(builds.query))
+            self.assertEqual(sorted(builds.values_list("log_log_build_id", flat=True)), [1, 2, 3])
+
+
+class DailyBuildRollupTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # About 85 builds a day over four days, one in five failed, some without a fault code or a label
+        for build_id in range(1, 340):
+            make_build(build_id, brew_faultCode=[0, 0, 0, 0, 1013, None][build_id % 6] if build_id % 7 else 1,
+                       label_name=None if build_id % 11 == 0 else f"openshift/ose-component-{build_id % 3}")
+
+    def direct_counts(self, date):
+        start = datetime.datetime.combine(date, datetime.time.min, tzinfo=datetime.timezone.utc)
+        builds = Build.objects.filter(build_time_iso__gte=start, build_time_iso__lt=start + datetime.timedelta(days=1))
+        return builds.count(), builds.filter(brew_faultCode=0).count()
+
+    def assert_rollups_match_builds(self):
+        dates = {build_time.date() for build_time in Build.objects.values_list("build_time_iso", flat=True)}
+        for date in dates:
+            total, success = self.direct_counts(date)
+            rollup = DailyBuildRollup.objects.get(date=date)
+            self.assertEqual((rollup.total, rollup.success, rollup.failure), (total, success, total - success))
+            self.assertEqual(sum(DailyBuildLabelRollup.objects.filter(date=date).values_list("total", flat=True)),
+                             total)
+            self.assertEqual(sum(DailyBuildFaultCodeRollup.objects.filter(date=date).values_list("count", flat=True)),
+                             total)
+
+    def test_refresh_matches_direct_aggregate(self):
+        dates = DailyBuildRollup.objects.refresh(batch_size=50)
+        self.assertEqual(len(dates), 5)
+        self.assert_rollups_match_builds()
+        self.assertTrue(all(BuildDateVersion.objects.get_version(date) > 0 for date in dates))
+
+        # Builds imported later are added to the counts, a refresh without new builds changes nothing
+        for build_id in range(340, 360):
+            make_build(build_id, brew_faultCode=1013)
+        self.assertEqual(len(DailyBuildRollup.objects.refresh(batch_size=50)), 1)
+        self.assertEqual(DailyBuildRollup.objects.refresh(), [])
+        self.assert_rollups_match_builds()
+
+    def test_report_from_rollups(self):
+        DailyBuildRollup.objects.refresh()
+        date = BASE_TIME.date() + datetime.timedelta(days=1)
+        total, success = self.direct_counts(date)
+
+        report = DailyBuildReport.objects.handle_request_for_daily_report_view_get("fordate", str(date))
+        self.assertEqual((report["total"], report["success"]), (total, success))
+        overview = DailyBuildReport.objects.handle_request_for_daily_report_view_get("overview")
+        self.assertEqual([(day["total"], day["success"]) for day in overview if day["date"] == date],
+                         [(total, success)])
+
+    def test_rebuild_date(self):
+        DailyBuildRollup.objects.refresh()
+        date = BASE_TIME.date() + datetime.timedelta(days=2)
+        version = BuildDateVersion.objects.get_version(date)
+
+        # The builds of the date are deleted and imported again, with different results
+        start = datetime.datetime.combine(date, datetime.time.min, tzinfo=datetime.timezone.utc)
+        Build.objects.filter(build_time_iso__gte=start, build_time_iso__lt=start + datetime.timedelta(days=1)) \
+            .update(brew_faultCode=0)
+        DailyBuildRollup.objects.rebuild_date(date)
+
+        self.assert_rollups_match_builds()
+        self.assertEqual(DailyBuildRollup.objects.get(date=date).failure, 0)
+        self.assertEqual(BuildDateVersion.objects.get_version(date), version + 1)
+
+    def test_reimported_date_is_recounted(self):
+        DailyBuildRollup.objects.refresh()
+        BuildFailureStat.objects.refresh()
+        date = BASE_TIME.date() + datetime.timedelta(days=1)
+        version = BuildDateVersion.objects.get_version(date)
+
+        # The builds of the date are deleted and imported again, with new ids and different results
+        builds = Build.objects.on_date(date).order_by("log_log_build_id")
+        reimported = [(build.log_log_build_id, build.build_time_iso) for build in builds]
+        builds.delete()
+        for index, (build_id, build_time) in enumerate(reimported):
+            make_build(1000 + index, build_time_iso=build_time, brew_faultCode=1013 if index < 3 else 0)
+
+        self.assertIn(date, DailyBuildRollup.objects.refresh())
+        self.assert_rollups_match_builds()
+        self.assertEqual(DailyBuildRollup.objects.get(date=date).failure, 3)
+        self.assertGreater(BuildDateVersion.objects.get_version(date), version)
+
+        BuildFailureStat.objects.refresh()
+        self.assertEqual(sum(BuildFailureStat.objects.filter(date=date).values_list("count", flat=True)), 3)
+        self.assertEqual(sum(BuildFailureStat.objects.values_list("count", flat=True)),
+                         Build.objects.exclude(brew_faultCode=0).count())
+
+
+class ReportCacheTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        # Builds of 2024-05-20 to 2024-05-22, the import lags behind on the last date
+        for build_id in range(1, 200):
+            make_build(build_id)
+
+    def get_report(self, date, **headers):
+        return self.client.get(f"/build/daily/?type=fordate&date={date}", **headers)
+
+    def test_matching_etag_is_not_modified(self):
+        DailyBuildRollup.objects.refresh()
+        for date in ("2024-05-20", "2024-05-22"):
+            etag = self.get_report(date)["ETag"]
+            response = self.get_report(date, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, date)
+            self.assertEqual(response["ETag"], etag)
+
+    def test_dates_the_rollups_have_passed_are_cached(self):
+        # Until the rollups are built no date is known to be complete
+        response = self.client.get("/build/build_records/?type=all&date=2024-05-20")
+        self.assertEqual(len(response.data["data"]), 84)
+        self.assertFalse(response.has_header("Cache-Control"))
+
+        DailyBuildRollup.objects.refresh()
+        self.assertIn("max-age", self.get_report("2024-05-20")["Cache-Control"])
+        response = self.get_report("2024-05-22")
+        self.assertFalse(response.has_header("Cache-Control"))
+
+        # The builds the import was missing change the report of the last date, once they are counted
+        make_build(200)
+        DailyBuildRollup.objects.refresh()
+        self.assertEqual(self.get_report("2024-05-22", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+        self.assertEqual(self.get_report("2024-05-22").data["data"]["total"],
+                         Build.objects.on_date(datetime.date(2024, 5, 22)).count())
+
+
+class BuildDurationExtractTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.extract = BuildDurationExtract(days=(datetime.datetime.now(datetime.timezone.utc) - BASE_TIME).days + 1)
+        for build_id in range(1, 60):
+            start = int(BASE_TIME.timestamp()) + build_id * 1020
+            duration = 600 + (build_id % 3) * 300 + build_id * 7
+            # Some unix times are in milliseconds, some builds didn't finish
+            finish = (start + duration) * 1000 if build_id % 5 == 0 else start + duration
+            make_build(build_id, build_time_unix=start, time_unix=finish if build_id % 13 else None)
+
+    def expected(self, group_by):
+        durations = {}
+        for build in Build.objects.exclude(time_unix=None).order_by("log_log_build_id"):
+            time_unix = build.time_unix / 1000 if build.time_unix > 10 ** 11 else build.time_unix
+            group = getattr(build, group_by) if group_by else None
+            durations.setdefault(group, []).append((build.build_time_iso.timestamp() / 86400,
+                                                    time_unix - build.build_time_unix))
+
+        results = {}
+        for group, builds in durations.items():
+            values = sorted(duration for _, duration in builds)
+            count = len(values)
+            mean = sum(values) / count
+            mean_day = sum(day for day, _ in builds) / count
+            trend = sum((day - mean_day) * (duration - mean) for day, duration in builds) / \
+                sum((day - mean_day) ** 2 for day, _ in builds)
+            results[group] = {"count": count, "mean": mean, "p50": values[math.ceil(count * 0.5) - 1],
+                              "p90": values[math.ceil(count * 0.9) - 1], "p95": values[math.ceil(count * 0.95) - 1],
+                              "max": values[-1], "trend_per_day": trend}
+        return results
+
+    def assert_statistics(self, actual, expected):
+        self.assertEqual(actual.keys(), expected.keys())
+        for name, value in expected.items():
+            self.assertAlmostEqual(actual[name], value, places=6, msg=name)
+
+    def test_statistics_per_group(self):
+        results = self.extract.query(group_by="dg_name", order_by="mean")["results"]
+        expected = self.expected("dg_name")
+        self.assertEqual([result["dg_name"] for result in results],
+                         sorted(expected, key=lambda dg_name: expected[dg_name]["mean"], reverse=True))
+        for result in results:
+            self.assert_statistics({name: result[name] for name in BuildDurationExtract.statistics},
+                                   expected[result["dg_name"]])
+
+    def test_statistics_of_filtered_builds(self):
+        results = self.extract.query(group_by=None, filters={"dg_name": "ose-component-1"})["results"]
+        self.assert_statistics(results[0], self.expected("dg_name")["ose-component-1"])
+        self.assertEqual(self.extract.query(filters={"dg_name": "unknown"})["results"], [])
+
+    def test_builds_imported_later_are_added(self):
+        self.extract.query()
+        make_build(60, build_time_unix=int(BASE_TIME.timestamp()) + 61200, time_unix=int(BASE_TIME.timestamp()) + 70000)
+        self.extract.refresh()
+        self.assert_statistics(self.extract.query(group_by=None)["results"][0], self.expected(None)[None])
+
+        # Builds that left the window are dropped
+        self.extract.trim(BASE_TIME + datetime.timedelta(minutes=30 * 17))
+        self.assertEqual(self.extract.query(group_by=None)["results"][0]["count"],
+                         Build.objects.filter(log_log_build_id__gte=30).exclude(time_unix=None).count())
+
+
+class RecentBuildWindowTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.window = RecentBuildWindow(days=(datetime.datetime.now(datetime.timezone.utc) - BASE_TIME).days + 1)
+        for build_id in range(1, 20):
+            make_build(build_id, brew_faultCode=[0, 0, 1013][build_id % 3], brew_task_id=build_id * 100,
+                       group="openshift-4.15" if build_id % 4 else "openshift-4.16")
+        # Builds sharing a time keep the order they were read in, and columns may be empty
+        make_build(20, build_time_iso=Build.objects.get(log_log_build_id=10).build_time_iso, build_0_id=None,
+                   brew_task_id=None, label_name=None)
+
+    def ids(self, **kwargs):
+        return [build["log_log_build_id"] for build in self.window.query(limit=1000, **kwargs)["results"]]
+
+    def test_orderings(self):
+        for ordering in RecentBuildWindow.orderings:
+            self.assertEqual(self.ids(ordering=ordering),
+                             list(Build.objects.order_by(ordering, "log_log_build_id")
+                                  .values_list("log_log_build_id", flat=True)), ordering)
+
+    def test_builds(self):
+        results = self.window.query(ordering="log_log_build_id")["results"]
+        for result, build in zip(results, Build.objects.order_by("log_log_build_id")):
+            self.assertEqual(result, {column: getattr(build, column) for column in result})
+        self.assertEqual((results[-1]["build_0_id"], results[-1]["brew_task_id"], results[-1]["label_name"]),
+                         (None, None, None))
+
+    def test_offset_and_limit(self):
+        everything = self.ids()
+        pages = [self.window.query(offset=offset, limit=6) for offset in range(0, 24, 6)]
+        self.assertEqual([page["count"] for page in pages], [20] * 4)
+        self.assertEqual([len(page["results"]) for page in pages], [6, 6, 6, 2])
+        self.assertEqual([build["log_log_build_id"] for page in pages for build in page["results"]], everything)
+        self.assertEqual(self.window.query(offset=30)["results"], [])
+
+    def test_filters(self):
+        filters = {"group": "openshift-4.15", "brew_faultCode": 1013}
+        self.assertEqual(self.ids(filters=filters, ordering="log_log_build_id"),
+                         list(Build.objects.filter(**filters).order_by("log_log_build_id")
+                              .values_list("log_log_build_id", flat=True)))
+        self.assertEqual(self.window.query(filters={"group": "openshift-3.11"})["count"], 0)
+
+        since = Build.objects.get(log_log_build_id=15).build_time_iso
+        self.assertEqual(self.ids(since=since, ordering="log_log_build_id"), [15, 16, 17, 18, 19])
+
+    def test_count_by(self):
+        data = self.window.query(filters={"brew_faultCode": 0}, count_by="dg_name")
+        expected = Counter(Build.objects.filter(brew_faultCode=0).values_list("dg_name", flat=True))
+        self.assertEqual({count["value"]: count["count"] for count in data["counts"]}, expected)
+        self.assertEqual([count["count"] for count in data["counts"]], sorted(expected.values(), reverse=True))
+        self.assertEqual(sum(count["count"] for count in data["counts"]), data["count"])
+
+        self.assertEqual(self.window.query(filters={"group": "openshift-3.11"}, count_by="group")["counts"], [])
+
+    def test_builds_imported_later_are_added(self):
+        self.window.query()
+        make_build(21)
+        self.window.refresh()
+        self.assertEqual(self.ids()[0], 21)
+
+        # Builds that left the window are dropped
+        self.window.trim(Build.objects.get(log_log_build_id=18).build_time_iso)
+        self.assertEqual(self.ids(ordering="log_log_build_id"), [18, 19, 21])
+
+    def test_invalid_queries(self):
+        for kwargs, message in (({"ordering": "dg_name"}, "Invalid ordering \"dg_name\"."),
+                                ({"count_by": "build_0_nvr"}, "Can't count by \"build_0_nvr\"."),
+                                ({"filters": {"build_0_nvr": "x"}}, "Can't filter on \"build_0_nvr\".")):
+            with self.assertRaisesMessage(ExtractQueryError, message):
+                self.window.query(**kwargs)
+
+        response = APIClient().get("/build/recent/?count_by=build_0_nvr").data
+        self.assertEqual((response["status"], response["message"]), ("error", "Can't count by \"build_0_nvr\"."))
+
+
+class BuildFailureStatTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        for build_id in range(1, 100):
+            make_build(build_id, brew_faultCode=[0, 0, 1013, None, 1][build_id % 5])
+
+    def get_failures(self):
+        return self.client.get("/build/failures/?days=3&end=2024-05-21").data["data"]
+
+    def test_refresh_matches_direct_aggregate(self):
+        self.assertGreater(BuildFailureStat.objects.refresh(batch_size=30), 0)
+        failures = Build.objects.exclude(brew_faultCode=0)
+        for stat in BuildFailureStat.objects.all():
+            builds = failures.filter(dg_name=stat.dg_name, brew_faultCode=stat.fault_code) & \
+                Build.objects.on_date(stat.date)
+            self.assertEqual(stat.count, builds.count())
+            self.assertEqual(stat.last_seen, builds.order_by("-build_time_iso").first().build_time_iso)
+        self.assertEqual(sum(BuildFailureStat.objects.values_list("count", flat=True)), failures.count())
+
+    def test_refresh_skips_batches_added_by_another_refresh(self):
+        with mock.patch.object(BuildWatermark.objects, "lock_high_water", side_effect=[99]):
+            self.assertEqual(BuildFailureStat.objects.refresh(), 0)
+        self.assertEqual(BuildFailureStat.objects.count(), 0)
+
+    def test_refresh_invalidates_cached_failures(self):
+        BuildFailureStat.objects.refresh()
+        failures = sum(component["failures"] for component in self.get_failures()["components"])
+
+        make_build(100, brew_faultCode=1013)
+        self.assertEqual(sum(component["failures"] for component in self.get_failures()["components"]), failures)
+        self.client.post("/build/refresh/?type=all")
+        self.assertEqual(sum(component["failures"] for component in self.get_failures()["components"]), failures + 1)
+
+
+class LatestBuildTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        for build_id in range(1, 20):
+            make_build(build_id, group="openshift-4.15" if build_id % 2 else "openshift-4.16")
+
+    def board(self):
+        response = self.client.get("/build/status_board/").data["data"]
+        return {(row["group"], row["dg_name"]): row["log_log_build_id"] for row in response}
+
+    def test_refresh_keeps_latest_build_per_component(self):
+        LatestBuild.objects.refresh(batch_size=4)
+        self.assertEqual(self.board(), {("openshift-4.15", "ose-component-0"): 15,
+                                        ("openshift-4.15", "ose-component-1"): 19,
+                                        ("openshift-4.15", "ose-component-2"): 17,
+                                        ("openshift-4.16", "ose-component-0"): 18,
+                                        ("openshift-4.16", "ose-component-1"): 16,
+                                        ("openshift-4.16", "ose-component-2"): 14})
+
+        # A build imported late, but made before the latest one, doesn't replace it
+        make_build(20, minutes=-300, group="openshift-4.15", dg_name="ose-component-1")
+        make_build(21, group="openshift-4.16", dg_name="ose-component-2")
+        self.client.post("/build/refresh/?type=all")
+        board = self.board()
+        self.assertEqual((board[("openshift-4.15", "ose-component-1")], board[("openshift-4.16", "ose-component-2")]),
+                         (19, 21))
+
+    def test_refresh_starts_from_another_refresh(self):
+        BuildWatermark.objects.set_high_water(LATEST_BUILD_WATERMARK, 19)
+        self.assertEqual(LatestBuild.objects.refresh(), 0)
+        self.assertEqual(LatestBuild.objects.count(), 0)
+
+
+@mock.patch.object(live_feed, "close_old_connections", mock.Mock())
+class LiveFeedTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for build_id in range(1, 13):
+            make_build(build_id, brew_faultCode=1013 if build_id % 2 else 0)
+
+    def request(self, query_string):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": live_feed.LIVE_FEED_PATH, "headers": [],
+                 "query_string": query_string.encode()}
+        async_to_sync(live_feed.live_feed)(scope, None, send)
+        return messages
+
+    def backfill(self, last_event_id, since, filters):
+        """
+        The events a client reconnecting with last_event_id gets before the builds imported after since.
+        """
+        subscriber = live_feed.Subscriber(filters)
+        subscriber.since = since
+        # Ends the stream once the queue is empty, after the backfill
+        subscriber.overflowed = True
+        sent = []
+
+        async def send(message):
+            sent.append(message["body"].decode())
+
+        async_to_sync(live_feed._stream)(send, subscriber, last_event_id)
+        return [event.split("\n")[0] for event in sent]
+
+    def test_invalid_filters_are_refused(self):
+        for query_string in ("brew_faultCode=none", "bogus=1"):
+            messages = self.request(query_string)
+            self.assertEqual(messages[0]["status"], 400, query_string)
+            self.assertEqual(len(messages), 2)
+
+    def test_missed_builds_are_sent(self):
+        self.assertEqual(self.backfill(4, 10, {"brew_faultCode": {1013}}), ["id: 5", "id: 7", "id: 9"])
+
+    @mock.patch.object(live_feed, "MAX_QUEUED_BUILDS", 3)
+    def test_client_too_far_behind_is_reset(self):
+        self.assertEqual(self.backfill(2, 12, {}), ["event: reset", "id: 10", "id: 11", "id: 12"])
+
+
+class BuildSaveTestCase(LogBuildTestCase):
+
+    def assert_writes_skip_assembly(self, queries):
+        writes = [query["sql"] for query in queries if query["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertTrue(writes)
+        for sql in writes:
+            self.assertNotIn("build_0_assembly", sql)
+
+    def test_generated_assembly_is_not_written(self):
+        # The column is generated on MySQL, which refuses any value for it
+        with CaptureQueriesContext(connection) as queries:
+            build = make_build(1, build_0_nvr="ose-cli-v4.15.0-1.assembly.4.15.2")
+            build.brew_task_state = "FAILED"
+            build.save()
+            Build.objects.filter(pk=1).update(dg_name="ose-cli")
+            Build.objects.bulk_create([Build(log_log_build_id=2, build_0_nvr="ose-cli-v4.15.0-2.assembly.stream")])
+        self.assert_writes_skip_assembly(queries.captured_queries)
+
+        build = Build.objects.get(pk=1)
+        self.assertEqual((build.brew_task_state, build.dg_name), ("FAILED", "ose-cli"))
+        self.assertEqual(Build.objects.count(), 2)
+
+
+class TimeSeriesTestCase(LogBuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # About 85 builds a day from 2024-05-20 to 2024-05-24, one in four failed
+        for build_id in range(1, 340):
+            make_build(build_id, brew_faultCode=1013 if build_id % 4 == 0 else 0,
+                       label_name=f"openshift/ose-component-{build_id % 2}")
+        DailyBuildRollup.objects.refresh()
+
+    def series(self, start, end, bucket="day", **filters):
+        with mock.patch.object(timeseries, "_count", wraps=timeseries._count) as count:
+            series = timeseries.get_success_rate_series(timeseries.parse_moment(start), timeseries.parse_moment(end),
+                                                        bucket, filters)
+        counted = [(call.args[0].date().isoformat(), call.args[1].date().isoformat()) for call in count.call_args_list]
+        return [(row["bucket"].date().isoformat(), row["success"], row["total"]) for row in series], counted
+
+    def direct_counts(self, start, days, **filters):
+        start = timeseries.parse_moment(start)
+        builds = Build.objects.filter(build_time_iso__gte=start, build_time_iso__lt=start + datetime.timedelta(days),
+                                      **filters)
+        return builds.filter(brew_faultCode=0).count(), builds.count()
+
+    def test_closed_buckets_are_cached(self):
+        series, counted = self.series("2024-05-20", "2024-05-23")
+        self.assertEqual(counted, [("2024-05-20", "2024-05-23")])
+        self.assertEqual([row[1:] for row in series],
+                         [self.direct_counts(f"2024-05-{day}", 1) for day in (20, 21, 22)])
+
+        self.assertEqual(self.series("2024-05-20", "2024-05-23"), (series, []))
+
+    def test_bumped_date_is_counted_again(self):
+        self.series("2024-05-20", "2024-05-23")
+        BuildDateVersion.objects.bump([datetime.date(2024, 5, 21)])
+        self.assertEqual(self.series("2024-05-20", "2024-05-23")[1], [("2024-05-21", "2024-05-22")])
+
+    def test_buckets_the_rollups_havent_passed_are_not_cached(self):
+        # The rollups counted builds up to 2024-05-24, later builds of that date may still be imported
+        self.series("2024-05-23", "2024-05-25")
+        for _ in range(2):
+            self.assertEqual(self.series("2024-05-23", "2024-05-25")[1], [("2024-05-24", "2024-05-25")])
+
+        # Until the rollups count a build of a later date, eg: when the cron refresh was skipped
+        make_build(340, minutes=24 * 60)
+        self.assertEqual(self.series("2024-05-24", "2024-05-25")[1], [("2024-05-24", "2024-05-25")])
+        DailyBuildRollup.objects.refresh()
+        self.series("2024-05-24", "2024-05-25")
+        self.assertEqual(self.series("2024-05-24", "2024-05-25")[1], [])
+
+    def test_day_and_week_buckets_use_rollups(self):
+        with mock.patch.object(timeseries, "_counts_from_builds") as counts_from_builds:
+            series, _ = self.series("2024-05-20", "2024-05-27", "week", label_name="openshift/ose-component-1")
+            self.assertEqual(series, [("2024-05-20", *self.direct_counts("2024-05-20", 7,
+                                                                         label_name="openshift/ose-component-1"))])
+            self.series("2024-05-20", "2024-05-22", "day")
+        counts_from_builds.assert_not_called()
+
+        # Hours and filters the rollups don't have read log_build
+        with mock.patch.object(timeseries, "_counts_from_rollups") as counts_from_rollups:
+            series, _ = self.series("2024-05-20", "2024-05-21", "day", group="openshift-4.15")
+            self.assertEqual(series, [("2024-05-20", *self.direct_counts("2024-05-20", 1))])
+            series, _ = self.series("2024-05-20T00:00:00", "2024-05-20T02:00:00", "hour")
+            self.assertEqual(sum(row[2] for row in series), 7)
+        counts_from_rollups.assert_not_called()
@@ -0,0 +1,179 @@
+"""
+Build success rate over time, in hour, day or week buckets.
+
+Counts for all the buckets of a request that aren't cached yet are computed with a single grouped query, over the
+daily rollups when they can answer it and over log_build otherwise. Buckets the rollups have counted all the builds
+of are cached on their own, keyed by the versions of the dates they cover, so moving or widening a chart only
+computes the buckets it didn't have and a re-import of a date only invalidates the buckets of that date. The
+versions only move when the rollups count builds, so buckets past the last build they counted, eg: when a refresh
+was skipped, aren't cached.
+"""
+import datetime
+import hashlib
+import json
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDay, TruncHour, TruncWeek
+from django.utils.dateparse import parse_datetime
+from .managers import parse_report_date
+from .models import Build, BuildDateVersion, DailyBuildRollup, DailyBuildLabelRollup
+
+
+class TimeSeriesError(Exception):
+    """Exception raised when a time series request is invalid"""
+    pass
+
+
+BUCKET_SIZES = {
+    "hour": datetime.timedelta(hours=1),
+    "day": datetime.timedelta(days=1),
+    "week": datetime.timedelta(weeks=1),
+}
+
+BUCKET_FUNCTIONS = {
+    "hour": TruncHour,
+    "day": TruncDay,
+    "week": TruncWeek,
+}
+
+# Query params the series may be filtered on, with the log_build column they filter
+SERIES_FILTERS = {
+    "group": "group",
+    "label_name": "label_name",
+    "dg_name": "dg_name",
+}
+
+MAX_BUCKETS = 5000
+
+SERIES_CACHE_TIMEOUT = 30 * 24 * 60 * 60
+
+
+def bucket_start(moment, bucket):
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if bucket == "hour":
+        return moment
+    moment = moment.replace(hour=0)
+    if bucket == "day":
+        return moment
+    # Weeks start on Monday, as they do for the database
+    return moment - datetime.timedelta(days=moment.weekday())
+
+
+def parse_moment(value):
+    """
+    Parses a date or datetime query param into an aware UTC datetime, None if it is neither.
+    """
+    try:
+        moment = parse_datetime(value or "")
+    except ValueError:
+        moment = None
+    if moment is None:
+        date = parse_report_date(value)
+        if date is None:
+            return None
+        moment = datetime.datetime.combine(date, datetime.time.min)
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.astimezone(datetime.timezone.utc)
+
+
+def _counts_from_builds(start, end, bucket, filters):
+    builds = Build.objects.filter(build_time_iso__gte=start, build_time_iso__lt=end,
+                                  **{SERIES_FILTERS[name]: value for name, value in filters.items()})
+    rows = builds.order_by() \
+        .annotate(bucket=BUCKET_FUNCTIONS[bucket]("build_time_iso", tzinfo=datetime.timezone.utc)) \
+        .values("bucket") \
+        .annotate(success=Count("log_log_build_id", filter=Q(brew_faultCode=0)), total=Count("log_log_build_id"))
+    return {row["bucket"]: (row["success"], row["total"]) for row in rows}
+
+
+def _counts_from_rollups(start, end, bucket, filters):
+    if "label_name" in filters:
+        rollups = DailyBuildLabelRollup.objects.filter(label_name=filters["label_name"])
+    else:
+        rollups = DailyBuildRollup.objects.all()
+
+    counts = {}
+    for date, success, total in rollups.filter(date__gte=start.date(), date__lt=end.date()) \
+            .values_list("date", "success", "total"):
+        key = bucket_start(datetime.datetime.combine(date, datetime.time.min, tzinfo=datetime.timezone.utc), bucket)
+        bucket_success, bucket_total = counts.get(key, (0, 0))
+        counts[key] = (bucket_success + success, bucket_total + total)
+    return counts
+
+
+def _count(start, end, bucket, filters):
+    """
+    Counts successful and total builds per bucket in [start, end), both bucket boundaries.
+    :return: Dict of bucket start to (success, total), buckets without builds are missing.
+    """
+    if bucket != "hour" and set(filters) <= {"label_name"} and DailyBuildRollup.objects.is_built():
+        return _counts_from_rollups(start, end, bucket, filters)
+    return _counts_from_builds(start, end, bucket, filters)
+
+
+def _bucket_version(bucket_from, bucket, versions):
+    day = bucket_from.date()
+    days = BUCKET_SIZES[bucket].days or 1
+    return sum(versions.get(day + datetime.timedelta(days=offset), 0) for offset in range(days))
+
+
+def get_success_rate_series(start, end, bucket="day", filters=None):
+    """
+    Computes the build success rate per bucket over a time range.
+    :param start: Aware datetime, rounded down to the start of its bucket.
+    :param end: Aware datetime, exclusive, rounded up to the end of its bucket.
+    :param bucket: One of BUCKET_SIZES.
+    :param filters: Dict of SERIES_FILTERS query param to value.
+    :return: List of dicts, one per bucket, oldest first.
+    """
+    filters = filters or {}
+    if bucket not in BUCKET_SIZES:
+        raise TimeSeriesError("Invalid value for parameter \"bucket\".")
+
+    size = BUCKET_SIZES[bucket]
+    start = bucket_start(start, bucket)
+    if bucket_start(end, bucket) != end:
+        end = bucket_start(end, bucket) + size
+    if end <= start:
+        raise TimeSeriesError("\"end\" must be after \"start\".")
+    if (end - start) / size > MAX_BUCKETS:
+        raise TimeSeriesError(f"Too many buckets, at most {MAX_BUCKETS} can be requested.")
+
+    bucket_starts = []
+    moment = start
+    while moment < end:
+        bucket_starts.append(moment)
+        moment += size
+
+    versions = dict(BuildDateVersion.objects.filter(date__gte=start.date(), date__lte=end.date())
+                    .values_list("date", "version"))
+    series_key = hashlib.sha1(json.dumps([bucket, sorted(filters.items())]).encode()).hexdigest()
+    keys = {bucket_from: f"build_series:{series_key}:{bucket_from.isoformat()}:"
+                         f"{_bucket_version(bucket_from, bucket, versions)}"
+            for bucket_from in bucket_starts}
+
+    closed_before = DailyBuildRollup.objects.closed_before()
+    cache_until = min(datetime.datetime.now(datetime.timezone.utc),
+                      datetime.datetime.combine(closed_before or datetime.date.min, datetime.time.min,
+                                                tzinfo=datetime.timezone.utc))
+    cached = cache.get_many([key for bucket_from, key in keys.items() if bucket_from + size <= cache_until])
+    counts = {bucket_from: tuple(cached[key]) for bucket_from, key in keys.items() if key in cached}
+
+    missing = [bucket_from for bucket_from in bucket_starts if bucket_from not in counts]
+    if missing:
+        computed = _count(missing[0], missing[-1] + size, bucket, filters)
+        for bucket_from in missing:
+            counts[bucket_from] = computed.get(bucket_from, (0, 0))
+        cache.set_many({keys[bucket_from]: counts[bucket_from] for bucket_from in missing
+                        if bucket_from + size <= cache_until}, SERIES_CACHE_TIMEOUT)
+
+    series = []
+    for bucket_from in bucket_starts:
+        success, total = counts[bucket_from]
+        series.append({"bucket": bucket_from,
+                       "success": success,
+                       "failure": total - success,
+                       "total": total,
+                       "success_rate": (success / total) * 100 if total else None})
+    return series
@@ -1,8 +1,15 @@
 from django.urls import re_path
-from .views import BuildView, DailyBuildReportView, DailyBuildFilterView
+from .views import BuildView, DailyBuildReportView, DailyBuildFilterView, BuildRefreshView, \
+    BuildTimeSeriesView, RecentBuildsView, BuildDurationsView, BuildFailuresView, StatusBoardView
 
 urlpatterns = [
     re_path(r'^$', BuildView.as_view(), name='build_view'),
     re_path('daily/', DailyBuildReportView.as_view(), name='daily_build_requests'),
     re_path('build_records/', DailyBuildFilterView.as_view(), name="daily_build_filter_view"),
+    re_path('timeseries/', BuildTimeSeriesView.as_view(), name="build_timeseries_view"),
+    re_path('recent/', RecentBuildsView.as_view(), name="recent_builds_view"),
+    re_path('durations/', BuildDurationsView.as_view(), name="build_durations_view"),
+    re_path('failures/', BuildFailuresView.as_view(), name="build_failures_view"),
+    re_path('status_board/', StatusBoardView.as_view(), name="status_board_view"),
+    re_path('refresh/', BuildRefreshView.as_view(), name="build_refresh_view"),
 ]
@@ -2,8 +2,11 @@ from rest_framework import generics
 from .serializer import BuildSerializer, DailyReportViewSerializer
 from rest_framework.response import Response
 import json
-from .request_dispatcher import handle_build_post_request, daily_build_filter_view_get
+from .request_dispatcher import handle_build_post_request, daily_build_filter_view_get, \
+    handle_build_refresh_post_request, build_timeseries_view_get, recent_builds_view_get, \
+    build_durations_view_get, build_failures_view_get, status_board_view_get, daily_build_filter_builds
 from .models import DailyBuildReport
+from .report_cache import cached_report_response
 
 
 # Create your views here.
@@ -42,10 +45,10 @@ class DailyBuildReportView(generics.CreateAPIView):
         date = request.query_params.get("date", None)
 
         if request_type:
-            return Response(
-                data={"status": "success",
-                      "data": DailyBuildReport.objects.handle_request_for_daily_report_view_get(request_type, date),
-                      "message": "Data is ready."})
+            return cached_report_response("daily_report", request, lambda: {
+                "status": "success",
+                "data": DailyBuildReport.objects.handle_request_for_daily_report_view_get(request_type, date),
+                "message": "Data is ready."})
         else:
             return Response(data={"status": "error", "message": "Request type missing.", "data": None})
 
@@ -58,6 +61,44 @@ class DailyBuildFilterView(generics.ListAPIView):
         date = request.query_params.get("date", None)
 
         if request_type and date:
-            return Response({"status": "success", "data": daily_build_filter_view_get(request)})
+            return cached_report_response("daily_build_filter", request, lambda: {
+                "status": "success", "data": daily_build_filter_view_get(request)},
+                builds=daily_build_filter_builds(request))
         else:
             return Response({"status": "fail", "message": "Missing url params,", "data": []})
+
+
+class BuildTimeSeriesView(generics.ListAPIView):
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=build_timeseries_view_get(request))
+
+
+class RecentBuildsView(generics.ListAPIView):
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=recent_builds_view_get(request))
+
+
+class BuildDurationsView(generics.ListAPIView):
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=build_durations_view_get(request))
+
+
+class BuildFailuresView(generics.ListAPIView):
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=build_failures_view_get(request))
+
+
+class StatusBoardView(generics.ListAPIView):
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=status_board_view_get(request))
+
+
+class BuildRefreshView(generics.CreateAPIView):
+
+    def post(self, request, *args, **kwargs):
+        return Response(data=handle_build_refresh_post_request(request))
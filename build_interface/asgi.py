@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'build_interface.settings')
 
 application = get_asgi_application()
+
+# Needs the apps loaded by get_asgi_application()
+from build.live_feed import live_feed_app  # noqa: E402
+
+application = live_feed_app(application)
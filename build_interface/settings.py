@@ -120,6 +120,7 @@ INSTALLED_APPS = [
     'build',
     'ocp_build_data',
     'autocomplete',
+    'errata',
     'django_extensions',
     'corsheaders',
     'django.contrib.admin',
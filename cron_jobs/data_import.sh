@@ -1,2 +1,3 @@
 curl --header "Content-Type: application/json" --request POST --data '{"date": "'"$(date -d yesterday  +%Y-%m-%d)"'"}' http://buildinterfaceserver-art-build-dev.cloud.paas.psi.redhat.com/health/import/
+curl --request POST "http://buildinterfaceserver-art-build-dev.cloud.paas.psi.redhat.com/build/refresh/?type=all"
 curl --header "Content-Type: application/json" --request POST --data '{"start": "'"$(date -d yesterday  +%Y-%m-%d)"'", "end": "'"$(date -d yesterday  +%Y-%m-%d)"'"}' http://buildinterfaceserver-art-build-dev.cloud.paas.psi.redhat.com/health/daily/
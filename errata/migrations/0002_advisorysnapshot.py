@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('errata', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdvisorySnapshot',
+            fields=[
+                ('advisory_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(blank=True, max_length=50, null=True)),
+                ('errata_updated_at', models.CharField(blank=True, max_length=50, null=True)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'log_advisory_snapshot',
+            },
+        ),
+        migrations.CreateModel(
+            name='AdvisorySnapshotBug',
+            fields=[
+                ('advisory_snapshot_bug_id', models.AutoField(primary_key=True, serialize=False)),
+                ('advisory_id', models.BigIntegerField()),
+                ('position', models.IntegerField()),
+                ('bug_id', models.BigIntegerField()),
+                ('bug_status', models.CharField(blank=True, max_length=50, null=True)),
+            ],
+            options={
+                'db_table': 'log_advisory_snapshot_bug',
+                'unique_together': {('advisory_id', 'position')},
+            },
+        ),
+    ]
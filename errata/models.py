@@ -1,3 +1,114 @@
-from django.db import models
+from django.db import models, transaction
 
 # Create your models here.
+
+
+class ErrataUserManager(models.Manager):
+
+    def get_users(self, user_ids):
+        """
+        This method returns the stored users for the given ids.
+        :param user_ids: The errata user ids to look up.
+        :return: Dict, user id to ErrataUser instance.
+        """
+        return {user.errata_user_id: user for user in self.filter(errata_user_id__in=user_ids)}
+
+    def store_users(self, users_data, fetched_at):
+        """
+        This method inserts or updates the given users.
+        :param users_data: Dict of user id to user data received from errata.
+        :param fetched_at: The time the user data was fetched at.
+        """
+        for user_id, user_data in users_data.items():
+            self.update_or_create(errata_user_id=user_id, defaults={"data": user_data, "fetched_at": fetched_at})
+
+    def get_user_ids_fetched_before(self, fetched_before):
+        return list(self.filter(fetched_at__lt=fetched_before).values_list("errata_user_id", flat=True))
+
+
+class ErrataUser(models.Model):
+    """
+    Users seen on errata advisories, kept so advisory responses do not need a live user lookup.
+    """
+
+    class Meta:
+        db_table = "log_errata_user"
+
+    errata_user_id = models.BigIntegerField(primary_key=True)
+    data = models.JSONField(blank=True, null=True)
+    fetched_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = ErrataUserManager()
+
+
+class AdvisorySnapshotManager(models.Manager):
+
+    def get_snapshot(self, advisory_id):
+        return self.filter(advisory_id=advisory_id).first()
+
+    def store_snapshot(self, advisory_id, status, errata_updated_at, data, bugs):
+        """
+        This method inserts or replaces the formatted data of an advisory at a given errata revision.
+        :param advisory_id: The id of the advisory.
+        :param status: The errata status of the advisory, eg: SHIPPED_LIVE
+        :param errata_updated_at: The updated_at timestamp errata reported for the advisory.
+        :param data: The formatted advisory data, without its bug list.
+        :param bugs: The bug list of the advisory, as (bug id, bug status) tuples.
+        """
+        with transaction.atomic():
+            self.update_or_create(advisory_id=advisory_id,
+                                  defaults={"status": status, "errata_updated_at": errata_updated_at, "data": data})
+            AdvisorySnapshotBug.objects.filter(advisory_id=advisory_id).delete()
+            AdvisorySnapshotBug.objects.bulk_create(
+                (AdvisorySnapshotBug(advisory_id=advisory_id, position=position, bug_id=bug_id, bug_status=bug_status)
+                 for position, (bug_id, bug_status) in enumerate(bugs)), batch_size=1000)
+
+
+class AdvisorySnapshot(models.Model):
+    """
+    The last formatted response for an advisory, along with the errata revision it was built from.
+    """
+
+    class Meta:
+        db_table = "log_advisory_snapshot"
+
+    advisory_id = models.BigIntegerField(primary_key=True)
+    status = models.CharField(max_length=50, blank=True, null=True)
+    errata_updated_at = models.CharField(max_length=50, blank=True, null=True)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = AdvisorySnapshotManager()
+
+
+class AdvisorySnapshotBugManager(models.Manager):
+
+    def get_page(self, advisory_id, offset=0, limit=None):
+        """
+        This method reads a page of the bug list of an advisory snapshot, without the rest of the list.
+        :param advisory_id: The id of the advisory.
+        :param offset: Index of the first bug to return.
+        :param limit: Maximum number of bugs to return, all remaining bugs if None.
+        :return: List of (bug id, bug status) tuples.
+        """
+        bugs = self.filter(advisory_id=advisory_id).order_by("position").values_list("bug_id", "bug_status")
+        return list(bugs[offset:None if limit is None else offset + limit])
+
+
+class AdvisorySnapshotBug(models.Model):
+    """
+    The bug list of an advisory snapshot, one row per bug in the order errata lists them, so a page of it can be read
+    on its own.
+    """
+
+    class Meta:
+        db_table = "log_advisory_snapshot_bug"
+        unique_together = ("advisory_id", "position")
+
+    advisory_snapshot_bug_id = models.AutoField(primary_key=True)
+    advisory_id = models.BigIntegerField()
+    position = models.IntegerField()
+    bug_id = models.BigIntegerField()
+    bug_status = models.CharField(max_length=50, blank=True, null=True)
+    objects = AdvisorySnapshotBugManager()
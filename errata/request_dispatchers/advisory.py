@@ -1,4 +1,10 @@
-from lib.errata.errata_requests import get_advisory_data
+import json
+from lib.errata.errata_requests import get_advisory_data, get_advisories_data, iter_advisories_data
+from lib.http_requests import get_branch_advisory_ids, flatten_branch_advisory_ids
+
+
+def get_summary_only(request):
+    return request.query_params.get("summary_only", "false").lower() == "true"
 
 
 def validate_advisory_get(request):
@@ -28,7 +34,15 @@ def validate_advisory_get(request):
 
     if request_type == "advisory":
         # if request type is advisory and id can't be empty, checked earlier then return true
-        return True, {"type": request_type, "id": advisory_id}
+        try:
+            bugs_offset = int(request.query_params.get("bugs_offset", 0))
+            bugs_limit = request.query_params.get("bugs_limit", None)
+            bugs_limit = max(int(bugs_limit), 0) if bugs_limit is not None else None
+        except ValueError:
+            return False, {"status": "error", "message": "Invalid value for parameter \"bugs_offset\" or \"bugs_limit\".", "data": []}
+
+        return True, {"type": request_type, "id": advisory_id, "summary_only": get_summary_only(request),
+                      "bugs_offset": max(bugs_offset, 0), "bugs_limit": bugs_limit}
 
     return False, {"status": "error", "message": "URL validation failed.", "data": []}
 
@@ -43,5 +57,73 @@ def route_advisory_get(request_param):
     """
 
     if request_param["type"] == "advisory":
-        data = get_advisory_data(request_param["id"])
+        data = get_advisory_data(request_param["id"], request_param["summary_only"], request_param["bugs_offset"],
+                                 request_param["bugs_limit"])
         return {"status": "success", "message": "Data is ready.", "data": data}
+
+
+def validate_advisories_get(request):
+
+    """
+    This function validates whether the received batch request is valid or not.
+    Either a branch, whose advisories are all fetched, or a comma separated list of advisory ids is required.
+    :param request:
+    :return: Tuple of validation status and either the parameters for the next function call or an error response.
+    """
+
+    branch = request.query_params.get("branch", None)
+    advisory_ids = request.query_params.get("ids", None)
+    stream = request.query_params.get("stream", "false").lower() == "true"
+    summary_only = get_summary_only(request)
+
+    if branch:
+        return True, {"branch": branch, "stream": stream, "summary_only": summary_only}
+
+    if not advisory_ids:
+        return False, {"status": "error", "message": "Missing query params.", "data": []}
+
+    try:
+        advisory_ids = [int(advisory_id) for advisory_id in advisory_ids.split(",")]
+    except ValueError:
+        return False, {"status": "error", "message": "Invalid value for parameter \"ids\".", "data": []}
+
+    return True, {"ids": advisory_ids, "stream": stream, "summary_only": summary_only}
+
+
+def route_advisories_get(request_param):
+
+    """
+    This method fetches every requested advisory concurrently.
+    :param request_param: Parameters for the request, as returned by validate_advisories_get.
+    :return: Dict, final response to the view.
+    """
+
+    data = {}
+    if "branch" in request_param:
+        data["releases"] = get_branch_advisory_ids(request_param["branch"])
+        advisory_ids = flatten_branch_advisory_ids(data["releases"])
+    else:
+        advisory_ids = request_param["ids"]
+
+    data["advisories"] = get_advisories_data(advisory_ids, request_param["summary_only"])
+    return {"status": "success", "message": "Data is ready.", "data": data}
+
+
+def stream_advisories_get(request_param):
+
+    """
+    This method streams the requested advisories as newline delimited JSON, each line written as soon as that
+    advisory has been fetched. The releases of the branch, if one was requested, are written first.
+    :param request_param: Parameters for the request, as returned by validate_advisories_get.
+    :return: Generator of response lines.
+    """
+
+    if "branch" in request_param:
+        releases = get_branch_advisory_ids(request_param["branch"])
+        yield json.dumps({"releases": releases}) + "\n"
+        advisory_ids = flatten_branch_advisory_ids(releases)
+    else:
+        advisory_ids = request_param["ids"]
+
+    for advisory_id, advisory_data in iter_advisories_data(advisory_ids, request_param["summary_only"]):
+        yield json.dumps({"id": advisory_id, "data": advisory_data}) + "\n"
@@ -1,4 +1,5 @@
-from lib.errata.errata_requests import get_user_data
+from lib.errata.errata_requests import get_user_data, preload_users, refresh_user_cache
+from lib.http_requests import get_branch_advisory_id_list
 
 
 def validate_user_get(request):
@@ -45,3 +46,49 @@ def route_user_get(request_param):
     if request_param["type"] == "user":
         data = get_user_data(request_param["id"])
         return {"status": "success", "message": "Data is ready.", "data": data}
+
+
+def validate_user_post(request):
+
+    """
+    This function validates whether the received cache maintenance request is valid or not.
+    :param request:
+    :return: Tuple of validation status and either the parameters for the next function call or an error response.
+    """
+
+    valid_request_types = ["preload", "refresh"]
+
+    request_type = request.query_params.get("type", None)
+    advisory_ids = request.query_params.get("ids", None)
+    branch = request.query_params.get("branch", None)
+
+    if request_type not in valid_request_types:
+        return False, {"status": "error", "message": "Invalid value for parameter \"type\".", "data": []}
+
+    if request_type == "preload":
+        if branch:
+            return True, {"type": request_type, "branch": branch}
+        try:
+            advisory_ids = [int(advisory_id) for advisory_id in advisory_ids.split(",")]
+        except (AttributeError, ValueError):
+            return False, {"status": "error", "message": "Missing or invalid \"ids\" or \"branch\" param.", "data": []}
+        return True, {"type": request_type, "ids": advisory_ids}
+
+    return True, {"type": request_type}
+
+
+def route_user_post(request_param):
+
+    """
+    This method routes the cache maintenance request to respective methods.
+    :param request_param: Parameters for the request.
+    :return: Dict, final response to the view.
+    """
+
+    if request_param["type"] == "preload":
+        advisory_ids = request_param.get("ids") or get_branch_advisory_id_list(request_param["branch"])
+        count = preload_users(advisory_ids)
+        return {"status": "success", "message": f"Fetched {count} users.", "data": []}
+    elif request_param["type"] == "refresh":
+        count = refresh_user_cache()
+        return {"status": "success", "message": f"Refreshed {count} users.", "data": []}
@@ -1,3 +1,221 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from django.utils import timezone
+from errata.models import ErrataUser, AdvisorySnapshot, AdvisorySnapshotBug
+from lib.errata import errata_requests
 
-# Create your tests here.
+ADVISORY_DATA = {
+    "errata": {"rhba": {"id": 1234, "status": "QE", "updated_at": "2024-05-22T10:00:00Z"}},
+    "content": {"content": {"doc_reviewer_id": 7}},
+    "bugs": {"bugs": [{"bug": {"id": 1, "bug_status": "VERIFIED"}}, {"bug": {"id": 2, "bug_status": "ON_QA"}}]},
+}
+JIRA_ISSUES_DATA = [{"status": "Closed"}, {"status": "Closed"}]
+
+
+def meeting(barrier, result):
+    """
+    A fetch that only returns once every other fetch of the barrier has started, so fetches made one after the other
+    time out.
+    """
+    def fetch(*args):
+        barrier.wait(timeout=5)
+        return result
+    return fetch
+
+
+class AdvisoryFetchTestCase(TestCase):
+
+    def setUp(self):
+        errata_requests.JIRA_ISSUES_CACHE.clear()
+        errata_requests.USER_CACHE.clear()
+        errata_requests.USER_CACHE[7] = {"id": 7, "realname": "Doc Reviewer"}
+
+    def test_advisory_and_jira_issues_are_fetched_concurrently(self):
+        barrier = threading.Barrier(2)
+        with mock.patch.object(errata_requests, "_fetch_advisory", meeting(barrier, ADVISORY_DATA)), \
+                mock.patch.object(errata_requests, "_fetch_jira_issues", meeting(barrier, JIRA_ISSUES_DATA)):
+            data = errata_requests._get_advisory_data(1234)
+
+        self.assertEqual(data["advisory_details"][0]["doc_reviewer_details"], {"id": 7, "realname": "Doc Reviewer"})
+        self.assertEqual(data["bugs_total"], 2)
+        self.assertIn({"bug_status": "Closed", "count": 2}, data["bug_summary"])
+
+    def test_missing_advisory(self):
+        with mock.patch.object(errata_requests, "_fetch_advisory", return_value=None), \
+                mock.patch.object(errata_requests, "_fetch_jira_issues", return_value=[]):
+            self.assertIsNone(errata_requests._get_advisory_data(1234))
+
+
+class UserCacheTestCase(TestCase):
+
+    def setUp(self):
+        errata_requests.USER_CACHE.clear()
+
+    def store_user(self, user_id, age):
+        ErrataUser.objects.store_users({user_id: {"id": user_id}}, timezone.now() - age)
+
+    def test_fresh_user_is_served_from_table(self):
+        self.store_user(1, timedelta(days=1))
+        with mock.patch.object(errata_requests, "_fetch_users") as fetch_users, \
+                mock.patch.object(errata_requests, "_refresh_users_in_background") as refresh:
+            self.assertEqual(errata_requests._get_cached_users([1]), {1: {"id": 1}})
+        fetch_users.assert_not_called()
+        refresh.assert_not_called()
+        self.assertIn(1, errata_requests.USER_CACHE)
+
+    def test_stale_user_is_served_and_refreshed_in_background(self):
+        self.store_user(1, errata_requests.USER_CACHE_FRESH_FOR + timedelta(days=1))
+        with mock.patch.object(errata_requests, "_fetch_users") as fetch_users, \
+                mock.patch.object(errata_requests, "_refresh_users_in_background") as refresh:
+            self.assertEqual(errata_requests._get_cached_users([1]), {1: {"id": 1}})
+        fetch_users.assert_not_called()
+        refresh.assert_called_once_with([1])
+
+    def test_expired_and_unknown_users_are_fetched(self):
+        self.store_user(1, errata_requests.USER_CACHE_EXPIRES_AFTER + timedelta(days=1))
+        fetched = {1: {"id": 1, "realname": "new"}, 2: {"id": 2}}
+        with mock.patch.object(errata_requests, "_fetch_users", return_value=fetched) as fetch_users:
+            self.assertEqual(errata_requests._get_cached_users(["1", 2]), fetched)
+        fetch_users.assert_called_once_with([1, 2])
+        self.assertEqual(ErrataUser.objects.get_users([1])[1].data, {"id": 1, "realname": "new"})
+
+
+class AdvisorySnapshotTestCase(TestCase):
+
+    def setUp(self):
+        errata_requests.JIRA_ISSUES_CACHE.clear()
+        errata_requests.USER_CACHE.clear()
+        errata_requests.USER_CACHE[7] = {"id": 7}
+
+    def store_snapshot(self, status, errata_updated_at):
+        data = {"advisory_details": [], "bugs_total": 3, "bug_summary": []}
+        AdvisorySnapshot.objects.store_snapshot(1234, status, errata_updated_at, data,
+                                                [(11, "VERIFIED"), (12, "ON_QA"), (13, "MODIFIED")])
+
+    def test_terminal_snapshot_is_served_without_errata(self):
+        self.store_snapshot("SHIPPED_LIVE", "2024-05-01T00:00:00Z")
+        with mock.patch.object(errata_requests, "_fetch_advisory") as fetch_advisory:
+            data = errata_requests._get_advisory_data(1234)
+        fetch_advisory.assert_not_called()
+        self.assertEqual((data["bugs_total"], [bug["id"] for bug in data["bugs"]]), (3, [11, 12, 13]))
+
+    def test_current_snapshot_is_served_without_waiting_for_jira_issues(self):
+        self.store_snapshot("QE", ADVISORY_DATA["errata"]["rhba"]["updated_at"])
+        released = threading.Event()
+        finished = []
+
+        def slow_jira_issues(advisory_id):
+            released.wait(timeout=5)
+            finished.append(advisory_id)
+            return JIRA_ISSUES_DATA
+
+        with mock.patch.object(errata_requests, "_fetch_advisory", return_value=ADVISORY_DATA), \
+                mock.patch.object(errata_requests, "_fetch_jira_issues", slow_jira_issues):
+            data = errata_requests._get_advisory_data(1234)
+            self.assertEqual(finished, [])
+            released.set()
+        self.assertEqual(data["bugs_total"], 3)
+
+    def test_outdated_snapshot_is_replaced_with_concurrent_fetches(self):
+        self.store_snapshot("QE", "2024-05-01T00:00:00Z")
+        barrier = threading.Barrier(2)
+        with mock.patch.object(errata_requests, "_fetch_advisory", meeting(barrier, ADVISORY_DATA)), \
+                mock.patch.object(errata_requests, "_fetch_jira_issues", meeting(barrier, JIRA_ISSUES_DATA)):
+            self.assertEqual(errata_requests._get_advisory_data(1234)["bugs_total"], 2)
+
+        snapshot = AdvisorySnapshot.objects.get_snapshot(1234)
+        self.assertEqual(snapshot.errata_updated_at, ADVISORY_DATA["errata"]["rhba"]["updated_at"])
+        self.assertEqual(snapshot.data["bugs_total"], 2)
+        self.assertNotIn("bugs", snapshot.data)
+        self.assertEqual(AdvisorySnapshotBug.objects.get_page(1234), [(1, "VERIFIED"), (2, "ON_QA")])
+
+
+class AdvisoryBugPagingTestCase(TestCase):
+
+    def setUp(self):
+        errata_requests.JIRA_ISSUES_CACHE.clear()
+        errata_requests.USER_CACHE.clear()
+        errata_requests.USER_CACHE[7] = {"id": 7}
+        self.client = APIClient()
+        bugs = [{"bug": {"id": bug_id, "bug_status": "ON_QA" if bug_id % 2 else "VERIFIED"}} for bug_id in range(1, 8)]
+        self.advisory_data = {**ADVISORY_DATA, "bugs": {"bugs": bugs}}
+
+    def get(self, query_string, updated_at=ADVISORY_DATA["errata"]["rhba"]["updated_at"]):
+        advisory_data = {**self.advisory_data, "errata": {"rhba": {**ADVISORY_DATA["errata"]["rhba"],
+                                                                   "updated_at": updated_at}}}
+        with mock.patch.object(errata_requests, "_fetch_advisory", return_value=advisory_data), \
+                mock.patch.object(errata_requests, "_fetch_jira_issues", return_value=JIRA_ISSUES_DATA):
+            return self.client.get(f"/errata/advisory/?type=advisory&id=1234&{query_string}").json()["data"]
+
+    def test_page_is_built_from_errata_and_read_from_snapshot(self):
+        for _ in range(2):
+            data = self.get("bugs_offset=2&bugs_limit=3")
+            self.assertEqual([bug["id"] for bug in data["bugs"]], [3, 4, 5])
+            # bugs_total counts the Bugzilla bugs, the JIRA issues are only in the summary
+            self.assertEqual(data["bugs_total"], 7)
+            self.assertIn({"bug_status": "Closed", "count": 2}, data["bug_summary"])
+
+        self.assertEqual([bug["id"] for bug in self.get("bugs_offset=5")["bugs"]], [6, 7])
+        self.assertEqual(self.get("bugs_offset=10")["bugs"], [])
+
+    def test_summary_only(self):
+        data = self.get("summary_only=true", updated_at="2024-05-23T10:00:00Z")
+        self.assertEqual((data["bugs"], data["bugs_total"]), ([], 7))
+        self.assertIn({"bug_status": "ON_QA", "count": 4}, data["bug_summary"])
+
+        # The snapshot still holds the whole bug list
+        data = self.get("bugs_limit=2", updated_at="2024-05-23T10:00:00Z")
+        self.assertEqual([bug["id"] for bug in data["bugs"]], [1, 2])
+
+    def test_invalid_paging(self):
+        self.assertEqual(self.client.get("/errata/advisory/?type=advisory&id=1234&bugs_limit=x").json()["status"],
+                         "error")
+
+
+class AdvisoriesViewTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        errata_requests.JIRA_ISSUES_CACHE.clear()
+        errata_requests.USER_CACHE.clear()
+        errata_requests.USER_CACHE[7] = {"id": 7}
+
+    def get(self, url):
+        # 5678 doesn't exist
+        with mock.patch.object(errata_requests, "_fetch_advisory",
+                               lambda advisory_id: ADVISORY_DATA if advisory_id == 1234 else None), \
+                mock.patch.object(errata_requests, "_fetch_jira_issues", return_value=JIRA_ISSUES_DATA):
+            response = self.client.get(url)
+            if response.streaming:
+                return response, [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+            return response, response.json()
+
+    def test_stream(self):
+        response, lines = self.get("/errata/advisories/?ids=1234,5678,1234&stream=true")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(sorted(line["id"] for line in lines), [1234, 5678])
+
+        advisories = {line["id"]: line["data"] for line in lines}
+        self.assertIsNone(advisories[5678])
+        self.assertEqual(advisories[1234]["bugs_total"], 2)
+        self.assertEqual(len(advisories[1234]["bugs"]), 2)
+
+    def test_stream_summary_only(self):
+        _, lines = self.get("/errata/advisories/?ids=1234&stream=true&summary_only=true")
+        self.assertEqual(lines[0]["data"]["bugs"], [])
+        self.assertIn({"bug_status": "Closed", "count": 2}, lines[0]["data"]["bug_summary"])
+
+    def test_batch(self):
+        _, response = self.get("/errata/advisories/?ids=1234,5678")
+        self.assertEqual(response["status"], "success")
+        self.assertEqual(set(response["data"]["advisories"]), {"1234", "5678"})
+        self.assertIsNone(response["data"]["advisories"]["5678"])
+
+    def test_invalid_ids(self):
+        for url in ("/errata/advisories/", "/errata/advisories/?ids=1234,abc&stream=true"):
+            _, response = self.get(url)
+            self.assertEqual(response["status"], "error", url)
@@ -1,5 +1,7 @@
+from django.http import StreamingHttpResponse
 from rest_framework import generics
-from errata.request_dispatchers.advisory import validate_advisory_get, route_advisory_get
+from errata.request_dispatchers.advisory import validate_advisory_get, route_advisory_get, validate_advisories_get, \
+    route_advisories_get, stream_advisories_get
 from rest_framework.response import Response
 
 
@@ -14,3 +16,18 @@ class Advisory(generics.ListAPIView):
             return Response(data=response)
         else:
             return Response(data=result)
+
+
+class Advisories(generics.ListAPIView):
+
+    def get(self, request, *args, **kwargs):
+
+        validation_status, result = validate_advisories_get(request)
+
+        if not validation_status:
+            return Response(data=result)
+
+        if result["stream"]:
+            return StreamingHttpResponse(stream_advisories_get(result), content_type="application/x-ndjson")
+
+        return Response(data=route_advisories_get(result))
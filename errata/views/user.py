@@ -1,9 +1,9 @@
 from rest_framework import generics
-from errata.request_dispatchers.user import validate_user_get, route_user_get
+from errata.request_dispatchers.user import validate_user_get, route_user_get, validate_user_post, route_user_post
 from rest_framework.response import Response
 
 
-class User(generics.ListAPIView):
+class User(generics.ListAPIView, generics.CreateAPIView):
 
     def get(self, request, *args, **kwargs):
 
@@ -14,3 +14,13 @@ class User(generics.ListAPIView):
             return Response(data=response)
         else:
             return Response(data=result)
+
+    def post(self, request, *args, **kwargs):
+
+        validation_status, result = validate_user_post(request)
+
+        if validation_status:
+            response = route_user_post(result)
+            return Response(data=response)
+        else:
+            return Response(data=result)
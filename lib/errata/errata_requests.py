@@ -1,39 +1,269 @@
 import os
 import requests
 import json
+import functools
+import threading
+import cachetools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from django.db import connection
+from django.utils import timezone
+from errata.models import ErrataUser, AdvisorySnapshot, AdvisorySnapshotBug
 from requests_kerberos import HTTPKerberosAuth, OPTIONAL
 from .decorators import update_keytab
 from urllib.parse import urlparse
 from requests_gssapi import HTTPSPNEGOAuth
 import ssl
 
+# Upper bound on concurrent SPNEGO requests issued against errata for a single call.
+ERRATA_MAX_WORKERS = 8
+
+# Advisories in these states can no longer change, so they are always served from their snapshot.
+ADVISORY_TERMINAL_STATES = ["SHIPPED_LIVE", "DROPPED_NO_SHIP"]
+
+# Errata users rarely change. Stored users are served as is while fresh, served and refreshed in the background
+# once stale, and only fetched synchronously once expired or never seen.
+USER_CACHE_FRESH_FOR = timedelta(days=7)
+USER_CACHE_EXPIRES_AFTER = timedelta(days=90)
+USER_CACHE = cachetools.TTLCache(maxsize=2000, ttl=6 * 3600)
+USER_CACHE_LOCK = threading.RLock()
+USERS_BEING_REFRESHED = set()
+
+# JIRA issues attached to an advisory, shared by every request within the next few minutes.
+JIRA_ISSUES_CACHE = cachetools.TTLCache(maxsize=500, ttl=600)
+JIRA_ISSUES_CACHE_LOCK = threading.RLock()
+
+
+def _errata_get(url):
+    return requests.get(urlparse(url).geturl(), verify=ssl.get_default_verify_paths().openssl_cafile, auth=HTTPSPNEGOAuth())
+
+
+def _fetch_advisory(advisory_id):
+    response = _errata_get(os.environ["ERRATA_ADVISORY_ENDPOINT"].format(advisory_id))
+    if response.status_code != 200:
+        return None
+    return json.loads(response.text)
+
+
+def _fetch_jira_issues(advisory_id):
+    with JIRA_ISSUES_CACHE_LOCK:
+        if advisory_id in JIRA_ISSUES_CACHE:
+            return JIRA_ISSUES_CACHE[advisory_id]
+
+    response = _errata_get(f"{os.environ['ERRATA_SERVER']}/advisory/{advisory_id}/jira_issues.json")
+    jira_issues_data = json.loads(response.text)
+
+    with JIRA_ISSUES_CACHE_LOCK:
+        JIRA_ISSUES_CACHE[advisory_id] = jira_issues_data
+    return jira_issues_data
+
+
+def _fetch_user(user_id):
+    try:
+        response = _errata_get(os.environ["ERRATA_USER_ENDPOINT"].format(user_id))
+        return format_user_data(json.loads(response.text))
+    except Exception as e:
+        print(e)
+        return None
+
+
+def _get_advisory_revision(advisory_data):
+    """
+    Returns the status and updated_at timestamp errata reports for an advisory.
+    """
+
+    for errata_data in advisory_data.get("errata", {}).values():
+        return errata_data.get("status"), errata_data.get("updated_at")
+    return None, None
+
+
+def _get_snapshot_data(snapshot, summary_only, bugs_offset, bugs_limit):
+    bugs = [] if summary_only else AdvisorySnapshotBug.objects.get_page(snapshot.advisory_id, bugs_offset, bugs_limit)
+    return {**snapshot.data, "bugs": [format_bug_data(bug_id, bug_status) for bug_id, bug_status in bugs]}
+
+
+def _get_advisory_data(advisory_id, summary_only=False, bugs_offset=0, bugs_limit=None):
+    """
+    Serves the advisory from its snapshot when it can no longer change, or when errata reports the same revision the
+    snapshot was built from. Otherwise fetches the advisory and its JIRA issues concurrently, then the reviewers.
+    The JIRA issues are asked for upfront even when a snapshot exists, so an outdated snapshot costs no extra round
+    trip. When the snapshot turns out to be current they are not waited for, and only end up in JIRA_ISSUES_CACHE.
+    Only the requested page of the bug list is built, snapshots store the whole list in rows of their own so a page
+    is read without the rest.
+    Expects a valid kerberos ticket to be present already.
+    """
+
+    try:
+        snapshot = AdvisorySnapshot.objects.get_snapshot(advisory_id)
+        if snapshot is not None and snapshot.status in ADVISORY_TERMINAL_STATES:
+            return _get_snapshot_data(snapshot, summary_only, bugs_offset, bugs_limit)
+
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            advisory_future = executor.submit(_fetch_advisory, advisory_id)
+            jira_future = executor.submit(_fetch_jira_issues, advisory_id)
+
+            advisory_data = advisory_future.result()
+            if advisory_data is None:
+                return None
+
+            status, errata_updated_at = _get_advisory_revision(advisory_data)
+            if snapshot is not None and errata_updated_at is not None and snapshot.errata_updated_at == errata_updated_at:
+                return _get_snapshot_data(snapshot, summary_only, bugs_offset, bugs_limit)
+
+            jira_issues_data = jira_future.result()
+        finally:
+            executor.shutdown(wait=False)
+
+        users_data = _get_cached_users(get_reviewer_ids(advisory_data))
+        data = format_advisory_data(advisory_data, jira_issues_data, users_data, summary_only, bugs_offset, bugs_limit)
+        AdvisorySnapshot.objects.store_snapshot(advisory_id, status, errata_updated_at,
+                                                {key: value for key, value in data.items() if key != "bugs"},
+                                                get_advisory_bugs(advisory_data))
+        return data
+
+    except Exception:
+        return None
+
+
+def _get_advisory_data_in_worker(advisory_id, summary_only=False):
+    # Worker threads get their own database connection for the caches, close it before the thread is reused.
+    try:
+        return _get_advisory_data(advisory_id, summary_only)
+    finally:
+        connection.close()
+
+
+def _fetch_users(user_ids):
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(len(user_ids), ERRATA_MAX_WORKERS)) as executor:
+        return dict(zip(user_ids, executor.map(_fetch_user, user_ids)))
+
+
+def _store_users(users_data):
+    users_data = {user_id: user_data for user_id, user_data in users_data.items() if user_data is not None}
+    ErrataUser.objects.store_users(users_data, timezone.now())
+    with USER_CACHE_LOCK:
+        USER_CACHE.update(users_data)
+
+
+def _refresh_users(user_ids):
+    try:
+        _store_users(_fetch_users(user_ids))
+    except Exception as e:
+        print(e)
+    finally:
+        with USER_CACHE_LOCK:
+            USERS_BEING_REFRESHED.difference_update(user_ids)
+        connection.close()
+
+
+def _refresh_users_in_background(user_ids):
+    with USER_CACHE_LOCK:
+        user_ids = [user_id for user_id in user_ids if user_id not in USERS_BEING_REFRESHED]
+        USERS_BEING_REFRESHED.update(user_ids)
+
+    if user_ids:
+        threading.Thread(target=_refresh_users, args=(user_ids,), daemon=True).start()
+
+
+def _get_cached_users(user_ids):
+    """
+    Resolves users from the in-process cache first, then the user table, and only then from errata.
+    :param user_ids: The errata user ids to resolve.
+    :return: Dict, user id to user data.
+    """
+
+    user_ids = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+    users_data = {}
+
+    with USER_CACHE_LOCK:
+        for user_id in user_ids:
+            if user_id in USER_CACHE:
+                users_data[user_id] = USER_CACHE[user_id]
+
+    missing_user_ids = [user_id for user_id in user_ids if user_id not in users_data]
+    if not missing_user_ids:
+        return users_data
+
+    now = timezone.now()
+    stale_user_ids = []
+    for user_id, user in ErrataUser.objects.get_users(missing_user_ids).items():
+        age = now - user.fetched_at
+        if age > USER_CACHE_EXPIRES_AFTER:
+            continue
+
+        users_data[user_id] = user.data
+        if age > USER_CACHE_FRESH_FOR:
+            stale_user_ids.append(user_id)
+        else:
+            with USER_CACHE_LOCK:
+                USER_CACHE[user_id] = user.data
+
+    if stale_user_ids:
+        _refresh_users_in_background(stale_user_ids)
+
+    unknown_user_ids = [user_id for user_id in missing_user_ids if user_id not in users_data]
+    if unknown_user_ids:
+        fetched_users_data = _fetch_users(unknown_user_ids)
+        _store_users(fetched_users_data)
+        users_data.update(fetched_users_data)
+
+    return users_data
+
 
 @update_keytab
-def get_advisory_data(advisory_id):
+def get_advisory_data(advisory_id, summary_only=False, bugs_offset=0, bugs_limit=None):
     """
     This method returns advisory data for a given id.
     :param advisory_id: The id of the advisory to get data for.
+    :param summary_only: Leave out the bug list, only the bug summary is returned.
+    :param bugs_offset: Index of the first bug of the bug list to return.
+    :param bugs_limit: Maximum number of bugs to return, all remaining bugs if None.
     :return: Dict, advisory data.
     """
 
-    try:
-        errata_endpoint = os.environ["ERRATA_ADVISORY_ENDPOINT"]
-        jira_issues_endpoint = f"{os.environ['ERRATA_SERVER']}/advisory/{advisory_id}/jira_issues.json"
-        response = requests.get(urlparse(errata_endpoint.format(advisory_id)).geturl(), verify=ssl.get_default_verify_paths().openssl_cafile, auth=HTTPSPNEGOAuth())
-        if response.status_code != 200:
-            return None
-        advisory_data = json.loads(response.text)
-        jira_response = requests.get(
-            urlparse(jira_issues_endpoint).geturl(),
-            verify=ssl.get_default_verify_paths().openssl_cafile,
-            auth=HTTPSPNEGOAuth()
-        )
-        jira_issues_data = json.loads(jira_response.text)
-
-        return format_advisory_data(advisory_data, jira_issues_data)
+    return _get_advisory_data(advisory_id, summary_only, bugs_offset, bugs_limit)
 
-    except Exception:
-        return None
+
+@update_keytab
+def get_advisories_data(advisory_ids, summary_only=False):
+    """
+    This method returns advisory data for several advisories, fetched concurrently.
+    :param advisory_ids: The ids of the advisories to get data for.
+    :param summary_only: Leave out the bug lists, only the bug summaries are returned.
+    :return: Dict, advisory id to advisory data.
+    """
+
+    advisory_ids = list(dict.fromkeys(advisory_ids))
+    if not advisory_ids:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(len(advisory_ids), ERRATA_MAX_WORKERS)) as executor:
+        return dict(zip(advisory_ids, executor.map(functools.partial(_get_advisory_data_in_worker, summary_only=summary_only),
+                                                   advisory_ids)))
+
+
+@update_keytab
+def iter_advisories_data(advisory_ids, summary_only=False):
+    """
+    This method fetches several advisories concurrently and yields each one as soon as it is ready.
+    :param advisory_ids: The ids of the advisories to get data for.
+    :param summary_only: Leave out the bug lists, only the bug summaries are returned.
+    :return: Generator of (advisory id, advisory data) tuples, in completion order.
+    """
+
+    advisory_ids = list(dict.fromkeys(advisory_ids))
+    if not advisory_ids:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(len(advisory_ids), ERRATA_MAX_WORKERS)) as executor:
+        futures = {executor.submit(_get_advisory_data_in_worker, advisory_id, summary_only): advisory_id for advisory_id in advisory_ids}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
 
 
 @update_keytab
@@ -45,26 +275,94 @@ def get_user_data(user_id):
         """
 
     try:
-        errata_endpoint = os.environ["ERRATA_USER_ENDPOINT"]
-
-        response = requests.get(urlparse(errata_endpoint.format(user_id)).geturl(), verify=ssl.get_default_verify_paths().openssl_cafile, auth=HTTPSPNEGOAuth())
-        return format_user_data(json.loads(response.text))
+        return _get_cached_users([user_id]).get(int(user_id))
     except Exception as e:
         print(e)
         return None
 
 
+@update_keytab
+def get_users_data(user_ids):
+    """
+    This method returns user data for several users, fetched concurrently.
+    :param user_ids: The ids of the users to get data for.
+    :return: Dict, user id to user data.
+    """
+
+    return _get_cached_users(user_ids)
+
+
+@update_keytab
+def preload_users(advisory_ids):
+    """
+    This method warms the user cache with the reviewers of the given advisories, fetched in bulk.
+    :param advisory_ids: The ids of the advisories whose reviewers should be cached.
+    :return: Int, number of users fetched from errata.
+    """
+
+    advisory_ids = list(dict.fromkeys(advisory_ids))
+    if not advisory_ids:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=min(len(advisory_ids), ERRATA_MAX_WORKERS)) as executor:
+        advisories_data = list(executor.map(_fetch_advisory, advisory_ids))
+
+    user_ids = set()
+    for advisory_data in advisories_data:
+        if advisory_data is not None:
+            user_ids.update(get_reviewer_ids(advisory_data))
+
+    fresh_after = timezone.now() - USER_CACHE_FRESH_FOR
+    known_user_ids = {user_id for user_id, user in ErrataUser.objects.get_users(user_ids).items() if user.fetched_at > fresh_after}
+    fetched_users_data = _fetch_users(user_ids - known_user_ids)
+    _store_users(fetched_users_data)
+    return len(fetched_users_data)
+
+
+@update_keytab
+def refresh_user_cache():
+    """
+    This method refetches every stored user that is no longer fresh.
+    :return: Int, number of users refreshed.
+    """
+
+    user_ids = ErrataUser.objects.get_user_ids_fetched_before(timezone.now() - USER_CACHE_FRESH_FOR)
+    _store_users(_fetch_users(user_ids))
+    return len(user_ids)
+
+
 def format_user_data(user_data):
     return user_data
 
 
-def format_advisory_data(advisory_data, jira_issues_data):
+def get_reviewer_ids(advisory_data):
+    """
+    This method picks the reviewer user ids out of the advisory data received from errata.
+    :param advisory_data: The advisory data received from errata.
+    :return: List of user ids.
+    """
+
+    content = advisory_data.get("content", {}).get("content", {})
+    reviewer_ids = [content.get("doc_reviewer_id"), content.get("product_security_reviewer_id")]
+    return [reviewer_id for reviewer_id in reviewer_ids if reviewer_id is not None]
+
+
+def format_advisory_data(advisory_data, jira_issues_data, users_data=None, summary_only=False, bugs_offset=0,
+                         bugs_limit=None):
     """
     This method filters the data for an advisory from errata to pick required content.
     :param advisory_data: The advisory data received from errata.
+    :param jira_issues_data: The JIRA issues attached to the advisory.
+    :param users_data: Dict of reviewer user id to user data, fetched if not given.
+    :param summary_only: Skip building the per bug details, only the bug summary is computed.
+    :param bugs_offset: Index of the first bug to build the details of.
+    :param bugs_limit: Maximum number of bugs to build the details of, all remaining bugs if None.
     :return: Dictionary of filtered response.
     """
 
+    if users_data is None:
+        users_data = _get_cached_users(get_reviewer_ids(advisory_data))
+
     advisory_details = []
     final_response = {}
 
@@ -151,21 +449,21 @@ def format_advisory_data(advisory_data, jira_issues_data):
                 advisory_detail["qe_reviewer_id"] = qe_reviewer_id
 
                 if qe_reviewer_id is not None:
-                    advisory_detail["qe_reviewer_details"] = get_user_data(qe_reviewer_id)
+                    advisory_detail["qe_reviewer_details"] = users_data.get(qe_reviewer_id)
                 else:
                     advisory_detail["qe_reviewer_details"] = None
 
                 advisory_detail["doc_reviewer_id"] = doc_reviewer_id
 
                 if doc_reviewer_id is not None:
-                    advisory_detail["doc_reviewer_details"] = get_user_data(doc_reviewer_id)
+                    advisory_detail["doc_reviewer_details"] = users_data.get(doc_reviewer_id)
                 else:
                     advisory_detail["doc_reviewer_details"] = None
 
                 advisory_detail["product_security_reviewer_id"] = product_security_reviewer_id
 
                 if product_security_reviewer_id is not None:
-                    advisory_detail["product_security_reviewer_details"] = get_user_data(product_security_reviewer_id)
+                    advisory_detail["product_security_reviewer_details"] = users_data.get(product_security_reviewer_id)
                 else:
                     advisory_detail["product_security_reviewer_details"] = None
 
@@ -173,79 +471,52 @@ def format_advisory_data(advisory_data, jira_issues_data):
 
     final_response["advisory_details"] = advisory_details
 
-    total_bugs = 0
-    jira_bugs_details = []
-    total_jira_bugs = 0
     jira_bug_summary = dict()
     bugzilla_bugs_details = []
-    total_bugzilla_bugs = 0
     bugzilla_bug_summary = dict()
 
-    if jira_issues_data:
-        for jira_issue in jira_issues_data:
-            jira_bug_detail = {
-                "id_jira": jira_issue.get("id_jira"),
-                "key": jira_issue.get("key"),
-                "summary": jira_issue.get("summary"),
-                "status": jira_issue.get("status"),
-                "is_private": jira_issue.get("is_private"),
-                "labels": jira_issue.get("labels"),
-            }
-            jira_bugs_details.append(jira_bug_detail)
-            total_jira_bugs += 1
-
-            if jira_bug_detail["status"] not in jira_bug_summary:
-                jira_bug_summary[jira_bug_detail["status"]] = 0
-            jira_bug_summary[jira_bug_detail["status"]] += 1
-
-    if "bugs" in advisory_data:
-        bugzilla_data = advisory_data["bugs"]
-
-        if "bugs" in advisory_data:
-            bugzilla_data = advisory_data["bugs"]
-
-            bug_data = bugzilla_data["bugs"]
-
-            for each_bug in bug_data:
-                each_bug = each_bug["bug"]
-                bug = dict()
-                bug["id"] = each_bug["id"]
-                bug["bug_status"] = each_bug["bug_status"]
-                bug["bug_link"] = "https://bugzilla.redhat.com/show_bug.cgi?id=" + str(each_bug["id"])
-                bugzilla_bugs_details.append(bug)
-
-                if bug["bug_status"] not in bugzilla_bug_summary:
-                    bugzilla_bug_summary[bug["bug_status"]] = 0
-
-                bugzilla_bug_summary[bug["bug_status"]] += 1
-                total_bugzilla_bugs += 1
+    # Only the counts per status are needed for the JIRA issues, so they are tallied without copying the issues
+    for jira_issue in jira_issues_data or []:
+        status = jira_issue.get("status")
+        jira_bug_summary[status] = jira_bug_summary.get(status, 0) + 1
+
+    # Every bug is counted, only the requested page gets its details built
+    bugs_end = None if bugs_limit is None else bugs_offset + bugs_limit
+    for index, (bug_id, bug_status) in enumerate(get_advisory_bugs(advisory_data)):
+        bugzilla_bug_summary[bug_status] = bugzilla_bug_summary.get(bug_status, 0) + 1
+
+        if not summary_only and index >= bugs_offset and (bugs_end is None or index < bugs_end):
+            bugzilla_bugs_details.append(format_bug_data(bug_id, bug_status))
 
     final_response["bugs"] = bugzilla_bugs_details
-    bug_summary_array = []
-    for key in jira_bug_summary:
-        if total_jira_bugs == 0:
-            bug_summary_array.append({
-                "bug_status": key,
-                "count": jira_bug_summary[key],
-            })
-        else:
-            bug_summary_array.append({
-                "bug_status": key,
-                "count": jira_bug_summary[key],
-            })
+    final_response["bugs_total"] = sum(bugzilla_bug_summary.values())
 
-    for key in bugzilla_bug_summary:
-        if total_bugs == 0:
-            bug_summary_array.append({
-                "bug_status": key,
-                "count": bugzilla_bug_summary[key],
-            })
-        else:
+    bug_summary_array = []
+    for bug_summary in (jira_bug_summary, bugzilla_bug_summary):
+        for key in bug_summary:
             bug_summary_array.append({
                 "bug_status": key,
-                "count": bugzilla_bug_summary[key],
+                "count": bug_summary[key],
             })
 
     final_response["bug_summary"] = bug_summary_array
 
     return final_response
+
+
+def get_advisory_bugs(advisory_data):
+    """
+    This method lists the Bugzilla bugs of an advisory received from errata.
+    :return: List of (bug id, bug status) tuples.
+    """
+
+    return [(each_bug["bug"]["id"], each_bug["bug"]["bug_status"])
+            for each_bug in advisory_data.get("bugs", {}).get("bugs", [])]
+
+
+def format_bug_data(bug_id, bug_status):
+    return {
+        "id": bug_id,
+        "bug_status": bug_status,
+        "bug_link": "https://bugzilla.redhat.com/show_bug.cgi?id=" + str(bug_id),
+    }
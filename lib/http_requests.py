@@ -214,3 +214,27 @@ def get_branch_advisory_ids(branch_name):
             return {"current": {}, "previous": {}}  # Return empty data structure
 
     return advisory_data
+
+
+def flatten_branch_advisory_ids(branch_advisory_ids):
+    """
+    Flattens the result of get_branch_advisory_ids into a single list of advisory ids.
+    :param branch_advisory_ids: The advisories of each release of a branch, as returned by get_branch_advisory_ids.
+    :return: List of unique advisory ids, in the order the releases are listed.
+    """
+    advisory_ids = []
+    for release_advisories in branch_advisory_ids.values():
+        if isinstance(release_advisories, list):
+            release_advisories = release_advisories[0]
+        advisory_ids.extend(advisory_id for advisory_id in release_advisories.values()
+                            if isinstance(advisory_id, int) and advisory_id > 1)
+    return list(dict.fromkeys(advisory_ids))
+
+
+def get_branch_advisory_id_list(branch_name):
+    """
+    Lists the advisories of every release of a branch.
+    :param branch_name: OpenShift branch name in ocp-build-data. eg: openshift-4.10
+    :return: List of unique advisory ids.
+    """
+    return flatten_branch_advisory_ids(get_branch_advisory_ids(branch_name))
@@ -3,4 +3,5 @@
 export RUN_ENV=development
 python3 manage.py makemigrations
 python3 manage.py migrate
-python3 manage.py runserver 0.0.0.0:8080 --noreload
+# Served over ASGI, which /build/live/ needs. A worker runs sync views one at a time, so several are started
+python3 -m uvicorn build_interface.asgi:application --host 0.0.0.0 --port 8080 --workers 4 --lifespan off